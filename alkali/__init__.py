@@ -13,4 +13,4 @@ from .query import Query
 from .utils import tznow, tzadd, fromts
 from . import fields
 from .storage import Storage, JSONStorage, FileStorage, CSVStorage, \
-    MultiStorage, FileAlreadyLocked
+    MultiStorage, JSONLinesStorage, BinaryStorage, MappedStorage, FileAlreadyLocked
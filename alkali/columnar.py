@@ -0,0 +1,570 @@
+"""
+::
+
+    from alkali import Model, fields
+    from alkali.query import Sum, Avg
+
+    class Reading( Model ):
+        class Meta:
+            columnar = True
+
+        id    = fields.IntField(primary_key=True)
+        value = fields.FloatField()
+        valid = fields.BoolField()
+        ts    = fields.DateTimeField()
+
+    # Reading.objects keeps a numpy array per Int/Float/Bool/DateTime field
+    # so these are answered with boolean masks and numpy reductions
+    # instead of looking at every instance
+    Reading.objects.filter(value__gt=10.5, valid=True).count
+    Reading.objects.filter(ts__ge=start).aggregate( Sum('value'), Avg('value') )
+    Reading.objects.filter(value__lt=0).values_list('id', 'value')
+
+numpy is optional, without it ``Meta.columnar`` is ignored with a warning
+and queries use the normal per instance code.
+"""
+
+import datetime as dt
+import operator
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError: # pragma: nocover
+    numpy = None
+
+from . import fields
+from .utils import EPOCH, MICROSECOND
+from .query import Count, Sum, Max, Min, Avg, Variance, StdDev, \
+    CountDistinct, Percentile, Median
+
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+_kinds = [
+    # order matters, check subclasses first
+    (fields.BoolField, 'bool'),
+    (fields.IntField, 'int'),
+    (fields.FloatField, 'float'),
+    (fields.DateTimeField, 'datetime'),
+]
+
+_dtypes = {
+    'bool': 'bool',
+    'int': 'int64',
+    'float': 'float64',
+    'datetime': 'int64', # microseconds since the epoch
+}
+
+_comparisons = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+}
+
+
+def available():
+    """
+    is numpy installed
+
+    :rtype: ``bool``
+    """
+    return numpy is not None
+
+def column_kind(field):
+    """
+    return the kind of column for given field or ``None`` if the field
+    can't be held in a column
+
+    :param Field field:
+    :rtype: ``str``
+    """
+    if isinstance(field, fields.ForeignKey):
+        return None
+
+    for field_class, kind in _kinds:
+        if isinstance(field, field_class):
+            return kind
+
+    return None
+
+def to_epoch(value):
+    """
+    return an aware datetime as integer microseconds since the epoch
+    """
+    return (value - EPOCH) // MICROSECOND
+
+
+class _Unsupported(Exception):
+    """
+    raised internally when part of a query can't be vectorized
+    """
+    pass
+
+
+class ColumnStore:
+    """
+    the Int/Float/Bool/DateTime field values of a manager's instances as
+    numpy arrays, one per field, with rows aligned to a primary key array.
+    ``None`` values are tracked in a separate mask per field.
+
+    the store is owned and kept current by :class:`alkali.manager.Manager`
+    when ``Meta.columnar = True``, there should be no need to create one
+    directly.
+
+    after :func:`clear` the store is *stale* and only built, in one go, when
+    it's next needed, so loading many instances doesn't add them one row
+    at a time. deleting a row moves the last row into its place.
+    """
+
+    def __init__(self, model_class):
+        """
+        :param Model model_class: the model whose instances we hold
+        """
+        assert available(), "numpy is required for a columnar store"
+
+        self.model_class = model_class
+        self.clear()
+
+    def __repr__(self):
+        return "<{}: {}>".format(self.__class__.__name__, self.model_class.__name__)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def stale(self):
+        """
+        **property**: True if we need to be rebuilt before use
+        """
+        return self._stale
+
+    def clear(self):
+        self.kinds = {}     # field name: column kind
+
+        for name, field in self.model_class.Meta.fields.items():
+            kind = column_kind(field)
+
+            if kind is not None:
+                self.kinds[name] = kind
+
+        self._stale = True
+        self._size = 0
+        self._rows = {}     # pk: row
+        self._pks = numpy.empty(0, dtype=object)
+        self._data = {}     # field name: array of values
+        self._nulls = {}    # field name: array of is None
+
+    def build(self, instances):
+        """
+        (re)build all columns from given instances
+
+        :param instances: all the instances held by our manager
+        """
+        instances = list(instances)
+        size = len(instances)
+
+        self._pks = numpy.empty(size, dtype=object)
+        self._pks[:] = [instance.pk for instance in instances]
+        self._rows = { pk: row for row, pk in enumerate(self._pks) }
+        self._size = size
+        self._data = {}
+        self._nulls = {}
+
+        for name, kind in list(self.kinds.items()):
+            values = [instance.__dict__[name] for instance in instances]
+            nulls = numpy.fromiter((value is None for value in values), dtype=bool, count=size)
+
+            try:
+                data = numpy.array(
+                    [0 if value is None else self._encode(kind, value) for value in values],
+                    dtype=_dtypes[kind])
+            except (OverflowError, TypeError, ValueError):
+                self._drop(name)
+                continue
+
+            self._data[name] = data
+            self._nulls[name] = nulls
+
+        self._stale = False
+
+    def _drop(self, name):
+        """
+        stop holding a field whose values don't fit in a column
+        """
+        logger.warning( "%s: %s values don't fit in a column, not vectorizing it",
+                self.model_class.__name__, name )
+
+        del self.kinds[name]
+        self._data.pop(name, None)
+        self._nulls.pop(name, None)
+
+    @staticmethod
+    def _encode(kind, value):
+        if kind == 'datetime':
+            return to_epoch(value)
+
+        return value
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._pks))
+
+        def grown(array):
+            ret = numpy.empty(capacity, dtype=array.dtype)
+            ret[:self._size] = array[:self._size]
+            return ret
+
+        self._pks = grown(self._pks)
+
+        for name in self._data:
+            self._data[name] = grown(self._data[name])
+            self._nulls[name] = grown(self._nulls[name])
+
+    def add(self, instance):
+        """
+        :param Model instance: an instance held by our manager
+        """
+        if self._stale:
+            return
+
+        pk = instance.pk
+        row = self._rows.get(pk)
+
+        if row is None:
+            if self._size == len(self._pks):
+                self._grow()
+
+            row = self._rows[pk] = self._size
+            self._pks[row] = pk
+            self._size += 1
+
+        for name in list(self._data):
+            value = instance.__dict__[name]
+
+            try:
+                self._data[name][row] = 0 if value is None else self._encode(self.kinds[name], value)
+            except (OverflowError, TypeError, ValueError):
+                self._drop(name)
+                continue
+
+            self._nulls[name][row] = value is None
+
+    def remove(self, instance):
+        """
+        :param Model instance: an instance held by our manager
+        """
+        if self._stale:
+            return
+
+        row = self._rows.pop(instance.pk, None)
+
+        if row is None:
+            return
+
+        last = self._size - 1
+
+        if row != last:
+            for array in [self._pks] + list(self._data.values()) + list(self._nulls.values()):
+                array[row] = array[last]
+
+            self._rows[self._pks[row]] = row
+
+        self._pks[last] = None
+        self._size = last
+
+    def _column(self, name):
+        """
+        return the live part of the values and nulls of given field
+
+        :raises _Unsupported: if we don't hold the field
+        """
+        if name == 'pk':
+            pk_fields = self.model_class.Meta.pk_fields.keys()
+
+            if len(pk_fields) != 1:
+                raise _Unsupported(name)
+
+            name = pk_fields[0]
+
+        if name not in self._data:
+            raise _Unsupported(name)
+
+        return self.kinds[name], self._data[name][:self._size], self._nulls[name][:self._size]
+
+    @staticmethod
+    def _operand(kind, value):
+        """
+        return a query value as something comparable to a column
+
+        :raises _Unsupported: if the value isn't comparable the same way
+            a field value would be
+        """
+        if kind == 'datetime':
+            if not isinstance(value, dt.datetime) or value.utcoffset() is None:
+                raise _Unsupported(value)
+
+            return to_epoch(value)
+
+        if type(value) not in (bool, int, float):
+            raise _Unsupported(value)
+
+        if type(value) is int and not INT64_MIN <= value <= INT64_MAX:
+            raise _Unsupported(value)
+
+        return value
+
+    def _leaf_mask(self, field, oper, value):
+        kind, data, nulls = self._column(field)
+
+        if oper in ('eq', 'ne'):
+            if value is None:
+                mask = nulls.copy()
+            else:
+                mask = _comparisons['eq'](data, self._operand(kind, value)) & ~nulls
+
+            return ~mask if oper == 'ne' else mask
+
+        if oper in _comparisons:
+            # ordering against None raises, leave that to the instances
+            if value is None or nulls.any():
+                raise _Unsupported(oper)
+
+            return _comparisons[oper](data, self._operand(kind, value))
+
+        if oper == 'in':
+            # 'in' on a string is a substring test
+            if isinstance(value, str):
+                raise _Unsupported(oper)
+
+            values = list(value)
+            wanted = [self._operand(kind, v) for v in values if v is not None]
+            mask = numpy.isin(data, wanted) & ~nulls
+
+            if any(v is None for v in values):
+                mask |= nulls
+
+            return mask
+
+        raise _Unsupported(oper)
+
+    def _mask(self, q):
+        """
+        return ``(mask, exact)`` for a :class:`alkali.query.Q`, if not
+        ``exact`` the mask holds every row that may match
+
+        :raises _Unsupported: if no mask can be made
+        """
+        masks = []
+        exact = True
+
+        for child in q.children:
+            try:
+                if isinstance(child, tuple):
+                    mask, child_exact = self._leaf_mask(*child), True
+                else:
+                    mask, child_exact = self._mask(child)
+            except _Unsupported:
+                # an 'and' can skip a child and let the instances decide
+                if q.connector != 'and':
+                    raise
+
+                exact = False
+                continue
+
+            masks.append(mask)
+            exact = exact and child_exact
+
+        if q.connector == 'and':
+            mask = numpy.ones(self._size, dtype=bool)
+
+            for m in masks:
+                mask &= m
+        else:
+            if not exact:
+                raise _Unsupported(q)
+
+            mask = numpy.zeros(self._size, dtype=bool)
+
+            for m in masks:
+                mask |= m
+
+        if q.negated:
+            if not exact:
+                raise _Unsupported(q)
+
+            mask = ~mask
+
+        return mask, exact
+
+    def _query_mask(self, q):
+        if q is None:
+            return numpy.ones(self._size, dtype=bool), True
+
+        return self._mask(q)
+
+    def select(self, q):
+        """
+        return the primary keys that may satisfy ``q``
+
+        :param Q q: the query expression
+        :rtype: ``(list of pks, exact)``, if ``exact`` all the pks satisfy ``q``,
+            or ``None`` if no part of ``q`` can be vectorized
+        """
+        try:
+            mask, exact = self._query_mask(q)
+        except _Unsupported:
+            return None
+
+        # a mask that let everything through didn't help
+        if not exact and mask.all():
+            return None
+
+        return self._pks[:self._size][mask].tolist(), exact
+
+    def aggregate(self, q, aggregates):
+        """
+        compute ``aggregates`` over the rows that satisfy ``q`` with numpy
+        reductions
+
+        float sums may differ from a sequential sum in the last bits
+
+        :param Q q: the query expression or ``None`` for all rows
+        :param aggregates: list of :class:`alkali.query.Aggregate`
+        :rtype: ``list`` of results or ``None`` if that can't be done
+            without looking at the instances
+        """
+        try:
+            mask, exact = self._query_mask(q)
+
+            if not exact:
+                return None
+
+            return [self._reduce(agg, mask) for agg in aggregates]
+        except _Unsupported:
+            return None
+
+    def _reduce(self, agg, mask):
+        # exact types, a subclass may compute something else
+        if type(agg) is Count:
+            return int(numpy.count_nonzero(mask))
+
+        if type(agg) not in _reducers:
+            raise _Unsupported(agg)
+
+        kind, data, nulls = self._column(agg.field)
+
+        # numpy would give epochs, not the datetimes the instances hold,
+        # and None values need to raise like they do for the instances
+        if kind == 'datetime' or nulls[mask].any():
+            raise _Unsupported(agg)
+
+        return _reducers[type(agg)](agg, data[mask])
+
+    def values(self, q, names):
+        """
+        return the values of fields ``names`` for the rows that satisfy
+        ``q``, in primary key order
+
+        :param Q q: the query expression or ``None`` for all rows
+        :param names: field names
+        :rtype: ``list`` of ``list``, one per field, or ``None`` if that
+            can't be done without looking at the instances
+        """
+        try:
+            mask, exact = self._query_mask(q)
+
+            if not exact:
+                return None
+
+            _, pks, _ = self._column('pk')
+            columns = [self._column(name) for name in names]
+        except _Unsupported:
+            return None
+
+        for kind, _, nulls in columns:
+            if kind == 'datetime' or nulls[mask].any():
+                return None
+
+        rows = numpy.flatnonzero(mask)
+        rows = rows[numpy.argsort(pks[rows], kind='stable')]
+
+        return [data[rows].tolist() for _, data, _ in columns]
+
+
+def _max(agg, values):
+    if not len(values):
+        raise ValueError("max() arg is an empty sequence")
+    return values.max().item()
+
+def _min(agg, values):
+    if not len(values):
+        raise ValueError("min() arg is an empty sequence")
+    return values.min().item()
+
+def _sum(agg, values):
+    if not len(values):
+        return 0
+
+    # int64 sums wrap around silently, add them up as python ints
+    # when they might
+    if values.dtype.kind == 'i':
+        bound = max(abs(values.max().item()), abs(values.min().item()))
+
+        if bound * len(values) > numpy.iinfo(values.dtype).max:
+            return sum(values.tolist())
+
+    return values.sum().item()
+
+def _avg(agg, values):
+    if not len(values):
+        return None
+    return values.mean().item()
+
+def _variance(agg, values):
+    ddof = 1 if agg.sample else 0
+    if len(values) - ddof <= 0:
+        return None
+    return values.var(ddof=ddof).item()
+
+def _stddev(agg, values):
+    ddof = 1 if agg.sample else 0
+    if len(values) - ddof <= 0:
+        return None
+    return values.std(ddof=ddof).item()
+
+def _count_distinct(agg, values):
+    return len(numpy.unique(values))
+
+def _percentile(agg, values):
+    if not len(values):
+        return None
+
+    # same interpolation as Percentile.Accumulator so results are identical
+    values = numpy.sort(values).tolist()
+
+    pos = (len(values) - 1) * agg.percent
+    lo = int(pos)
+    hi = lo + 1 if pos > lo else lo
+
+    if lo == hi:
+        return values[lo]
+
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+_reducers = {
+    Sum: _sum,
+    Max: _max,
+    Min: _min,
+    Avg: _avg,
+    Variance: _variance,
+    StdDev: _stddev,
+    CountDistinct: _count_distinct,
+    Percentile: _percentile,
+    Median: _percentile,
+}
@@ -23,11 +23,14 @@
 """
 
 from collections import OrderedDict
+from concurrent import futures
 import types
 import inspect
 import os
 
 from .storage import Storage, JSONStorage
+from .wal import WriteAheadLog
+from . import fields
 
 import logging
 logger = logging.getLogger(__name__)
@@ -56,10 +59,15 @@ class Database:
             * root_dir: default save path directory
             * save_on_exit: save all models to disk on exit
             * storage: default storage class for all models
+            * wal: keep a :class:`alkali.wal.WriteAheadLog` of every save and
+              delete, ``True`` for *<root_dir>/alkali.wal* or a filename
         """
 
         logger.debug( "Database: creating database" )
 
+        self._storing = None       # Future of the running background store
+        self._store_thread = None  # runs background stores, one at a time
+
         self._models  = OrderedDict()
         self._storage = OrderedDict()
 
@@ -70,6 +78,8 @@ class Database:
         self._root_dir = os.path.expanduser(self._root_dir)
         self._root_dir = os.path.abspath(self._root_dir)
 
+        wal = kw.pop('wal', False)
+
         assert len(kw) == 0, "unknown kwargs: {}".format(kw.keys())
 
         for model in models:
@@ -78,9 +88,25 @@ class Database:
             self._models[model.__name__.lower()] = model
             self.set_storage(model)
 
+        self._wal = None
+
+        if wal:
+            filename = 'alkali.wal' if wal is True else wal
+            filename = os.path.join( self._root_dir, os.path.expanduser(filename) )
+            self._wal = WriteAheadLog(filename, self.models)
+
     def __del__(self):
         if self._save_on_exit:
             self.store()
+        else:
+            self._wait_store()
+
+    @property
+    def wal(self):
+        """
+        **property**: our :class:`alkali.wal.WriteAheadLog` or ``None``
+        """
+        return self._wal
 
     @property
     def models(self):
@@ -179,31 +205,256 @@ class Database:
 
         return None
 
-    def store(self, force=False):
+    def store(self, force=False, background=False, workers=None):
         """
         persistantly store all model data
 
+        in the background, each dirty :class:`alkali.manager.Manager` is
+        snapshotted now, see :func:`alkali.manager.Manager.store_job`, and
+        written by a pool of worker threads while we carry on. only one
+        store runs at a time, starting a store or :func:`load` first waits
+        for a running one to finish.
+
         :param bool force: force store even if :class:`alkali.manager.Manager`
             thinks data is clean
+        :param bool background: return before the data is written
+        :param workers: size of the background pool, see :mod:`concurrent.futures`
+        :rtype: ``True`` or, in the background, a
+            :class:`concurrent.futures.Future` that's done once everything
+            is written
         """
+        self._wait_store()
+
+        # models that share a storage instance, eg. MultiStorage, can't
+        # be written at the same time but can be written as a batch
+        groups = OrderedDict()
+
         for model in self.models:
             logger.debug( "Database: storing model: %s", model.__name__ )
 
             storage = self.get_storage(model)
-            model.objects.store(storage, force=force)
+            job = model.objects.store_job(storage, force=force)
+
+            if job is not None:
+                groups.setdefault(id(storage), (storage, []))[1].append( (model, job) )
+
+        # saves made after this are not in the snapshot
+        mark = self._wal.mark() if self._wal is not None else None
+
+        if not background:
+            for storage, jobs in groups.values():
+                _run_jobs(storage, jobs)
+
+            self._truncate_wal(mark)
+            return True
+
+        if self._store_thread is None:
+            self._store_thread = futures.ThreadPoolExecutor(max_workers=1)
+
+        self._storing = self._store_thread.submit(self._store_background,
+                list(groups.values()), mark, workers)
+
+        return self._storing
+
+    def _store_background(self, groups, mark, workers):
+        """
+        helper function for :func:`store`, runs on our store thread
+        """
+        with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            results = [pool.submit(_run_jobs, storage, jobs) for storage, jobs in groups]
+
+        for result in results:
+            result.result() # raise the first failure, the log keeps everything
 
+        self._truncate_wal(mark)
         return True
 
-    def load(self):
+    def _truncate_wal(self, mark):
+        # everything in the log up to mark is in the model files now
+        if self._wal is not None:
+            self._wal.truncate(mark)
+
+    def _wait_store(self):
+        """
+        wait for a background store to finish, a failed store has marked
+        its managers dirty so the next store retries it
+        """
+        storing, self._storing = self._storing, None
+
+        if storing is None:
+            return
+
+        try:
+            storing.result()
+        except Exception:
+            logger.warning( "Database: background store failed", exc_info=True )
+
+    def load(self, parallel=None, workers=None):
         """
         load all model data from disk
 
-        :param IStorage storage: override model storage class
+        in parallel, the storage of each model is read by a pool of
+        ``'thread'`` or ``'process'`` workers. the records are handed to
+        :func:`alkali.manager.Manager.load` as they arrive but a model
+        is only loaded after the models its ForeignKeys point at.
+
+        threads suit storage that waits on disk, processes storage that
+        spends its time parsing. a storage sent to a process is pickled,
+        so it must be a :class:`alkali.storage.FileStorage` of a real
+        file and any state it keeps from reading, eg.
+        :class:`alkali.storage.JSONLinesStorage`, stays in the worker.
+
+        :param parallel: ``None``, ``'thread'`` or ``'process'``
+        :param workers: size of the pool, see :mod:`concurrent.futures`
         """
         logger.debug( "Database: loading models" )
 
-        for model in self.models:
-            logger.debug( "Database: loading model: %s", model.__name__ )
+        self._wait_store()
+
+        assert parallel in (None, 'thread', 'process'), \
+            "unknown parallel mode: {}".format(parallel)
 
+        if parallel is None:
+            for model in self.models:
+                logger.debug( "Database: loading model: %s", model.__name__ )
+
+                storage = self.get_storage(model)
+                model.objects.load(storage)
+        else:
+            self._load_parallel(parallel, workers)
+
+        # changes saved since the last store
+        if self._wal is not None:
+            self._wal.replay()
+
+    def _dependencies(self, model):
+        """
+        :rtype: ``set`` of our models that ``model`` has a ForeignKey to
+        """
+        return {
+            field.foreign_model for field in model.Meta.fields.values()
+            if isinstance(field, fields.ForeignKey)
+            and field.foreign_model is not model
+            and field.foreign_model in self._storage
+        }
+
+    def _load_parallel(self, parallel, workers):
+        """
+        helper function for :func:`load`
+        """
+        compact = parallel == 'process'
+        Executor = futures.ProcessPoolExecutor if compact else futures.ThreadPoolExecutor
+
+        # models that share a storage instance, eg. MultiStorage, share a
+        # file handle so they're read by the same worker
+        groups = OrderedDict()
+        lazy = []
+
+        for model in self.models:
             storage = self.get_storage(model)
-            model.objects.load(storage)
+
+            # nothing to read ahead of time, see Manager.load()
+            if type(storage).read_lazy is not Storage.read_lazy:
+                lazy.append(model)
+                continue
+
+            groups.setdefault(id(storage), (storage, []))[1].append(model)
+
+        pending = list(self.models)
+        loaded = set()
+
+        with Executor(max_workers=workers) as pool:
+            reads = {}
+
+            for storage, models in groups.values():
+                future = pool.submit(_read_models, storage, models, compact)
+
+                for i, model in enumerate(models):
+                    reads[model] = (future, i)
+
+            while pending:
+                # a ForeignKey cycle can't be satisfied, load in our order
+                ready = [m for m in pending if self._dependencies(m) <= loaded] or pending[:1]
+
+                if not any(m in lazy for m in ready):
+                    futures.wait([reads[m][0] for m in ready], return_when=futures.FIRST_COMPLETED)
+
+                for model in ready:
+                    if model in lazy:
+                        records = None
+                    else:
+                        future, i = reads[model]
+
+                        if not future.done():
+                            continue
+
+                        records = future.result()[i]
+                        records = _expand(records) if compact else records
+
+                    logger.debug( "Database: loading model: %s", model.__name__ )
+                    model.objects.load(self.get_storage(model), records=records)
+
+                    loaded.add(model)
+                    pending.remove(model)
+
+
+def _run_jobs(storage, jobs):
+    """
+    write what :func:`alkali.manager.Manager.store_job` snapshotted, in
+    order, as a single :func:`alkali.storage.Storage.batch`
+
+    :param jobs: ``list`` of ``(model, job)``
+    """
+    try:
+        with storage.batch():
+            for model, job in jobs:
+                job()
+    except BaseException:
+        # the batch is all or nothing
+        for model, job in jobs:
+            model.objects._store_failed()
+        raise
+
+def _read_models(storage, models, compact):
+    """
+    read all the records of ``models`` from ``storage``, run by a worker
+    of :func:`Database.load`
+
+    :param bool compact: return records as :func:`_compact` pairs, they're
+        being sent back from another process
+    :rtype: ``list`` of ``list`` of records, one per model
+    """
+    ret = []
+
+    for model in models:
+        records = storage.read(model) or []
+        ret.append( list(_compact(records) if compact else records) )
+
+    return ret
+
+def _compact(records):
+    """
+    yield each record ``dict`` as ``(keys, values)`` tuples, consecutive
+    records with the same keys share a single keys tuple so pickle only
+    writes it once
+    """
+    keys = None
+
+    for record in records:
+        if not isinstance(record, dict):
+            yield None, record
+            continue
+
+        names = tuple(record)
+
+        if names != keys:
+            keys = names
+
+        yield keys, tuple(record.values())
+
+def _expand(records):
+    """
+    undo :func:`_compact`
+    """
+    for keys, values in records:
+        yield values if keys is None else dict(zip(keys, values))
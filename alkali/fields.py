@@ -4,7 +4,7 @@ import itertools
 import types
 import uuid
 
-from .utils import tzadd, tznow
+from .utils import tzadd, tznow, EPOCH, MICROSECOND
 
 import logging
 logger = logging.getLogger(__name__)
@@ -29,13 +29,17 @@ class Field:
 
     _counter = itertools.count() # keeps track of declaration order in the Models
 
+    # the member descriptor of our value's slot in a Meta.slots model, see MetaModel
+    _slot = None
+
     def __init__(self, field_type, **kw):
         """
         :param field_type: the type this field should hold
         :type field_type: str/int/float/etc
         :param kw:
             * primary_key: is this field a primary key of parent model
-            * indexed:     is this field indexed (not implemented yet)
+            * indexed:     keep an index of this field, ``True`` or ``'sorted'``,
+              see :mod:`alkali.index`
         """
         self._order = next(Field._counter) # DO NOT TOUCH, deleted in MetaModel
 
@@ -66,6 +70,9 @@ class Field:
         if model is None:
             return self
 
+        if self._slot is not None:
+            return self._slot.__get__(model)
+
         return model.__dict__[self._name]
 
     def __set__(self, model, value):
@@ -156,6 +163,19 @@ class IntField(Field):
 
         return None
 
+    def seen(self, value):
+        """
+        an instance was created with ``value``, make sure auto_increment
+        doesn't hand it (or anything lower) out later
+
+        :param value: the already-cast value
+        """
+        if value is None:
+            return
+
+        if value > getattr(self.meta, '_auto_inc__' + self.name, 0):
+            setattr( self.meta, '_auto_inc__' + self.name, value )
+
 
 class BoolField(Field):
 
@@ -203,8 +223,18 @@ class StringField(Field):
 
 
 class DateTimeField(Field):
+    """
+    stored in isoformat, or as an integer of microseconds since the
+    epoch with ``epoch=True``, which reads isoformat too
+    """
 
-    def __init__(self, **kw):
+    def __init__(self, epoch=False, **kw):
+        """
+        :param epoch: store as microseconds since the epoch instead
+            of isoformat, a little smaller and faster to load but the
+            timezone is lost, values are loaded in local time
+        """
+        self.epoch = epoch
         super().__init__(dt.datetime, **kw)
 
     def cast(self, value):
@@ -220,23 +250,39 @@ class DateTimeField(Field):
             else:
                 return self.loads(value)
 
+        if self.epoch and type(value) is int:
+            return self.loads(value)
+
         if type(value) is not self.field_type:
             value = self.field_type(value)
 
         return tzadd( value )
 
-    def dumps(cls, value):
+    def dumps(self, value):
         if value is None:
             return 'null'
+
+        if self.epoch:
+            return (tzadd(value) - EPOCH) // MICROSECOND
+
         return value.isoformat()
 
-    def loads(cls, value):
+    def loads(self, value):
         if value is None or value == 'null':
             return None
 
-        # assume date is in isoformat, this preserves timezone info
         if isinstance(value, str):
-            value = dateutil.parser.parse(value)
+            if self.epoch and value.lstrip('-').isdigit(): # eg. from a csv file
+                value = int(value)
+            else:
+                try:
+                    # our own isoformat(), this preserves timezone info
+                    value = dt.datetime.fromisoformat(value)
+                except ValueError:
+                    value = dateutil.parser.parse(value)
+
+        if self.epoch and type(value) is int:
+            return (EPOCH + value * MICROSECOND).astimezone()
 
         if value.tzinfo is None:
             value = tzadd( value )
@@ -315,7 +361,7 @@ class ForeignKey(Field):
         if model is None:
             return self
 
-        fk_value = model.__dict__[self._name]
+        fk_value = Field.__get__(self, model, owner)
         return self.lookup(fk_value)
 
     # don't require a __set__ because Model.set_field() calls our cast() method
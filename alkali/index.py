@@ -0,0 +1,325 @@
+"""
+::
+
+    from alkali import Model, fields
+
+    class MyModel( Model ):
+        id    = fields.IntField(primary_key=True)
+        email = fields.StringField(indexed=True)
+
+    # MyModel.objects keeps a HashIndex for email, so these
+    # don't have to look at every instance
+    MyModel.objects.filter(email='foo@example.com')
+    MyModel.objects.filter(email__in=['foo@example.com', 'bar@example.com'])
+    MyModel.objects.get(email='foo@example.com')
+
+    class Event( Model ):
+        id = fields.IntField(primary_key=True)
+        ts = fields.DateTimeField(indexed='sorted')
+
+    # a SortedIndex also answers range lookups with a couple of binary searches
+    Event.objects.filter(ts__ge=start, ts__lt=end)
+"""
+
+import bisect
+import collections
+import operator
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Index:
+    """
+    base class for a field index, it maps field values to the primary
+    keys of the model instances holding that value.
+
+    indexes are owned and kept current by :class:`alkali.manager.Manager`,
+    there should be no need to create one directly.
+
+    the indexed value is the one stored in the model instance ``__dict__``,
+    for a :class:`alkali.fields.ForeignKey` that is the foreign primary key.
+    """
+
+    def __init__(self, field_name):
+        """
+        :param str field_name: the name of the field to index
+        """
+        self.field_name = field_name
+        self.clear()
+
+    def __repr__(self):
+        return "<{}: {}>".format(self.__class__.__name__, self.field_name)
+
+    def value(self, instance):
+        """
+        return the indexed value of given model instance
+        """
+        return instance.__dict__[self.field_name]
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def add(self, instance):
+        raise NotImplementedError()
+
+    def remove(self, instance):
+        raise NotImplementedError()
+
+
+class HashIndex(Index):
+    """
+    a value -> set(pk) hash index, answers equality and ``in`` lookups
+
+    field values must be hashable
+    """
+
+    def __len__(self):
+        return len(self._map)
+
+    def clear(self):
+        self._map = {}
+
+    def add(self, instance):
+        """
+        :param Model instance: an instance held by our manager
+        """
+        value = self.value(instance)
+
+        try:
+            self._map[value].add(instance.pk)
+        except KeyError:
+            self._map[value] = {instance.pk}
+
+    def remove(self, instance):
+        """
+        :param Model instance: an instance held by our manager
+        """
+        value = self.value(instance)
+        pks = self._map.get(value)
+
+        if pks is None:
+            return
+
+        pks.discard(instance.pk)
+
+        if not pks:
+            del self._map[value]
+
+    def lookup(self, value):
+        """
+        return the primary keys of the instances where field equals ``value``
+
+        **note**: don't modify the returned set
+
+        :rtype: ``set``
+        """
+        return self._map.get(value, set())
+
+    def lookup_in(self, values):
+        """
+        return the primary keys of the instances where field is in ``values``
+
+        :rtype: ``set``
+        """
+        pks = set()
+
+        for value in values:
+            pks.update(self._map.get(value, ()))
+
+        return pks
+
+
+class SortedIndex(Index):
+    """
+    a sorted value index, answers equality, ``in`` and range
+    (``gt``, ``ge``, ``lt``, ``le``) lookups via binary search
+
+    field values must be hashable and comparable with each other. ``None``
+    values are kept to the side so they only match ``eq`` lookups.
+
+    additions and removals are batched and only merged into the sorted
+    arrays at the next lookup, so loading many instances is one sort and
+    not one insert each. a few additions, ie. saves between lookups, are
+    inserted in place instead.
+    """
+
+    # up to this many pending additions are inserted with bisect,
+    # more get one sort of the whole index
+    insort_max = 64
+
+    def __len__(self):
+        self._merge()
+        return len(self._values) + len(self._nones)
+
+    def clear(self):
+        self._values  = []  # sorted field values
+        self._pks     = []  # pk of the instance holding _values[i]
+        self._nones   = set()
+        self._pending = []  # (value, pk) added since last merge
+        self._removed = collections.Counter() # (value, pk) removed since last merge
+
+    def add(self, instance):
+        """
+        :param Model instance: an instance held by our manager
+        """
+        value = self.value(instance)
+
+        if value is None:
+            self._nones.add(instance.pk)
+            return
+
+        entry = (value, instance.pk)
+
+        # re-adding an entry that's waiting to be removed cancels the removal
+        if self._removed[entry]:
+            self._removed[entry] -= 1
+            return
+
+        self._pending.append(entry)
+
+    def remove(self, instance):
+        """
+        :param Model instance: an instance held by our manager
+        """
+        value = self.value(instance)
+
+        if value is None:
+            self._nones.discard(instance.pk)
+            return
+
+        self._removed[(value, instance.pk)] += 1
+
+    def _merge(self):
+        """
+        apply pending removals and additions to our sorted arrays
+        """
+        for entry, count in self._removed.items():
+            for _ in range(count):
+                self._remove_entry(entry)
+
+        self._removed.clear()
+
+        if not self._pending:
+            return
+
+        if len(self._pending) <= self.insort_max:
+            for value, pk in self._pending:
+                i = bisect.bisect_right(self._values, value)
+                self._values.insert(i, value)
+                self._pks.insert(i, pk)
+
+            self._pending = []
+            return
+
+        # timsort is linear on already sorted runs so this is cheap
+        entries = list(zip(self._values, self._pks))
+        entries.extend(self._pending)
+        entries.sort(key=operator.itemgetter(0))
+
+        self._values = [value for value, _ in entries]
+        self._pks = [pk for _, pk in entries]
+        self._pending = []
+
+    def _remove_entry(self, entry):
+        value, pk = entry
+
+        lo = bisect.bisect_left(self._values, value)
+        hi = bisect.bisect_right(self._values, value)
+
+        for i in range(lo, hi):
+            if self._pks[i] == pk:
+                del self._values[i]
+                del self._pks[i]
+                return
+
+        try:
+            self._pending.remove(entry)
+        except ValueError: # pragma: nocover
+            pass
+
+    def lookup(self, value):
+        """
+        return the primary keys of the instances where field equals ``value``
+
+        :rtype: ``set``
+        """
+        if value is None:
+            return set(self._nones)
+
+        return self.range(value, value)
+
+    def lookup_in(self, values):
+        """
+        return the primary keys of the instances where field is in ``values``
+
+        :rtype: ``set``
+        """
+        pks = set()
+
+        for value in values:
+            pks.update(self.lookup(value))
+
+        return pks
+
+    def range(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        """
+        return the primary keys of the instances where field is between
+        ``low`` and ``high``, a bound of ``None`` is unbounded
+
+        :rtype: ``set``
+        """
+        self._merge()
+
+        if low is None:
+            lo = 0
+        elif low_inclusive:
+            lo = bisect.bisect_left(self._values, low)
+        else:
+            lo = bisect.bisect_right(self._values, low)
+
+        if high is None:
+            hi = len(self._values)
+        elif high_inclusive:
+            hi = bisect.bisect_right(self._values, high)
+        else:
+            hi = bisect.bisect_left(self._values, high)
+
+        return set(self._pks[lo:hi])
+
+    def first(self, n, reverse=False):
+        """
+        return the primary keys of the instances with the ``n`` lowest
+        (or highest if ``reverse``) values, plus any that tie with the
+        n-th value
+
+        :rtype: ``set`` or ``None`` if there are ``None`` values, those
+            can't be ordered
+        """
+        self._merge()
+
+        if self._nones:
+            return None
+
+        if n >= len(self._values):
+            return set(self._pks)
+
+        if reverse:
+            return self.range(self._values[-n], None)
+
+        return self.range(None, self._values[n - 1])
+
+
+def make_index(field_name, kind):
+    """
+    return a new index for given field
+
+    :param str field_name: the field to index
+    :param kind: ``Field.indexed``, ``True`` or ``'hash'`` for a
+        :class:`HashIndex`, ``'sorted'`` for a :class:`SortedIndex`
+    """
+    if kind is True or kind == 'hash':
+        return HashIndex(field_name)
+
+    assert kind == 'sorted', "unknown index type: {}".format(kind)
+    return SortedIndex(field_name)
@@ -1,7 +1,12 @@
 import inspect
 import copy
+import weakref
+import threading
+from collections.abc import MutableMapping
 
 from .query import Query
+from .index import make_index, SortedIndex
+from . import columnar
 from . import fields
 from . import signals
 
@@ -9,6 +14,100 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class LazyInstances(MutableMapping):
+    """
+    a :class:`Manager`'s instances ``dict`` when it's loaded from storage
+    that supports :func:`alkali.storage.Storage.read_lazy`, a row only
+    becomes a model instance the first time it's looked up
+    """
+
+    def __init__(self, model_class, rows):
+        """
+        :param Model model_class: the model rows are instances of
+        :param rows: read-only mapping of pk: record ``dict``
+        """
+        self._model_class = model_class
+        self._rows = rows
+        self._loaded = {}     # pk: instance, looked up or saved
+        self._removed = set() # pks of rows that have been deleted
+        self._len = len(rows)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for pk in self._rows:
+            if pk not in self._removed:
+                yield pk
+
+        for pk in self._loaded:
+            if pk not in self._rows:
+                yield pk
+
+    def __contains__(self, pk):
+        if pk in self._loaded:
+            return True
+
+        return pk in self._rows and pk not in self._removed
+
+    def __getitem__(self, pk):
+        try:
+            return self._loaded[pk]
+        except KeyError:
+            pass
+
+        instance = self._loaded[pk] = self.peek(pk)
+        return instance
+
+    def __setitem__(self, pk, instance):
+        if pk not in self:
+            self._len += 1
+
+        self._loaded[pk] = instance
+        self._removed.discard(pk)
+
+    def __delitem__(self, pk):
+        if pk not in self:
+            raise KeyError(pk)
+
+        self._loaded.pop(pk, None)
+
+        if pk in self._rows:
+            self._removed.add(pk)
+
+        self._len -= 1
+
+    @property
+    def loaded(self):
+        """
+        **property**: number of rows that are model instances
+        """
+        return len(self._loaded)
+
+    def peek(self, pk):
+        """
+        return the instance for ``pk`` without keeping it if it has to be
+        created, eg. when every instance is being written out
+
+        :raises KeyError: if there's no such pk
+        """
+        instance = self._loaded.get(pk)
+
+        if instance is not None:
+            return instance
+
+        if pk in self._removed:
+            raise KeyError(pk)
+
+        return self._model_class( **self._rows[pk] )
+
+    def copy(self):
+        other = copy.copy(self)
+        other._loaded = dict(self._loaded)
+        other._removed = set(self._removed)
+        return other
+
+
 class Manager:
     """
     the ``Manager`` class is the parent/owner of all the
@@ -23,8 +122,24 @@ class Manager:
         assert inspect.isclass(model_class)
         self._model_class = model_class
         self._instances = {}
+        self._shared = 0 # number of _snapshot()s still reading _instances
+        self._indexes = {}
+        self._columns = None
         self._dirty = False
 
+        # what changed since the last load() or store() with _synced, a weakref
+        # so we don't keep the storage, and its locked file, alive
+        self._synced = None
+        self._inserted = {} # pk: None
+        self._updated = {}  # pk: None
+        self._deleted = {}  # pk: instance as it was
+
+        if model_class.Meta.columnar:
+            if columnar.available():
+                self._columns = columnar.ColumnStore(model_class)
+            else:
+                logger.warning( "%s: numpy is not installed, ignoring Meta.columnar", self._name )
+
         self.clear()
 
     def __repr__(self):
@@ -74,7 +189,7 @@ class Manager:
 
         :rtype: ``list``
         """
-        return [copy.copy(obj) for obj in self._instances.values()]
+        return [obj.view() for obj in self._instances.values()]
 
     @property
     def dirty(self):
@@ -86,6 +201,46 @@ class Manager:
         if self._dirty:
             return True
 
+    @property
+    def changes(self):
+        """
+        **property**: the primary keys inserted, updated and deleted since
+        our last load or store
+
+        :rtype: ``tuple`` of three ``set``
+        """
+        return set(self._inserted), set(self._updated), set(self._deleted)
+
+    def _track_save(self, pk, existed):
+        if pk in self._deleted:
+            del self._deleted[pk]
+            self._updated[pk] = None
+        elif pk not in self._inserted:
+            if existed:
+                self._updated[pk] = None
+            else:
+                self._inserted[pk] = None
+
+    def _track_delete(self, old):
+        pk = old.pk
+
+        # never stored so there's nothing to delete
+        if pk in self._inserted:
+            del self._inserted[pk]
+            return
+
+        self._updated.pop(pk, None)
+        self._deleted[pk] = old
+
+    def _sync(self, storage):
+        """
+        our instances are now what ``storage`` holds
+        """
+        self._synced = weakref.ref(storage) if storage is not None else None
+        self._inserted = {}
+        self._updated = {}
+        self._deleted = {}
+
     @staticmethod
     def sorter(elements, reverse=False ):
         """
@@ -96,8 +251,196 @@ class Manager:
             * reverse: return in reverse order
         :rtype: ``generator``
         """
+        # lazy instances aren't kept just to be written out
+        get = getattr(elements, 'peek', elements.__getitem__)
+
         for key in sorted(elements.keys(), reverse=reverse):
-            yield elements[key]
+            yield get(key)
+
+    @property
+    def indexes(self):
+        """
+        **property**: the indexes we maintain, one per field declared
+        with ``indexed=True``
+
+        :rtype: ``dict`` of field name: :class:`alkali.index.Index`
+        """
+        return self._indexes
+
+    @property
+    def columns(self):
+        """
+        **property**: the numpy arrays of our Int/Float/Bool/DateTime
+        fields when the model has ``Meta.columnar = True``, built
+        when first needed
+
+        :rtype: :class:`alkali.columnar.ColumnStore` or ``None``
+        """
+        if self._columns is not None and self._columns.stale:
+            self._columns.build(self._instances.values())
+
+        return self._columns
+
+    def _snapshot(self):
+        """
+        return our instances ``dict`` for read-only use by a :class:`alkali.query.Query`
+
+        the dict is copied before our next modification so the caller's
+        view never changes. ie. copy-on-write instead of every Query
+        copying all our instances. a caller that's done reading the dict
+        gives it back with :func:`_release` so it isn't copied needlessly.
+        """
+        self._shared += 1
+        return self._instances
+
+    def _release(self, instances):
+        """
+        a :func:`_snapshot` caller no longer reads ``instances``
+        """
+        if instances is self._instances and self._shared:
+            self._shared -= 1
+
+    def _unshare(self):
+        """
+        make sure we own our instances dict before modifying it
+        """
+        if self._shared:
+            self._instances = self._instances.copy()
+            self._shared = 0
+
+    def _index_add(self, instance):
+        for index in self._indexes.values():
+            index.add(instance)
+
+        if self._columns is not None:
+            self._columns.add(instance)
+
+    def _index_remove(self, instance):
+        for index in self._indexes.values():
+            index.remove(instance)
+
+        if self._columns is not None:
+            self._columns.remove(instance)
+
+    def _index_lookup(self, lookups):
+        """
+        try to answer ``filter(field__oper=value, ...)`` without looking at
+        every instance. range lookups on the same field are combined into a
+        single :func:`alkali.index.SortedIndex.range` call.
+
+        the primary key is always indexed via our instances dict
+
+        :param lookups: list of ``(field, oper, value)``
+        :rtype: ``set`` of primary keys that *may* match or ``None`` if no
+            lookup has a suitable index
+        """
+        pks = None
+        ranges = {} # field: [low, low_inclusive, high, high_inclusive]
+
+        for field, oper, value in lookups:
+            if oper in ('gt', 'ge', 'lt', 'le'):
+                index = self._indexes.get(field)
+
+                if not isinstance(index, SortedIndex) or value is None \
+                or isinstance(self.model_class.Meta.fields[field], fields.ForeignKey):
+                    continue
+
+                bounds = ranges.setdefault(field, [None, True, None, True])
+
+                try:
+                    self._tighten(bounds, oper, value)
+                except TypeError: # incomparable values, let the query deal with it
+                    ranges[field] = None
+
+                continue
+
+            found = self._index_find(field, oper, value)
+
+            if found is not None:
+                pks = set(found) if pks is None else pks & found
+
+        for field, bounds in ranges.items():
+            if bounds is None:
+                continue
+
+            low, low_inclusive, high, high_inclusive = bounds
+
+            try:
+                found = self._indexes[field].range(low, high, low_inclusive, high_inclusive)
+            except TypeError:
+                continue
+
+            pks = found if pks is None else pks & found
+
+        return pks
+
+    @staticmethod
+    def _tighten(bounds, oper, value):
+        """
+        narrow ``[low, low_inclusive, high, high_inclusive]`` by ``oper value``
+        """
+        if oper in ('gt', 'ge'):
+            low = bounds[0]
+
+            if low is None or value > low or (value == low and oper == 'gt'):
+                bounds[0], bounds[1] = value, oper == 'ge'
+        else:
+            high = bounds[2]
+
+            if high is None or value < high or (value == high and oper == 'lt'):
+                bounds[2], bounds[3] = value, oper == 'le'
+
+    def _index_find(self, field, oper, value):
+        """
+        answer a single ``eq`` or ``in`` lookup via an index
+
+        :rtype: ``set`` of primary keys or ``None`` if there's no suitable index
+        """
+        if oper not in ('eq', 'in'):
+            return None
+
+        # 'in' on a string is a substring test, not a membership test
+        if oper == 'in' and isinstance(value, str):
+            return None
+
+        pk_fields = self.model_class.Meta.pk_fields
+
+        if field == 'pk' or (field in pk_fields and len(pk_fields) == 1):
+            # compound pks are tuples and 'in' does an intersection on those
+            if oper == 'in' and len(pk_fields) > 1:
+                return None
+
+            values = [value] if oper == 'eq' else value
+
+            try:
+                return { pk for pk in values if pk in self._instances }
+            except TypeError: # unhashable
+                return None
+
+        index = self._indexes.get(field)
+
+        if index is None:
+            return None
+
+        field_class = self.model_class.Meta.fields[field]
+
+        if isinstance(field_class, fields.ForeignKey):
+            # the index holds foreign pk values but the query compares
+            # foreign instances, so only an instance can be looked up
+            values = [value] if oper == 'eq' else list(value)
+
+            if not all( type(v) is field_class.foreign_model for v in values ):
+                return None
+
+            value = values[0].pk if oper == 'eq' else [v.pk for v in values]
+
+        try:
+            if oper == 'eq':
+                return index.lookup(value)
+            else:
+                return index.lookup_in(value)
+        except TypeError: # unhashable
+            return None
 
     def save(self, instance, dirty=True, copy_instance=True):
         """
@@ -109,24 +452,47 @@ class Manager:
         :param dirty: don't mark us as dirty if False, used during loading
         """
         #logger.debug( "saving model instance: %s", str(instance.pk) )
-        signals.pre_save.send(self.model_class, instance=instance )
+        if signals.pre_save.has_receivers_for(self.model_class):
+            signals.pre_save.send(self.model_class, instance=instance )
 
         assert instance.pk is not None, \
                 "{}.save(): instance '{}' has None for pk".format(self._name, instance)
 
+        # auto_now fields are stamped once per save, not per field change
+        if instance._dirty and self.model_class.Meta.auto_now_fields:
+            instance._stamp()
+
+        self._unshare()
+
+        old = self._instances.get(instance.pk)
+        if old is not None:
+            self._index_remove(old)
+
         if copy_instance:
             instance = self._instances[instance.pk] = copy.copy(instance)
+
+            # our copy is what's saved, its views only become dirty when
+            # they're changed
+            if instance._dirty:
+                instance._dirty = False
         else:
             self._instances[instance.pk] = instance
 
+        self._index_add(instance)
+
         # THINK may be mistake to send the actual object out via the signal but probably
         # what any reciever actually wants
-        signals.post_save.send( self.model_class, instance=instance )
+        if signals.post_save.has_receivers_for(self.model_class):
+            signals.post_save.send( self.model_class, instance=instance )
 
         # self._dirty is required because think what would happen
         # if we add a clean model instance
-        if dirty:
+        #
+        # outside of load() (which isn't synced yet) a clean instance is
+        # still a change storage doesn't have, eg. cb_create_foreign()
+        if dirty or self._synced is not None:
             self._dirty = True
+            self._track_save(instance.pk, old is not None)
 
     def clear(self):
         """
@@ -140,6 +506,17 @@ class Manager:
 
         self._dirty = len(self) > 0
         self._instances = {}
+        self._shared = 0
+        self._sync(None)
+
+        self._indexes = {
+            name: make_index(name, field.indexed)
+            for name, field in self.model_class.Meta.fields.items()
+            if field.indexed
+        }
+
+        if self._columns is not None:
+            self._columns.clear()
 
     def delete(self, instance):
         """
@@ -150,15 +527,23 @@ class Manager:
         # TODO should probably take an pk instead of an instance
         # logger.debug( "deleting model instance: %s", str(instance.pk) )
 
-        signals.pre_delete.send(self.model_class, instance=instance)
+        if signals.pre_delete.has_receivers_for(self.model_class):
+            signals.pre_delete.send(self.model_class, instance=instance)
 
         try:
-            del self._instances[ instance.pk ]
-            self._dirty = True
+            old = self._instances[ instance.pk ]
+        except KeyError:
+            return
+
+        self._unshare()
+        self._index_remove(old)
 
+        del self._instances[ instance.pk ]
+        self._dirty = True
+        self._track_delete(old)
+
+        if signals.post_delete.has_receivers_for(self.model_class):
             signals.post_delete.send(self.model_class, instance=instance)
-        except KeyError:
-            pass
 
     def cb_delete_foreign(self, sender, instance ):
         """
@@ -183,37 +568,114 @@ class Manager:
         """
         save all our instances to storage
 
+        if we were last loaded from or stored to ``storage`` then only the
+        instances that changed since are handed to
+        :func:`alkali.storage.Storage.write_changes`, storage that can't
+        use them gets everything.
+
         :param Storage storage: an instance
         :param bool force: force save even if we're not dirty
         """
+        job = self.store_job(storage, force=force)
+
+        if job is not None:
+            job()
+
+    def store_job(self, storage, force=False):
+        """
+        take a snapshot of what :func:`store` would write and return a
+        function that writes it, the function can be called later and from
+        another thread. we're clean as of the snapshot.
+
+        the snapshot is our copy-on-write instances ``dict``, see
+        :func:`_snapshot`, so it's cheap until we next change
+
+        :param Storage storage: an instance
+        :param bool force: force save even if we're not dirty
+        :rtype: ``callable`` or ``None`` if there's nothing to write
+        """
         if not storage:
             logger.debug("%s: no storage instance for storing, exiting", self._name)
-            return
+            return None
 
         if force:
             self._dirty = True
 
-        if self.dirty:
-            signals.pre_store.send(self.model_class)
+        if not self.dirty:
+            logger.debug( "%s: has no dirty records, not saving", self._name )
+            return None
 
-            logger.debug( "%s: has dirty records, saving", self._name )
-            logger.debug( "%s: storing models via storage class: %s", self._name, storage._name )
+        signals.pre_store.send(self.model_class)
 
-            gen = Manager.sorter(self._instances)
-            storage.write(self.model_class, gen)
+        logger.debug( "%s: has dirty records, saving", self._name )
+        logger.debug( "%s: storing models via storage class: %s", self._name, storage._name )
 
-            logger.debug( "%s: finished storing %d records", self._name, len(self) )
-            signals.post_store.send(self.model_class)
-        else:
-            logger.debug( "%s: has no dirty records, not saving", self._name )
+        synced = self._synced() if self._synced is not None else None
+
+        instances = self._snapshot()
+        changes = None
 
+        if not force and storage is synced:
+            changes = self._changes(instances)
+
+        self._sync(storage)
         self._dirty = False
 
-    def load(self, storage):
+        owner = threading.get_ident()
+
+        def job():
+            try:
+                if changes is None or not storage.write_changes(self.model_class, *changes):
+                    gen = Manager.sorter(instances)
+                    storage.write(self.model_class, gen)
+            except BaseException:
+                self._store_failed()
+                raise
+            finally:
+                # done reading the snapshot. only on our own thread, another
+                # one would race our saves, a background store's snapshot
+                # is copied by the next save instead
+                if threading.get_ident() == owner:
+                    self._release(instances)
+
+            logger.debug( "%s: finished storing %d records", self._name, len(instances) )
+            signals.post_store.send(self.model_class)
+
+        return job
+
+    def _store_failed(self):
+        """
+        we don't know what storage has, the next store writes everything
+        """
+        self._synced = None
+        self._dirty = True
+
+    def _changes(self, instances):
+        """
+        helper function that collects what changed since our last load or
+        store for :func:`alkali.storage.Storage.write_changes`
+
+        :rtype: ``(inserted, updated, deleted)`` lists of instances
+        """
+        logger.debug( "%s: %d inserted, %d updated, %d deleted", self._name,
+                len(self._inserted), len(self._updated), len(self._deleted) )
+
+        return ( [instances[pk] for pk in self._inserted],
+                 [instances[pk] for pk in self._updated],
+                 list(self._deleted.values()) )
+
+    def load(self, storage, records=None):
         """
         load all our instances from storage
 
+        if ``storage`` supports :func:`alkali.storage.Storage.read_lazy`,
+        and we have no indexes or columns that need every instance, then
+        our instances are created as they're looked up instead. lazily
+        loaded instances don't have their foreign keys validated.
+
         :param Storage storage: an instance
+        :param records: optional, what ``storage.read()`` returned when it
+            was called ahead of time, see :func:`alkali.database.Database.load`
         :raises KeyError: if there are duplicate primary keys
 
         """
@@ -248,7 +710,20 @@ class Manager:
         dirty = False
         fk_fields = self.model_class.Meta.field_filter(fields.ForeignKey)
 
-        for elem in storage.read( self.model_class ):
+        rows = None
+        if records is None and not self._indexes and self._columns is None:
+            rows = storage.read_lazy( self.model_class )
+
+        if rows is not None:
+            logger.debug( "%s: loading lazily", self._name )
+            self._instances = LazyInstances(self.model_class, rows)
+            elems = []
+        elif records is not None:
+            elems = records
+        else:
+            elems = storage.read( self.model_class )
+
+        for elem in elems:
             if isinstance(elem, dict):
                 elem = self.model_class( **elem )
 
@@ -268,6 +743,9 @@ class Manager:
 
         self._dirty = dirty
 
+        # dropped instances aren't a change we can describe
+        self._sync(None if dirty else storage)
+
         logger.debug( "%s: finished loading %d records", self._name, len(self) )
         signals.post_load.send(self.model_class)
 
@@ -298,7 +776,7 @@ class Manager:
         # NOTE without this, direct access ForeignKeys are 100x slower
         if len(pk) == 1:
             pk = self.model_class.Meta.pk_fields.values()[0].cast(pk[0])
-            return copy.copy( self._instances[pk] )
+            return self._instances[pk].view()
 
         results = Query(self).filter(**kw)
 
@@ -3,6 +3,14 @@
 
 import functools
 
+def memo_name(name):
+    """
+    the attribute a :class:`memoized_property` called ``name`` keeps its
+    value in, a slot of slotted models (no leading ``__`` so it's not
+    name mangled)
+    """
+    return '_memo_' + name
+
 class memoized_property:
 
     def __init__(self, fget=None, fset=None, fdel=None, doc=None):
@@ -16,7 +24,7 @@ class memoized_property:
         self.__doc__ = doc
 
         if fget is not None:
-            self._attr_name = '___' + fget.__name__
+            self._attr_name = memo_name(fget.__name__)
 
     def __get__(self, inst, type=None):
         if inst is None:
@@ -1,8 +1,11 @@
 from collections import OrderedDict
+import datetime as dt
 
 from .relmanager import RelManager
-from .fields import Field, ForeignKey, OneToOneField
+from .fields import Field, ForeignKey, OneToOneField, IntField, \
+    BoolField, StringField, DateTimeField
 from .utils import tznow
+from .memoized_property import memoized_property, memo_name
 from . import signals
 
 # Architecture
@@ -59,8 +62,9 @@ class MetaModel(type):
         # new_class is an instance of 'name' (aka Model) whose type is MetaModel
         # print "new_class", type(new_class), new_class
         # new_class <class 'alkali.metamodel.MetaModel'> <class 'redb.metamodel.MyModel'>
-        new_class = super_new(meta_class, name, bases, {})
+        new_class = super_new(meta_class, name, *meta_class._slotted(bases, attrs))
         new_class._add_meta( attrs )
+        new_class._add_slots()
         new_class._add_fields()
         new_class._add_manager()
         new_class._add_relmanagers()
@@ -71,10 +75,52 @@ class MetaModel(type):
         for name, attr in attrs.items():
             setattr(new_class, name, attr)
 
+        new_class._add_constructor()
+
         signals.model_creation.send(meta_class, model=new_class)
 
         return new_class
 
+    @staticmethod
+    def _slotted( bases, attrs ):
+        """
+        return the bases and attrs to create the model class with, a
+        ``Meta.slots = True`` model gets a slot per field and
+        :class:`alkali.model.Slotted` mixed in
+
+        :rtype: ``(bases, attrs)``
+        """
+        if not getattr(attrs.get('Meta'), 'slots', False):
+            return bases, {}
+
+        from .model import Slotted
+
+        names = [name for name, attr in attrs.items() if isinstance(attr, Field)]
+        names.append('_dirty')
+
+        # memoized properties, eg. Model.pk, keep their value in a slot too
+        classes = [attrs] + [ vars(klass) for base in bases for klass in base.__mro__ ]
+        for namespace in classes:
+            for name, attr in namespace.items():
+                if isinstance(attr, memoized_property) and memo_name(name) not in names:
+                    names.append( memo_name(name) )
+
+        return (Slotted,) + bases, { '__slots__': tuple(names) }
+
+    def _add_slots( new_class ):
+        """
+        remember the slots' member descriptors, the fields replace them
+        as class attributes
+        """
+        if not new_class.Meta.slots:
+            return
+
+        new_class._slot_members = OrderedDict(
+            (name, new_class.__dict__[name]) for name in new_class.__slots__ )
+
+        for name, field in new_class.Meta.fields.items():
+            field._slot = new_class._slot_members[name]
+
     def _add_manager( new_class ):
         from .manager import Manager
         setattr( new_class, 'objects', Manager(new_class) )
@@ -106,6 +152,13 @@ class MetaModel(type):
                     new_class.objects.cb_create_foreign,
                     sender=field.foreign_model)
 
+    def _add_constructor( new_class ):
+        """
+        generate the function that creates our instances, see
+        :func:`_make_constructor`
+        """
+        new_class._create = staticmethod( _make_constructor(new_class) )
+
     def _add_exceptions( new_class ):
         from .model import ObjectDoesNotExist
 
@@ -146,6 +199,12 @@ class MetaModel(type):
         if not hasattr(meta, 'storage'):
             meta.storage = None
 
+        if not hasattr(meta, 'columnar'):
+            meta.columnar = False
+
+        if not hasattr(meta, 'slots'):
+            meta.slots = False
+
         if not hasattr(meta, 'ordering'):
             meta.ordering = _get_field_order(attrs)
 
@@ -190,6 +249,10 @@ class MetaModel(type):
         if len(meta.fields):
             assert len(meta.pk_fields) > 0, "no primary_key defined in fields"
 
+        # the fields Manager.save() stamps with the time when a changed
+        # instance is saved, see Model._stamp()
+        meta.auto_now_fields = [name for name, field in meta.fields.items() if field.auto_now]
+
     def _add_fields( new_class ):
         """
         put the Field reference into new_class
@@ -226,33 +289,141 @@ class MetaModel(type):
     # creates a new instance of derived model, this is called each
     # time a Model instance is created
     def __call__(cls, *args, **kw):
-        obj = cls.__new__(cls, *args)
+        return cls._create(*args, **kw)
+
+
+_MISSING = object()
+
+def _pk_kwarg(cls, kw):
+    """
+    rename a ``pk`` keyword argument to the name of our primary key field
+    """
+    assert len(cls.Meta.pk_fields) == 1, "can't currently set compound primary key via kwargs"
+
+    field_name = cls.Meta.pk_fields.keys()[0]
+    assert field_name not in kw, "can't pass in 'pk' and actual pk field name"
 
-        if 'pk' in kw:
-            assert len(cls.Meta.pk_fields) == 1, "can't currently set compound primary key via kwargs"
+    kw[field_name] = kw.pop('pk')
 
-            field_name = cls.Meta.pk_fields.keys()[0]
-            assert field_name not in kw, "can't pass in 'pk' and actual pk field name"
+def _cast_source(field, i):
+    """
+    return the python expression that casts ``v`` for ``field``, the
+    casts of the builtin fields are inlined
+    """
+    cast = type(field).cast
 
-            value = kw.pop('pk')
-            kw[field_name] = value
+    if cast is Field.cast and field.field_type in (int, float):
+        return "v if v is None or type(v) is {0} else {0}(v)".format(field.field_type.__name__)
 
-        # put field values (int,str,etc) into model instance
-        for name, field in cls.Meta.fields.items():
-            if getattr(field, 'auto_now', False):
-                value = kw.pop(name, tznow().isoformat())
-            elif getattr(field, 'auto_now_add', False):
-                value = kw.pop(name, tznow().isoformat())
-            else:
-                # THINK: this somewhat duplicates Field.__set__ code
-                value = kw.pop(name, field.default_value)
+    if cast is StringField.cast:
+        return "v if v is None or type(v) is str else str(v)"
 
-            value = field.cast(value)
+    if cast is BoolField.cast:
+        return "v if v is None or type(v) is bool else _cast_{}(v)".format(i)
 
-            # store the actual value in the model's __dict__, used by Field.__get__
-            obj.__dict__[name] = value
+    if cast is DateTimeField.cast:
+        return "v if type(v) is _datetime and v.tzinfo is not None else _cast_{}(v)".format(i)
 
-        obj._dirty = False
-        obj.__init__(*args, **kw)
+    return "_cast_{}(v)".format(i)
 
-        return obj
+def _default_source(field, i):
+    """
+    return the python statement that gives ``v`` its default value when
+    it wasn't passed in, ``None`` if the default is ``None``
+    """
+    if field.auto_now or field.auto_now_add:
+        return "v = _tznow()"
+
+    if type(field).default_value is Field.default_value:
+        return None
+
+    if isinstance(field, IntField) and type(field).default_value is IntField.default_value \
+    and not field.auto_increment:
+        return None
+
+    return "v = _field_{}.default_value".format(i)
+
+def _make_constructor(cls):
+    """
+    return a function specialized for ``cls`` that creates an instance
+    from keyword arguments: fields get their value, default and cast
+    without looping over ``Meta.fields``, ie. what dataclasses do for
+    ``__init__``
+
+    the function is what ``cls(...)`` calls, see :func:`MetaModel.__call__`
+    """
+    from .model import Model
+
+    namespace = {
+        '_cls': cls,
+        '_new': cls.__new__,
+        '_setattr': object.__setattr__,
+        '_pk_kwarg': _pk_kwarg,
+        '_MISSING': _MISSING,
+        '_tznow': tznow,
+        '_datetime': dt.datetime,
+        '_creation': signals.creation,
+        '_has_creation': signals.creation.has_receivers_for,
+    }
+
+    lines = [
+        "def __create__(*args, **kw):",
+        "    obj = _new(_cls, *args)",
+        "    _setattr(obj, '_shared', False)",
+        "    if 'pk' in kw:",
+        "        _pk_kwarg(_cls, kw)",
+    ]
+
+    # where values go, straight into the slots of slotted models
+    if cls.Meta.slots:
+        store = "_set_{}(obj, {})"
+        namespace['_set_dirty'] = cls._slot_members['_dirty'].__set__
+    else:
+        store = "d[{!r}] = {}"
+        lines.append( "    d = obj.__dict__" )
+
+    for i, (name, field) in enumerate(cls.Meta.fields.items()):
+        namespace['_field_{}'.format(i)] = field
+        namespace['_cast_{}'.format(i)] = field.cast
+
+        if cls.Meta.slots:
+            namespace['_set_{}'.format(i)] = field._slot.__set__
+
+        default = _default_source(field, i)
+
+        if default is None:
+            lines.append( "    v = kw.pop({!r}, None)".format(name) )
+        else:
+            lines.append( "    v = kw.pop({!r}, _MISSING)".format(name) )
+            lines.append( "    if v is _MISSING:" )
+            lines.append( "        " + default )
+
+        target = i if cls.Meta.slots else name
+
+        if isinstance(field, IntField) and field.auto_increment:
+            # a given value, eg. from load(), moves the counter past it
+            lines.append( "    else:" )
+            lines.append( "        v = " + _cast_source(field, i) )
+            lines.append( "        _field_{}.seen(v)".format(i) )
+            lines.append( "    " + store.format(target, "v") )
+        else:
+            lines.append( "    " + store.format(target, _cast_source(field, i)) )
+
+    lines.append( "    _set_dirty(obj, False)" if cls.Meta.slots else "    d['_dirty'] = False" )
+
+    if cls.__init__ is Model.__init__:
+        # inlined Model.__init__
+        lines.append( "    for name, value in kw.items():" )
+        lines.append( "        setattr(obj, name, value)" )
+        lines.append( "    if _has_creation(_cls):" )
+        lines.append( "        _creation.send(_cls, instance=obj)" )
+    else:
+        lines.append( "    obj.__init__(*args, **kw)" )
+
+    lines.append( "    return obj" )
+
+    exec( "\n".join(lines), namespace )
+
+    create = namespace['__create__']
+    create.__qualname__ = "{}.__create__".format(cls.__name__)
+    return create
@@ -1,5 +1,5 @@
 from collections import OrderedDict
-from collections.abc import Iterable
+from collections.abc import Iterable, MutableMapping
 import json
 
 from .memoized_property import memoized_property
@@ -17,6 +17,107 @@ class ObjectDoesNotExist(Exception):
     pass
 
 
+class SlotDict(MutableMapping):
+    """
+    what ``__dict__`` returns for a :class:`Slotted` instance, reads and
+    writes its slots so code that uses ``instance.__dict__[name]`` for
+    raw field values keeps working
+    """
+    __slots__ = ('_instance', '_members')
+
+    def __init__(self, instance):
+        self._instance = instance
+        self._members = instance._slot_members
+
+    def __getitem__(self, name):
+        try:
+            return self._members[name].__get__(self._instance)
+        except (KeyError, AttributeError):
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        try:
+            member = self._members[name]
+        except KeyError:
+            raise KeyError("{}: not a slot: {}".format(self._instance.__class__.__name__, name))
+
+        member.__set__(self._instance, value)
+
+    def __delitem__(self, name):
+        try:
+            self._members[name].__delete__(self._instance)
+        except (KeyError, AttributeError):
+            raise KeyError(name)
+
+    def __iter__(self):
+        for name in self._members:
+            if name in self:
+                yield name
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+
+        return True
+
+    def __len__(self):
+        return sum( 1 for _ in self )
+
+
+class Slotted:
+    """
+    mixed into models with ``Meta.slots = True`` by
+    :class:`alkali.metamodel.MetaModel`, their field values, ``_dirty`` and
+    memoized properties live in slots instead of a ``__dict__``
+
+    a slotted instance can only hold its fields, so other constructor
+    keywords and :func:`alkali.query.Query.annotate` raise. since there's
+    no ``__dict__`` to share a :func:`Model.view` is a copy
+    """
+    __slots__ = ()
+
+    # name: member descriptor, set by MetaModel
+    _slot_members = {}
+
+    @property
+    def __dict__(self):
+        return SlotDict(self)
+
+    def __setattr__(self, name, value):
+        if not hasattr(type(self), name):
+            raise AttributeError("{}: slotted instances only hold fields, can't set: {}".format(
+                self.__class__.__name__, name))
+
+        object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        cls = self.__class__
+        new = cls.__new__(cls)
+        object.__setattr__(new, '_shared', False)
+
+        for member in cls._slot_members.values():
+            try:
+                member.__set__(new, member.__get__(self))
+            except AttributeError: # not set, eg. a memoized property
+                pass
+
+        return new
+
+    def __getstate__(self):
+        return dict(self.__dict__)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_shared', False)
+
+        for name, value in state.items():
+            self._slot_members[name].__set__(self, value)
+
+    def view(self):
+        return self.__copy__()
+
+
 class Model(metaclass=MetaModel):
     """
     main class for the database.
@@ -32,22 +133,75 @@ class Model(metaclass=MetaModel):
     see :mod:`alkali.database` for some example code
     """
 
+    # _shared lives outside of __dict__ because it says whether __dict__
+    # belongs to someone else, see view()
+    __slots__ = ('__dict__', '_shared')
+
     def __init__(self, *args, **kw):
         # MetaModel.__call__ has put fields in self,
         # put any other keywords into self
         for name, value in kw.items():
             setattr(self, name, value)
 
-        # note, this is called twice, once during initial object creation
-        # and then again when this object is copied during a save
-        signals.creation.send(self.__class__, instance=self)
+        # note, copies don't come through here so this is only sent once
+        if signals.creation.has_receivers_for(self.__class__):
+            signals.creation.send(self.__class__, instance=self)
 
-    # called via copy.copy() module, when getting from manager
+    # called via copy.copy() module, when saving to manager
     def __copy__(self):
-        new = type(self)()
-        new.__dict__.update(self.__dict__)
+        return self._clone(dict(self.__dict__), False)
+
+    def _clone(self, values, shared):
+        """
+        return a new instance holding ``values`` without going through
+        :func:`alkali.metamodel.MetaModel.__call__`
+        """
+        new = self.__class__.__new__(self.__class__)
+        object.__setattr__(new, '__dict__', values)
+        object.__setattr__(new, '_shared', shared)
         return new
 
+    # pickle and copy.deepcopy(), object's versions go through __setattr__
+    # before _shared is set
+    def __getstate__(self):
+        return dict(self.__dict__)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '__dict__', dict(state))
+        object.__setattr__(self, '_shared', False)
+
+    def view(self):
+        """
+        return a copy-on-write copy of this instance. the copy shares our
+        ``__dict__`` until the first time it's written to. this is how
+        :class:`alkali.manager.Manager` and :class:`alkali.query.Query` hand
+        out their instances, it costs one small object per instance.
+
+        **warning**: the view sees any changes made to this instance, so
+        only make views of instances that don't change (ie. owned by
+        a Manager)
+        """
+        return self._clone(self.__dict__, True)
+
+    def _unshare(self):
+        """
+        give ourselves a private ``__dict__`` before it's written to
+        """
+        object.__setattr__(self, '__dict__', dict(self.__dict__))
+        object.__setattr__(self, '_shared', False)
+
+    def __setattr__(self, name, value):
+        if self._shared:
+            self._unshare()
+
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if self._shared:
+            self._unshare()
+
+        object.__delattr__(self, name)
+
     def __repr__(self):
         return "<{}: {}>".format(self.__class__.__name__, self.pk)
 
@@ -73,6 +227,9 @@ class Model(metaclass=MetaModel):
         # if we're setting a field value and that value is different
         # than current value, mark self as modified
 
+        if self._shared:
+            self._unshare()
+
         curr_val = getattr(self, field.name)
 
         # do not let user change pk after it has been set
@@ -85,13 +242,21 @@ class Model(metaclass=MetaModel):
 
         if curr_val != value:
             self.__dict__['_dirty'] = True
-            signals.field_update.send(self.__class__, field=field.name, old_val=curr_val, new_val=value)
+            if signals.field_update.has_receivers_for(self.__class__):
+                signals.field_update.send(self.__class__, field=field.name, old_val=curr_val, new_val=value)
+
+    def _stamp(self):
+        """
+        set our ``auto_now`` fields to the current time, called by
+        :func:`alkali.manager.Manager.save` when a changed instance is saved
+        """
+        if self._shared:
+            self._unshare()
+
+        now = tznow()
 
-        # call any auto fields on this model
-        if self.__dict__['_dirty']:
-            for name, field_class in self.Meta.fields.items():
-                if getattr(field_class, 'auto_now', False):
-                    self.__dict__[name] = tznow()
+        for name in self.Meta.auto_now_fields:
+            self.__dict__[name] = now
 
     @property
     def dirty(self):
@@ -27,8 +27,16 @@ import types
 import operator
 import collections
 import copy
+import functools
+import heapq
+import itertools
+import keyword
+import math
 import re
 
+from .index import SortedIndex
+from . import fields as _fields
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -36,40 +44,730 @@ logger = logging.getLogger(__name__)
 class Aggregate:
     """
     A reducing function that returns a single value
+
+    aggregates are computed a value at a time via an accumulator
+    so any number of them can be computed in a single pass over
+    a query, see :func:`alkali.query.Query.aggregate`
     """
+
+    # does the accumulator need the field value of each instance
+    needs_value = True
+
     def __init__(self, field):
         """
         :param field str:
         """
         self.field = field
 
+    def __call__(self, query):
+        return query.aggregate(result=self)['result']
+
+    @property
+    def name(self):
+        """
+        **property**: used in the default key of :func:`alkali.query.Query.aggregate`
+        """
+        return self.__class__.__name__.lower()
+
+    def accumulator(self):
+        """
+        return a new accumulator, an object with an ``add(value)`` method
+        that is called with the field value of each instance and a
+        ``result(count)`` method that returns the aggregate given the
+        number of instances
+        """
+        return self.Accumulator()
+
 class Count(Aggregate):
     """
     number of objects in query
     """
-    def __call__(self, query):
-        return len( query )
+    needs_value = False
+
+    class Accumulator:
+        __slots__ = ()
+
+        def result(self, count):
+            return count
 
 class Sum(Aggregate):
     """
     sum of given field (numeric field required)
     """
-    def __call__(self, query):
-        return sum( query.values_list(self.field, flat=True) )
+    class Accumulator:
+        __slots__ = ('total',)
+
+        def __init__(self):
+            self.total = 0
+
+        def add(self, value):
+            self.total += value
+
+        def result(self, count):
+            return self.total
 
 class Max(Aggregate):
     """
     largest field (numeric field required)
     """
-    def __call__(self, query):
-        return max( query.values_list(self.field, flat=True) )
+    class Accumulator:
+        __slots__ = ('value', 'empty')
+
+        def __init__(self):
+            self.value = None
+            self.empty = True
+
+        def add(self, value):
+            if self.empty or value > self.value:
+                self.value = value
+                self.empty = False
+
+        def result(self, count):
+            if self.empty:
+                raise ValueError("max() arg is an empty sequence")
+            return self.value
 
 class Min(Aggregate):
     """
     smallest field (numeric field required)
     """
-    def __call__(self, query):
-        return min( query.values_list(self.field, flat=True) )
+    class Accumulator(Max.Accumulator):
+        __slots__ = ()
+
+        def add(self, value):
+            if self.empty or value < self.value:
+                self.value = value
+                self.empty = False
+
+        def result(self, count):
+            if self.empty:
+                raise ValueError("min() arg is an empty sequence")
+            return self.value
+
+class Avg(Aggregate):
+    """
+    mean of given field (numeric field required), ``None`` if query is empty
+    """
+    class Accumulator:
+        __slots__ = ('total', 'n')
+
+        def __init__(self):
+            self.total = 0
+            self.n = 0
+
+        def add(self, value):
+            self.total += value
+            self.n += 1
+
+        def result(self, count):
+            if not self.n:
+                return None
+            return self.total / self.n
+
+class Variance(Aggregate):
+    """
+    variance of given field (numeric field required), ``None`` if
+    there are too few values
+    """
+    def __init__(self, field, sample=False):
+        """
+        :param field str:
+        :param bool sample: sample variance if True, population if False
+        """
+        super().__init__(field)
+        self.sample = sample
+
+    def accumulator(self):
+        return self.Accumulator(self.sample)
+
+    class Accumulator:
+        "Welford's online algorithm, numerically stable in one pass"
+        __slots__ = ('sample', 'n', 'mean', 'm2')
+
+        def __init__(self, sample):
+            self.sample = sample
+            self.n = 0
+            self.mean = 0.0
+            self.m2 = 0.0
+
+        def add(self, value):
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (value - self.mean)
+
+        def result(self, count):
+            n = self.n - 1 if self.sample else self.n
+            if n <= 0:
+                return None
+            return self.m2 / n
+
+class StdDev(Variance):
+    """
+    standard deviation of given field (numeric field required), ``None`` if
+    there are too few values
+    """
+    class Accumulator(Variance.Accumulator):
+        __slots__ = ()
+
+        def result(self, count):
+            variance = super().result(count)
+            if variance is None:
+                return None
+            return math.sqrt(variance)
+
+class CountDistinct(Aggregate):
+    """
+    number of distinct values of given field
+
+    **note**: memory use grows with the number of distinct values
+    """
+    class Accumulator:
+        __slots__ = ('values',)
+
+        def __init__(self):
+            self.values = set()
+
+        def add(self, value):
+            self.values.add(value)
+
+        def result(self, count):
+            return len(self.values)
+
+class Percentile(Aggregate):
+    """
+    the value below which ``percent`` of the field values fall, linearly
+    interpolated between the closest values (numeric field required),
+    ``None`` if the query is empty
+
+    **note**: this is exact so it has to hold on to every value
+
+    ::
+
+        MyModel.objects.aggregate( Percentile('ms', 0.95) )
+        # { 'ms__percentile_95': 340.5 }
+    """
+    def __init__(self, field, percent):
+        """
+        :param field str:
+        :param float percent: between 0 and 1
+        """
+        assert 0 <= percent <= 1, "percent must be between 0 and 1"
+        super().__init__(field)
+        self.percent = percent
+
+    @property
+    def name(self):
+        return 'percentile_{:g}'.format(self.percent * 100)
+
+    def accumulator(self):
+        return self.Accumulator(self.percent)
+
+    class Accumulator:
+        __slots__ = ('percent', 'values')
+
+        def __init__(self, percent):
+            self.percent = percent
+            self.values = []
+
+        def add(self, value):
+            self.values.append(value)
+
+        def result(self, count):
+            if not self.values:
+                return None
+
+            self.values.sort()
+
+            pos = (len(self.values) - 1) * self.percent
+            lo = math.floor(pos)
+            hi = math.ceil(pos)
+
+            if lo == hi:
+                return self.values[lo]
+
+            return self.values[lo] + (self.values[hi] - self.values[lo]) * (pos - lo)
+
+class Median(Percentile):
+    """
+    the middle value of given field, see :class:`alkali.query.Percentile`
+    """
+    def __init__(self, field):
+        super().__init__(field, 0.5)
+
+    @property
+    def name(self):
+        return 'median'
+
+
+class _Accumulators:
+    """
+    the accumulators of a list of aggregates, instances are added
+    one at a time
+    """
+
+    def __init__(self, aggregates):
+        self.accumulators = [agg.accumulator() for agg in aggregates]
+        self.count = 0
+
+        # only get each field value once per instance
+        adders = collections.OrderedDict()
+        for agg, acc in zip(aggregates, self.accumulators):
+            if agg.needs_value:
+                adders.setdefault(agg.field, []).append(acc.add)
+
+        self.getters = [(operator.attrgetter(field), adds) for field, adds in adders.items()]
+
+    def add(self, elem):
+        for get, adds in self.getters:
+            value = get(elem)
+            for add in adds:
+                add(value)
+
+        self.count += 1
+
+    def extend(self, instances):
+        if len(self.getters) == 1 and len(self.getters[0][1]) == 1:
+            get, (add,) = self.getters[0]
+
+            for elem in instances:
+                add(get(elem))
+                self.count += 1
+        else:
+            for elem in instances:
+                self.add(elem)
+
+    def results(self):
+        return [acc.result(self.count) for acc in self.accumulators]
+
+
+def _aggregate(instances, aggregates):
+    """
+    compute all ``aggregates`` in a single pass over ``instances``
+
+    :param instances: iterable of model instances
+    :param aggregates: list of :class:`alkali.query.Aggregate`
+    :rtype: ``list`` of results, in the same order as ``aggregates``
+    """
+    accumulators = _Accumulators(aggregates)
+    accumulators.extend(instances)
+    return accumulators.results()
+
+def _aggregate_keys(args, kw):
+    """
+    return the result keys and the aggregates for ``aggregate(*args, **kw)``
+    """
+    keys = ['{}__{}'.format(agg.field, agg.name) for agg in args]
+    keys.extend( kw.keys() )
+
+    return keys, list(args) + list(kw.values())
+
+def _called(aggregates):
+    """
+    split off the aggregates that implement their own ``__call__(query)``
+    instead of an accumulator, they're computed by calling them
+
+    :rtype: ``dict`` of position: aggregate, ``list`` of the others
+    """
+    called = {
+        i: agg for i, agg in enumerate(aggregates)
+        if type(agg).__call__ is not Aggregate.__call__
+    }
+    others = [agg for i, agg in enumerate(aggregates) if i not in called]
+
+    return called, others
+
+def _merge(query, called, results):
+    """
+    put the results of calling the ``called`` aggregates with ``query``
+    back in their place amongst the accumulated ``results``
+    """
+    results = list(results)
+
+    for i in sorted(called):
+        results.insert( i, called[i](query) )
+
+    return results
+
+
+class Groups(collections.abc.Mapping):
+    """
+    the result of :func:`alkali.query.Query.group_by`, a mapping of
+    distinct field value to a :class:`alkali.query.Query` holding
+    the instances with that value
+
+    the groups are only built when first looked at, :func:`Groups.aggregate`
+    doesn't need them at all.
+    """
+
+    def __init__(self, query, field):
+        """
+        :param Query query: the query being grouped
+        :param str field: field name
+        """
+        self._query = query
+        self._field = field
+        self._groups = None
+
+    def __repr__(self):
+        return "<Groups: {}>".format(self._field)
+
+    @property
+    def groups(self):
+        """
+        **property**: ``dict`` of value: :class:`alkali.query.Query`
+        """
+        if self._groups is None:
+            get = operator.attrgetter(self._field)
+            groups = {}
+
+            # keep query order within each group
+            for elem in self._query._instances:
+                value = get(elem)
+
+                try:
+                    groups[value].append(elem)
+                except KeyError:
+                    groups[value] = [elem]
+
+            self._groups = {
+                value: self._query._derive(elems) for value, elems in groups.items()
+            }
+
+        return self._groups
+
+    def __getitem__(self, value):
+        return self.groups[value]
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def aggregate(self, *args, **kw):
+        """
+        :func:`alkali.query.Query.aggregate` for every group, in a single
+        pass over the query
+
+        :rtype: ``dict`` of value: ``dict`` of aggregates
+
+        ::
+
+            MyModel.objects.group_by('str_type').aggregate( Sum('size') )
+            # { 's1': {'size__sum': 1024}, 's2': {'size__sum': 2048} }
+        """
+        keys, aggregates = _aggregate_keys(args, kw)
+        called, aggregates = _called(aggregates)
+
+        get = operator.attrgetter(self._field)
+        groups = {}
+
+        self._query._execute(order=False)
+
+        for elem in self._query._elems:
+            value = get(elem)
+
+            try:
+                accumulators = groups[value]
+            except KeyError:
+                accumulators = groups[value] = _Accumulators(aggregates)
+
+            accumulators.add(elem)
+
+        ret = {}
+
+        for value, accumulators in groups.items():
+            results = accumulators.results()
+
+            if called:
+                results = _merge(self[value], called, results)
+
+            ret[value] = dict( zip(keys, results) )
+
+        return ret
+
+
+class Q:
+    """
+    a filter expression that can be combined with ``&`` (and), ``|`` (or)
+    and ``~`` (not). keyword arguments are the same as
+    :func:`alkali.query.Query.filter` and are and'ed together.
+
+    ::
+
+        MyModel.objects.filter( Q(str_type='foo') | Q(int_type__gt=5) )
+        MyModel.objects.filter( ~Q(str_type__in=['foo', 'bar']), int_type__lt=2 )
+    """
+
+    def __init__(self, *args, **kw):
+        """
+        :param Q args: sub-expressions
+        :param kw: ``field_name__op=value``
+        """
+        self.connector = 'and'
+        self.negated = False
+        self.children = list(args) # Q objects and (field, oper, value) tuples
+
+        for lookup, value in kw.items():
+            try:
+                field, oper = lookup.split('__')
+                oper = oper or 'eq'
+            except ValueError: # no __ in field name
+                field = lookup
+                oper = 'eq'
+
+            # an iterator can only be looked at once
+            if isinstance(value, collections.abc.Iterator):
+                value = list(value)
+
+            self.children.append( (field, oper, value) )
+
+    def __repr__(self):
+        def fmt(child):
+            if isinstance(child, Q):
+                return repr(child)
+            return "{}__{}={!r}".format(*child)
+
+        sep = " {} ".format(self.connector.upper())
+        ret = "({})".format(sep.join(map(fmt, self.children)))
+
+        if self.negated:
+            ret = "NOT " + ret
+
+        return ret
+
+    def __and__(self, other):
+        return Q(self, other)
+
+    def __or__(self, other):
+        q = Q(self, other)
+        q.connector = 'or'
+        return q
+
+    def __invert__(self):
+        q = Q(self)
+        q.negated = True
+        return q
+
+    @property
+    def lookups(self):
+        """
+        **property**: the ``(field, oper, value)`` tuples in this expression,
+        in the order they're evaluated
+
+        :rtype: ``list``
+        """
+        ret = []
+
+        for child in self.children:
+            if isinstance(child, Q):
+                ret.extend(child.lookups)
+            else:
+                ret.append(child)
+
+        return ret
+
+    @property
+    def signature(self):
+        """
+        **property**: the shape of this expression, ie. everything except
+        the values being compared against
+
+        :rtype: ``tuple``
+        """
+        children = tuple(
+            child.signature if isinstance(child, Q) else child[:2]
+            for child in self.children
+        )
+
+        return (self.connector, self.negated, children)
+
+    def compile(self):
+        """
+        return a function that takes a model instance and returns True
+        if it passes this expression
+
+        the function is generated once per :attr:`signature` and the
+        values are prepared (eg. regexes compiled) once per call, so
+        evaluating it on an instance doesn't have to reparse anything.
+        """
+        signature = self.signature
+
+        try:
+            factory = _factories[signature]
+        except KeyError:
+            factory = _factories[signature] = _make_factory(signature)
+
+        params = []
+        for _, oper, value in self.lookups:
+            params.extend( _prepare(oper, value) )
+
+        return factory(*params)
+
+
+# signature: predicate factory, see Q.compile()
+_factories = {}
+
+_comparisons = {
+    'eq': '==', 'ne': '!=',
+    'lt': '<', 'le': '<=',
+    'gt': '>', 'ge': '>=',
+}
+
+def _in(coll, val):
+    if not isinstance(coll, str) \
+    and isinstance(coll, collections.abc.Iterable):
+        return bool( set(coll) & set(val) ) # intersection
+    else:
+        return coll in val
+
+def _in_set(coll, val):
+    "same as _in but val is a prebuilt frozenset"
+    if not isinstance(coll, str) \
+    and isinstance(coll, collections.abc.Iterable):
+        return not val.isdisjoint(coll)
+
+    try:
+        return coll in val
+    except TypeError: # unhashable, do it the slow way
+        return any( coll == v for v in val )
+
+def _rin(coll, val):
+    if not isinstance(val, str) \
+    and isinstance(val, collections.abc.Iterable):
+        return bool( set(coll) & set(val) ) # intersection
+    else:
+        return val in coll
+
+def _rin_set(coll, val):
+    "same as _rin but val is a prebuilt frozenset"
+    return not val.isdisjoint(coll)
+
+def _prepare(oper, value):
+    """
+    return the ``(value, function)`` pair the generated predicate
+    uses to evaluate ``field__oper=value``
+    """
+    # TODO: exact, iexact, (i)contains == rin, (i)startswith, (i)endswith,
+    # range (for dates), date (return datetime as date), year/month/day,
+    # hour/minute/second, week_day (sun=1, sat=7)
+
+    if oper in _comparisons:
+        return value, None
+
+    if oper in ('re', 'rei'):
+        if not isinstance(value, re.Pattern):
+            flags = re.UNICODE | (re.IGNORECASE if oper == 'rei' else 0)
+            value = re.compile(value, flags)
+        return value, None
+
+    if oper == 'in':
+        assert isinstance(value, collections.abc.Iterable)
+
+        if not isinstance(value, str):
+            try:
+                return frozenset(value), _in_set
+            except TypeError: # unhashable
+                pass
+
+        return value, _in
+
+    if oper == 'rin':
+        if not isinstance(value, str) \
+        and isinstance(value, collections.abc.Iterable):
+            try:
+                return frozenset(value), _rin_set
+            except TypeError: # unhashable
+                pass
+
+        return value, _rin
+
+    return value, getattr(operator, oper)
+
+def _make_factory(signature):
+    """
+    generate the source of a function that builds predicates for
+    expressions shaped like ``signature`` and compile it
+    """
+    counter = itertools.count()
+
+    def attr(field):
+        if field.isidentifier() and not keyword.iskeyword(field):
+            return "e.{}".format(field)
+        return "getattr(e, {!r})".format(field)
+
+    def expr(node):
+        connector, negated, children = node
+        terms = []
+
+        for child in children:
+            if len(child) == 3: # sub-expression
+                terms.append( expr(child) )
+                continue
+
+            field, oper = child
+            i = next(counter)
+
+            if oper in _comparisons:
+                term = "{} {} v{}".format(attr(field), _comparisons[oper], i)
+            elif oper in ('re', 'rei'):
+                term = "v{}.search({})".format(i, attr(field))
+            else:
+                term = "f{}({}, v{})".format(i, attr(field), i)
+
+            terms.append( "({})".format(term) )
+
+        if terms:
+            ret = " {} ".format(connector).join(terms)
+        else:
+            ret = "True" if connector == 'and' else "False"
+
+        if negated:
+            ret = "not ({})".format(ret)
+
+        return "({})".format(ret)
+
+    body = expr(signature)
+    params = ", ".join( "v{0}, f{0}".format(i) for i in range(next(counter)) )
+
+    source = "def factory({}):\n    return lambda e: {}\n".format(params, body)
+
+    namespace = {}
+    exec(compile(source, '<alkali.query.Q>', 'exec'), namespace)
+    return namespace['factory']
+
+
+@functools.total_ordering
+class _Reversed:
+    """
+    sort key wrapper that reverses the order of the wrapped value, lets
+    one key sort some fields ascending and others descending
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+def _order_by( field ):
+    "return reversed, field_name"
+    if field.startswith('-'):
+        return True, field[1:]
+    else:
+        return False, field
+
+def _nulls_last(getter):
+    "return a key function that sorts None after everything else"
+    def key(e):
+        value = getter(e)
+        return (value is None, value)
+    return key
 
 
 # def copy_instances(func):
@@ -106,32 +804,106 @@ class Query:
         """
         self.manager = manager
 
-        # THINK: Query should work on the keys of manager instances,
-        # this might save a copy or two, then only dereferencing a query
-        # should return a copy. If we ever get multiple indexes then
-        # that might also dramatically speed up queries
-
         # THINK: I tried really hard to make Query._instances an
         # manager._instances.itervalues() but this is fraught with
         # peril. You have to convert to a list to get it's length, you
         # have to convert to a list to get __getitem__, and if you
         # iterate over it once then it's "empty" if you need to do so
-        # again. I'm afraid that for now each Query object needs to get
-        # a copy of the Manager values. Note, you still need to copy the
-        # individual elements as they leave the Query.
-        self._instances = list(manager._instances.values())
-        self.order_by('pk')
+        # again. Note, you still need to copy the individual elements
+        # as they leave the Query, see Model.view()
+        #
+        # Manager gives us a copy-on-write view of its instances so we
+        # don't change when it does. filter() and order_by() only record
+        # what to do, the plan is run (once) when the results are first
+        # needed. see _execute()
+        self._source = manager._snapshot()
+        self._released = False  # have we given _source back, see _release()
+        self._elems = None      # results of the plan so far, None if never run
+        self._filters = []      # pending Q expressions
+        self._orderings = []    # pending order_by() fields
+
+    def _release(self):
+        """
+        give our manager's snapshot back once we have our results, see
+        :func:`alkali.manager.Manager._release`
 
+        a query that answered from indexes or columns without running its
+        plan sees the manager as it is if it's run later
+        """
+        if not self._released:
+            self._released = True
+            self.manager._release(self._source)
+
+    @property
+    def _instances(self):
+        """
+        the list of model instances this query currently holds
+        """
+        self._execute()
+        return self._elems
+
+    @_instances.setter
+    def _instances(self, instances):
+        self._elems = instances
+
+    def _execute(self, order=True):
+        """
+        run the pending plan: a single filtering pass over our instances,
+        starting from an index if possible, then sort the survivors
+
+        :param bool order: also sort, not needed if caller doesn't care
+            about the order of the results
+        """
+        if self._elems is None or self._filters:
+            filters, self._filters = self._filters, []
+            q = filters[0] if len(filters) == 1 else Q(*filters)
+
+            exact = False
+            first = self._elems is None
+
+            if first:
+                pks = self._index_lookup(q) if filters else None
+
+                if pks is None and filters:
+                    pks, exact = self._column_lookup(q)
+
+                if pks is None:
+                    elems = self._source.values()
+                else:
+                    elems = [self._source[pk] for pk in pks]
+
+                self._orderings.insert(0, self.model_class.Meta.pk_fields.keys())
+            else:
+                elems = self._elems
+
+            if filters and not exact:
+                elems = filter(q.compile(), elems)
+
+            self._elems = list(elems)
+
+            # we hold our results now, the manager can stop copy-on-write
+            if first:
+                self._release()
+
+        if order and self._orderings:
+            orderings, self._orderings = self._orderings, []
+
+            key, reverse = self._order_key(orderings)
+            self._elems = sorted(self._elems, key=key, reverse=reverse)
 
     def __len__(self):
-        return len(self._instances)
+        self._execute(order=False)
+        return len(self._elems)
 
     def __iter__(self):
         for elem in self._instances:
-            yield copy.copy(elem)
+            yield elem.view()
 
     def __getitem__(self, i):
-        return copy.copy(self._instances[i])
+        if isinstance(i, slice):
+            return [ elem.view() for elem in self._instances[i] ]
+
+        return self._instances[i].view()
 
     def __str__(self):
         return "<Query: {}>".format(", ".join([str(q) for q in self]))
@@ -171,13 +943,14 @@ class Query:
     def all(self):
         return self
 
-    def filter(self, **kw):
+    def filter(self, *args, **kw):
         """
+        :param args: :class:`alkali.query.Q` expressions
         :param kw: ``field_name__op=value``, note: ``field_name`` can be a ``property``
         :rtype: Query
 
         perform a query, keeping model instances that pass the criteria specified
-        in the ``kw`` parameter.
+        in the ``args`` and ``kw`` parameters.
 
         see example code above. see Django page for very thorough docs on
         this functionality. basically, its field_name '__' operation = value.
@@ -189,63 +962,111 @@ class Query:
 
             # 'foo' is in field/property myset
             MyModel.objects.filter( myset__rin='foo' )
+
+            # f is 'foo' or g is greater than 5
+            MyModel.objects.filter( Q(f='foo') | Q(g__gt=5) )
         """
-        for field, query in kw.items():
-            try:
-                field, oper = field.split('__')
-                oper = oper or 'eq'
-            except ValueError: # no __ in field name
-                field = field
-                oper = 'eq'
+        q = Q(*args, **kw)
+
+        # make sure the expression is valid now and not when it's run
+        for _, oper, value in q.lookups:
+            if oper == 'in':
+                assert isinstance(value, collections.abc.Iterable)
+            elif oper not in _comparisons and oper not in ('re', 'rei', 'rin'):
+                getattr(operator, oper)
 
-            self._instances = self._filter(field, oper, query, self._instances)
+        if q.children:
+            self._filters.append(q)
 
         return self
 
-    @as_list
-    def _filter(self, field, oper, value, instances):
+    def _index_lookup(self, q):
         """
-        helper function that does the actual work of filtering out instances
+        helper function that asks our manager's indexes for the primary keys
+        that may satisfy ``q``
+
+        :rtype: ``set`` of primary keys or ``None`` if no index applies
         """
+        # indexes describe the manager's current instances, if the manager
+        # has changed since we were created then they're not ours
+        if self._source is not self.manager._instances:
+            return None
 
-        def in_(coll, val):
-            if not isinstance(coll, str) \
-            and isinstance(coll, collections.abc.Iterable):
-                return bool( set(coll) & set(val) ) # intersection
-            else:
-                return coll in val
+        return self._q_index_lookup(q)
+
+    def _columns(self):
+        """
+        return our manager's :class:`alkali.columnar.ColumnStore` if it has
+        one and it still describes our instances, ie. the plan hasn't run
+        and the manager hasn't changed since we were created
+        """
+        if self._elems is not None or self._source is not self.manager._instances:
+            return None
+
+        return self.manager.columns
+
+    def _pending(self):
+        """
+        return our pending filters as a single :class:`alkali.query.Q` or
+        ``None`` if there aren't any
+        """
+        if not self._filters:
+            return None
+
+        return self._filters[0] if len(self._filters) == 1 else Q(*self._filters)
+
+    def _column_lookup(self, q):
+        """
+        helper function that evaluates ``q`` against our manager's columns
+
+        :rtype: ``(pks, exact)``, ``pks`` is ``None`` if no column applies
+        """
+        columns = self._columns()
+
+        if columns is None:
+            return None, False
+
+        found = columns.select(q)
+
+        if found is None:
+            return None, False
+
+        return found
 
-        def rin_(coll, val):
-            if not isinstance(val, str) \
-            and isinstance(val, collections.abc.Iterable):
-                return bool( set(coll) & set(val) ) # intersection
+    def _q_index_lookup(self, q):
+        if q.negated:
+            return None
+
+        if q.connector == 'and':
+            leaves = [child for child in q.children if not isinstance(child, Q)]
+            pks = self.manager._index_lookup(leaves) if leaves else None
+
+            for child in q.children:
+                if not isinstance(child, Q):
+                    continue
+
+                found = self._q_index_lookup(child)
+
+                if found is not None:
+                    pks = found if pks is None else pks & found
+
+            return pks
+
+        # or: every branch needs an index
+        pks = set()
+
+        for child in q.children:
+            if isinstance(child, Q):
+                found = self._q_index_lookup(child)
             else:
-                return val in coll
-
-        def regex(coll, val):
-            return re.search(val, coll, re.UNICODE)
-
-        def regexi(coll, val):
-            return re.search(val, coll, re.UNICODE | re.IGNORECASE)
-
-        if oper == 'in':
-            assert isinstance(value, collections.abc.Iterable)
-            oper = in_
-        elif oper == 'rin':
-            assert isinstance(field, collections.abc.Iterable)
-            oper = rin_
-        elif oper == 're':
-            oper = regex
-        elif oper == 'rei':
-            oper = regexi
-        else:
-            oper = getattr(operator, oper)
+                found = self.manager._index_lookup([child])
+
+            if found is None:
+                return None
 
-        # TODO: exact, iexact, (i)contains == rin, (i)startswith, (i)endswith,
-        # range (for dates), date (return datetime as date), year/month/day,
-        # hour/minute/second, week_day (sun=1, sat=7)
+            pks |= found
 
-        return filter( lambda e: oper(getattr(e, field), value), instances)
+        return pks
 
     def order_by(self, *fields):
         """
@@ -255,34 +1076,73 @@ class Query:
             indicate reverse order
         :rtype: Query
 
-        **warning**: because this isn't a real database and we don't have
-        grouping, passing in multiple fields will very possibly sort
-        on the last field only. python sorting is stable however, so a
-        multiple field sort may work as intended.
+        the first field takes precedence, the next fields only break ties.
+        calling ``order_by`` again sorts by the new fields first and then
+        by the previous order. ties are finally broken by primary key.
+
+        ``None`` sorts after all other values, so first if the field is
+        reversed.
+
+        ::
+
+            # newest first, same dates ordered by title
+            MyModel.objects.order_by('-date', 'title')
         """
-        def _order_by( field ):
-            "return reversed, field_name"
-            if field.startswith('-'):
-                return True, field[1:]
-            else:
-                return False, field
+        if not fields:
+            return self
 
         if fields == ('pk',):
             fields = self.model_class.Meta.pk_fields.keys()
 
-        for field in fields:
-            reverse, field = _order_by( field )
-            key = operator.attrgetter(field)
-            self._instances = sorted(self._instances, key=key, reverse=reverse)
-
+        self._orderings.append(fields)
         return self
 
+    @staticmethod
+    def _order_key(orderings):
+        """
+        helper function that returns a ``(key, reverse)`` pair to sort
+        by all of ``orderings`` in a single pass
+
+        :param orderings: list of order_by() field lists, oldest first
+        """
+        ordering = []
+        seen = set()
+
+        # the newest order_by() call takes precedence
+        for fields in reversed(orderings):
+            for field in fields:
+                reverse, field = _order_by( field )
+
+                # later appearances of a field can't change anything
+                if field not in seen:
+                    seen.add(field)
+                    ordering.append( (reverse, field) )
+
+        # if everything is descending then sort ascending and reverse that
+        reverse = all( r for r, _ in ordering )
+
+        keys = []
+        for field_reversed, field in ordering:
+            key = _nulls_last( operator.attrgetter(field) )
+
+            if field_reversed and not reverse:
+                key = lambda e, key=key: _Reversed(key(e))
+
+            keys.append(key)
+
+        if len(keys) == 1:
+            return keys[0], reverse
+
+        return (lambda e: tuple(key(e) for key in keys)), reverse
+
     def group_by(self, field):
         """
-        returns a dict of distinct values and Query objects
+        returns a mapping of distinct values and Query objects, see
+        :class:`alkali.query.Groups`. only the instances in this query are
+        grouped.
 
         :param field: field name
-        :rtype: ``dict``
+        :rtype: :class:`alkali.query.Groups`
 
         ::
 
@@ -290,14 +1150,25 @@ class Query:
 
             { 's1': <Query MyModel(1), MyModel(3)>
               's2': <Query MyModel(2)> }
+
+            MyModel.objects.group_by('str_type').aggregate(Count('int_type'))
+
+            { 's1': {'int_type__count': 2},
+              's2': {'int_type__count': 1} }
+        """
+        return Groups(self, field)
+
+    def _derive(self, instances):
+        """
+        return a new Query that holds ``instances``, which must already
+        be in order
         """
-        def _filter(value):
-            # need to start with a fresh query object to work with all objects
-            return Query(self.manager).filter(**{field: value})
+        query = Query(self.manager)
+        query._release()
+        query._source = self._source
+        query._elems = instances
 
-        values = self.distinct(field)[0]
-        groups = { value: _filter(value) for value in values }
-        return groups
+        return query
 
     @as_list
     def limit(self, n):
@@ -308,15 +1179,78 @@ class Query:
         list of instances and not a Query. passing in 0 is a no-op and
         returns all instances
 
+        only the instances that can be in the result get sorted, see
+        :func:`Query._top`
+
         :param int n: non-zero integer
         :rtype: ``list``
         """
+        view = operator.methodcaller('view')
+
+        if n == 0: # return all instead of [] because why not?
+            return map(view, self._instances)
+
+        elems = self._top(n)
+
+        if elems is None:
+            elems = self._instances
+
         if n > 0:
-            return map(copy.copy, self._instances[:n])
-        elif n < 0:
-            return map(copy.copy, self._instances[n:])
-        else: # n == 0, return all instead of [] because why not?
-            return map(copy.copy, self._instances)
+            return map(view, elems[:n])
+        else:
+            return map(view, elems[n:])
+
+    def _top(self, n):
+        """
+        helper function that returns, in order, a list of instances that
+        contains the first (n > 0) or last (n < 0) ``n`` results, without
+        sorting all of our instances.
+
+        the candidates are selected with a bounded heap, or from the
+        :class:`alkali.index.SortedIndex` of the field that dominates the
+        ordering if there is one. candidates that tie with the n-th
+        one are kept so ties are broken the same way as sorting
+        everything would.
+
+        :rtype: ``list`` or ``None`` if we're already ordered or selecting
+            wouldn't save anything
+        """
+        k = abs(n)
+        candidates = None
+
+        if self._elems is None and not self._filters \
+        and self._source is self.manager._instances:
+            orderings = [self.model_class.Meta.pk_fields.keys()] + self._orderings
+            reverse, field = _order_by( orderings[-1][0] )
+
+            index = self.manager._indexes.get(field)
+
+            if isinstance(index, SortedIndex) \
+            and not isinstance(self.fields[field], _fields.ForeignKey):
+                pks = index.first(k, reverse != (n < 0))
+
+                if pks is not None:
+                    candidates = [self._source[pk] for pk in pks]
+                    self._release()
+
+        if candidates is not None:
+            key, reverse = self._order_key(orderings)
+        else:
+            self._execute(order=False)
+
+            if not self._orderings or k >= len(self._elems):
+                return None
+
+            key, reverse = self._order_key(self._orderings)
+
+            if reverse != (n < 0):
+                kth = key( heapq.nlargest(k, self._elems, key=key)[-1] )
+                candidates = [e for e in self._elems if key(e) >= kth]
+            else:
+                kth = key( heapq.nsmallest(k, self._elems, key=key)[-1] )
+                candidates = [e for e in self._elems if key(e) <= kth]
+
+        return sorted(candidates, key=key, reverse=reverse)
 
     def first(self):
         """
@@ -324,7 +1258,7 @@ class Query:
         raise if query is empty
         """
         try:
-            return self[0]
+            return self.limit(1)[0]
         except IndexError:
             raise self.model_class.DoesNotExist()
 
@@ -368,6 +1302,17 @@ class Query:
         if not fields:
             fields = self.field_names
 
+        columns = self._columns() if not self._orderings else None
+        values = columns.values(self._pending(), fields) if columns is not None else None
+
+        if values is not None:
+            self._release()
+
+            if flat:
+                return [value for column in values for value in column]
+            else:
+                return [list(row) for row in zip(*values)]
+
         if flat:
             return [
                 getattr(e, field) for field in fields
@@ -395,7 +1340,10 @@ class Query:
         The returned dictionary has key ``<field_name>__<agg function>`` unless
         keyword is given.
 
-        :param Aggregate args: ``Count`` ``Sum`` ``Max`` ``Min``
+        All the aggregates are computed in a single pass over the query.
+
+        :param Aggregate args: ``Count`` ``Sum`` ``Max`` ``Min`` ``Avg``
+            ``Variance`` ``StdDev`` ``CountDistinct`` ``Percentile`` ``Median``
         :param kw: ``key_value=Aggregate``, note: ``field_name`` can be a ``property``
         :rtype: ``dict``
 
@@ -404,17 +1352,22 @@ class Query:
             MyModel.objects.aggregate( the_count=Count('id'), Sum('size') )
             # { 'the_count': 12, 'size__sum': 24957 }
         """
+        keys, aggregates = _aggregate_keys(args, kw)
+        called, aggregates = _called(aggregates)
 
-        ret = {}
+        columns = self._columns()
+        results = columns.aggregate(self._pending(), aggregates) if columns is not None else None
 
-        for agg in args:
-            key = '{}__{}'.format(agg.field, agg.__class__.__name__.lower())
-            ret[key] = agg(self)
+        if results is None:
+            self._execute(order=False)
+            results = _aggregate(self._elems, aggregates)
+        else:
+            self._release()
 
-        for field, agg in kw.items():
-            ret[field] = agg(self)
+        if called:
+            results = _merge(self, called, results)
 
-        return ret
+        return dict( zip(keys, results) )
 
     def annotate(self, **kw):
         """
@@ -435,8 +1388,15 @@ class Query:
             # [[10, 1], [11, 2]]
             MyModel.objects.annotate(counter=Counter).values_list('int_type','counter')
             # [[10, 3], [11, 4]]
+
+        models with ``Meta.slots = True`` can't be annotated, their
+        instances only hold their fields
         """
 
+        if self.model_class.Meta.slots:
+            raise TypeError( "{}: annotate() needs instances that can hold extra "
+                    "attributes, Meta.slots models can't".format(self.model_class.__name__) )
+
         # make sure instances are a copy so we don't annotate the originals
         self._instances = [copy.copy(obj) for obj in self._instances]
 
@@ -470,9 +1430,10 @@ class Query:
             # [[u'there', u'hi']]
         """
         ret = []
+        self._execute(order=False)
 
         for field in fields:
-            distinct = {getattr(elem, field) for elem in self._instances} # set
+            distinct = {getattr(elem, field) for elem in self._elems} # set
             ret.append( list(distinct) )
 
         return ret
@@ -1,4 +1,60 @@
-from blinker import signal
+import blinker
+
+
+class Signal(blinker.NamedSignal):
+    """
+    a blinker signal that remembers whether a sender has any receivers,
+    sending to nobody is a dict lookup instead of blinker's dispatch
+
+    the cache is cleared whenever a receiver is connected or disconnected
+    (including weak receivers that go away)
+
+    the hot paths check before building the keyword arguments::
+
+        if signals.creation.has_receivers_for(cls):
+            signals.creation.send(cls, instance=obj)
+    """
+
+    def __init__(self, name, doc=None):
+        super().__init__(name, doc)
+        self._has_receivers = {} # id(sender): bool
+
+    def has_receivers_for(self, sender):
+        try:
+            return self._has_receivers[id(sender)]
+        except KeyError:
+            # blinker's has_receivers_for() stays True after a sender's
+            # last receiver is disconnected, so look at the receivers
+            has = self._has_receivers[id(sender)] = any( True for _ in self.receivers_for(sender) )
+            return has
+
+    def send(self, *sender, **kw):
+        if not self.has_receivers_for(sender[0] if sender else None):
+            return []
+
+        return super().send(*sender, **kw)
+
+    def connect(self, receiver, *args, **kw):
+        receiver = super().connect(receiver, *args, **kw)
+        self._has_receivers.clear()
+        return receiver
+
+    def _disconnect(self, receiver_id, sender_id):
+        super()._disconnect(receiver_id, sender_id)
+        self._has_receivers.clear()
+
+    def _clear_state(self):
+        super()._clear_state()
+        self._has_receivers.clear()
+
+
+def signal(name, doc=None):
+    """
+    return the :class:`Signal` called ``name``, it's registered with
+    blinker so ``blinker.signal(name)`` is the same object
+    """
+    return blinker.default_namespace.setdefault(name, Signal(name, doc))
+
 
 model_creation = signal('model_creation', doc='called when a new Model class is created (not an instance)')
 creation       = signal('creation'      , doc='called when a new Model instance is created')
@@ -0,0 +1,409 @@
+"""
+a compact binary format that loads and stores without parsing text
+
+the file starts with a schema header built from ``Meta.fields`` so the
+records don't repeat field names::
+
+    b'ALKB' version:u8
+    field count:varint
+    per field: name length:varint, name:utf8, kind:u8
+
+and then one record per instance::
+
+    record length:varint
+    null bitmap: one bit per field, set if the value is None
+    the values of the non-None fields, in header order
+
+values are encoded by kind:
+
+* ``i`` int: zigzag varint, so any size of int
+* ``b`` bool: one byte
+* ``f`` float: 8 byte little-endian double
+* ``s`` str: length:varint, utf8
+* ``t`` datetime: zigzag varint microseconds since the epoch, zigzag
+  varint utc offset in microseconds
+* ``j`` anything else: the json of ``Field.dumps(value)``, as a ``s``
+"""
+
+import datetime as dt
+import json
+import struct
+
+from .file import FileStorage
+from .. import fields
+from ..utils import EPOCH, MICROSECOND
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'ALKB'
+VERSION = 1
+
+
+_double = struct.Struct('<d')
+
+
+class BinaryFormatError(ValueError):
+    """
+    the file isn't in our format or is truncated
+    """
+    pass
+
+
+def field_kind(field):
+    """
+    return the one letter encoding of given field
+
+    :param Field field:
+    :rtype: ``str``
+    """
+    if isinstance(field, fields.ForeignKey):
+        return field_kind(field.pk_field)
+
+    if isinstance(field, fields.BoolField):
+        return 'b'
+
+    if isinstance(field, fields.IntField):
+        return 'i'
+
+    if isinstance(field, fields.FloatField):
+        return 'f'
+
+    if isinstance(field, fields.DateTimeField):
+        return 't'
+
+    if isinstance(field, (fields.StringField, fields.UUIDField)):
+        return 's'
+
+    return 'j'
+
+
+def write_varint(out, n):
+    """
+    append unsigned int ``n`` to ``bytearray`` ``out``, 7 bits per byte
+    """
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+
+    out.append(n)
+
+def read_varint(data, pos):
+    """
+    :rtype: ``(value, pos after value)``
+    """
+    result = 0
+    shift = 0
+
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+
+        if not b & 0x80:
+            return result, pos
+
+        shift += 7
+
+def zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def unzigzag(z):
+    return -((z + 1) >> 1) if z & 1 else z >> 1
+
+
+def _write_int(out, value):
+    write_varint(out, zigzag(value))
+
+def _read_int(data, pos):
+    z, pos = read_varint(data, pos)
+    return unzigzag(z), pos
+
+def _write_bool(out, value):
+    out.append(1 if value else 0)
+
+def _read_bool(data, pos):
+    return data[pos] != 0, pos + 1
+
+def _write_float(out, value):
+    out += _double.pack(value)
+
+def _read_float(data, pos):
+    return _double.unpack_from(data, pos)[0], pos + 8
+
+def _write_str(out, value):
+    value = value.encode('utf-8')
+    write_varint(out, len(value))
+    out += value
+
+def _read_str(data, pos):
+    length, pos = read_varint(data, pos)
+    end = pos + length
+    return bytes(data[pos:end]).decode('utf-8'), end
+
+def _write_datetime(out, value):
+    value = value if value.tzinfo is not None else value.replace(tzinfo=dt.timezone.utc)
+    _write_int(out, (value - EPOCH) // MICROSECOND)
+    _write_int(out, value.utcoffset() // MICROSECOND)
+
+def _read_datetime(data, pos):
+    micros, pos = _read_int(data, pos)
+    offset, pos = _read_int(data, pos)
+
+    tz = dt.timezone(offset * MICROSECOND) if offset else dt.timezone.utc
+    return (EPOCH + micros * MICROSECOND).astimezone(tz), pos
+
+def _read_json(data, pos):
+    value, pos = _read_str(data, pos)
+    return json.loads(value), pos
+
+_readers = {
+    'i': _read_int,
+    'b': _read_bool,
+    'f': _read_float,
+    's': _read_str,
+    't': _read_datetime,
+    'j': _read_json,
+}
+
+_writers = {
+    'i': _write_int,
+    'b': _write_bool,
+    'f': _write_float,
+    's': _write_str,
+    't': _write_datetime,
+}
+
+
+class BinaryStorage(FileStorage):
+    """
+    save models in a compact binary format, see :mod:`alkali.storage.binary`
+
+    values are written as they're held by the model, so loading doesn't
+    have to parse text, eg. datetimes, and yields ready to use values
+    """
+    extension = 'bin'
+    binary = True
+
+    @staticmethod
+    def schema(model_class):
+        """
+        :rtype: ``list`` of ``(field name, kind)``
+        """
+        return [ (name, field_kind(field)) for name, field in model_class.Meta.fields.items() ]
+
+    def _header(self, schema):
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        write_varint(out, len(schema))
+
+        for name, kind in schema:
+            _write_str(out, name)
+            out.append(ord(kind))
+
+        return out
+
+    def _writers(self, model_class, schema):
+        ret = []
+
+        for name, kind in schema:
+            if kind == 'j':
+                field = model_class.Meta.fields[name]
+                write = lambda out, value, field=field: _write_str(out, json.dumps(field.dumps(value), default=list))
+            else:
+                write = _writers[kind]
+
+            ret.append( (name, write) )
+
+        return ret
+
+    def write(self, model_class, iterator):
+        if iterator is None:
+            return False
+
+        with self._open_write() as f:
+            self._write_records(f, model_class, iterator)
+
+        return True
+
+    def _write_records(self, f, model_class, iterator, on_record=None):
+        """
+        write the header and a record per instance
+
+        :param on_record: optional, called with each instance's ``__dict__``
+            and the offset of its record as they're written, the instance
+            isn't kept
+        """
+        schema = self.schema(model_class)
+        writers = self._writers(model_class, schema)
+        nbytes = (len(schema) + 7) // 8
+
+        header = self._header(schema)
+        f.write(header)
+        offset = len(header)
+
+        for e in iterator:
+            values = e.__dict__
+            nulls = 0
+            body = bytearray(nbytes)
+
+            for i, (name, write) in enumerate(writers):
+                value = values[name]
+
+                if value is None:
+                    nulls |= 1 << i
+                else:
+                    write(body, value)
+
+            body[:nbytes] = nulls.to_bytes(nbytes, 'little')
+
+            record = bytearray()
+            write_varint(record, len(body))
+            record += body
+            f.write(record)
+
+            if on_record is not None:
+                on_record(values, offset)
+
+            offset += len(record)
+
+    def read(self, model_class):
+        """
+        yield one record ``dict`` at a time, only a block of the file is
+        held in memory
+
+        fields in the file that the model no longer has are skipped, fields
+        the file doesn't have get their default value
+        """
+        for offset, record in self._read_records(model_class, self.read_blocks()):
+            yield record
+
+    def _read_header(self, buf):
+        """
+        :param _Buffer buf: at the start of the file
+        :rtype: ``list`` of ``(field name, kind)``, ``None`` if the file is empty
+        """
+        if not buf.ensure(1):
+            return None
+
+        if not buf.ensure(len(MAGIC)) or buf.take(len(MAGIC)) != MAGIC:
+            raise BinaryFormatError("{}: not a binary alkali file".format(self.filename))
+
+        version = buf.take(1)[0]
+
+        if version != VERSION:
+            raise BinaryFormatError("{}: unknown version: {}".format(self.filename, version))
+
+        return [ (buf.varint_str(), chr(buf.take(1)[0])) for _ in range(buf.varint()) ]
+
+    def _read_records(self, model_class, blocks):
+        """
+        yield ``(offset, record dict)`` for each record in ``blocks``
+        """
+        buf = _Buffer(blocks)
+        schema = self._read_header(buf)
+
+        if schema is None:
+            return # empty file
+
+        decode = decoder(model_class, schema)
+
+        while buf.ensure(1):
+            offset = buf.tell()
+            length = buf.varint()
+
+            yield offset, decode(buf.take(length))
+
+
+def decoder(model_class, schema):
+    """
+    return a function that decodes a record body, as written with
+    ``schema``, into a ``dict`` of the fields ``model_class`` has
+    """
+    model_fields = model_class.Meta.fields
+    readers = [ (name if name in model_fields else None, _readers[kind]) for name, kind in schema ]
+    nbytes = (len(schema) + 7) // 8
+
+    def decode(data):
+        nulls = int.from_bytes(data[:nbytes], 'little')
+        pos = nbytes
+        record = {}
+
+        for i, (name, read) in enumerate(readers):
+            if nulls & (1 << i):
+                value = None
+            else:
+                value, pos = read(data, pos)
+
+            if name is not None:
+                record[name] = value
+
+        return record
+
+    return decode
+
+
+class _Buffer:
+    """
+    the unread part of a file being read a block at a time
+    """
+
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.buf = b''
+        self.pos = 0
+        self.start = 0 # file offset of buf[0]
+
+    def tell(self):
+        """
+        :rtype: ``int`` file offset of the next unread byte
+        """
+        return self.start + self.pos
+
+    def ensure(self, n):
+        """
+        make sure there are ``n`` unread bytes
+
+        :rtype: ``bool``, False if the file ends first
+        """
+        if len(self.buf) - self.pos >= n:
+            return True
+
+        parts = [self.buf[self.pos:]]
+        have = len(parts[0])
+
+        for block in self.blocks:
+            parts.append(block)
+            have += len(block)
+
+            if have >= n:
+                break
+
+        self.start += self.pos
+        self.buf = b''.join(parts)
+        self.pos = 0
+
+        return have >= n
+
+    def take(self, n):
+        if not self.ensure(n):
+            raise BinaryFormatError("unexpected end of file")
+
+        start = self.pos
+        self.pos += n
+        return self.buf[start:self.pos]
+
+    def varint(self):
+        # a varint is at most 10 bytes for any sane length
+        self.ensure(10)
+
+        try:
+            value, self.pos = read_varint(self.buf, self.pos)
+        except IndexError:
+            raise BinaryFormatError("unexpected end of file")
+
+        return value
+
+    def varint_str(self):
+        return self.take(self.varint()).decode('utf-8')
@@ -61,20 +61,17 @@ class CSVStorage(FileStorage):
         if iterator is None:
             return False
 
-        f = self._fhandle
-        f.seek(0)
-
-        _peek = Peekorator(iter(iterator))
-        writer = None
-
-        for e in _peek:
-            if _peek.is_first():
-                fieldnames = e.Meta.fields.keys()
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerow(e.dict)
-            else:
-                writer.writerow(e.dict)
-
-        f.truncate()
+        with self._open_write() as f:
+            _peek = Peekorator(iter(iterator))
+            writer = None
+
+            for e in _peek:
+                if _peek.is_first():
+                    fieldnames = e.Meta.fields.keys()
+                    writer = csv.DictWriter(f, fieldnames=fieldnames)
+                    writer.writeheader()
+                    writer.writerow(e.dict)
+                else:
+                    writer.writerow(e.dict)
+
         return True
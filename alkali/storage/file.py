@@ -1,5 +1,10 @@
 import os
+import stat
+import time
 import types
+import weakref
+import threading
+import tempfile
 from contextlib import contextmanager
 #from zope.interface import Interface, Attribute, implements
 import json
@@ -41,13 +46,76 @@ class FileStorage(Storage):
     #implements(IStorage)
     extension = 'raw'
 
+    # size of each read() by read_blocks()
+    block_size = 64 * 1024
+
+    # open files in binary mode, read() and write() deal in bytes
+    binary = False
+
+    # write to a temp file and rename it over the real one
+    atomic = False
+
+    # when to fsync: 'none', 'on_store' or 'batched', at most once per
+    # fsync_interval seconds. a batched fsync that's put off happens on a
+    # timer thread at the end of the interval, or at sync()/close if sooner
+    fsync = 'none'
+    fsync_interval = 5.0
+
     def __init__(self, filename=None, *args, **kw ):
+        """
+        :param filename: file name or file object
+        :param kw:
+            * atomic: overrides :attr:`atomic`, a crash mid-write leaves
+              the previous file instead of a partial one
+            * fsync: overrides :attr:`fsync`
+            * fsync_interval: overrides :attr:`fsync_interval`
+        """
         self._fhandle = None
+        self._unsynced = False
+        self._last_fsync = 0.0
+        self._sync_lock = threading.Lock()
+        self._sync_timer = None
+
+        self.atomic = kw.pop('atomic', self.atomic)
+        self.fsync = kw.pop('fsync', self.fsync)
+        self.fsync_interval = kw.pop('fsync_interval', self.fsync_interval)
+
+        assert self.fsync in ('none', 'on_store', 'batched'), \
+            "unknown fsync policy: {}".format(self.fsync)
+
         self.filename = filename # property
 
     def __del__(self):
+        self.sync()
         self.unlock()
 
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+
+    def __getstate__(self):
+        """
+        a pickled storage, eg. sent to another process to read in
+        parallel, only carries the name of its file
+        """
+        if not self._is_real_file():
+            raise TypeError("{}: can't pickle storage of a file object".format(self._name))
+
+        state = self.__dict__.copy()
+        state['_fhandle'] = self.filename
+        state['_unsynced'] = False
+        state['_sync_timer'] = None
+        del state['_sync_lock']
+        return state
+
+    def __setstate__(self, state):
+        """
+        the unpickled copy can only read, it doesn't lock the file since
+        the original holds the lock
+        """
+        self.__dict__.update(state)
+        self._sync_lock = threading.Lock()
+        self._fhandle = open(state['_fhandle'], self._mode('r'))
+
     @property
     def filename(self):
         if self._fhandle is None:
@@ -60,6 +128,7 @@ class FileStorage(Storage):
         """
         when setting the filename, immediately open and lock the file handle
         """
+        self.sync()
         self.unlock()
 
         if filename is None:
@@ -73,15 +142,18 @@ class FileStorage(Storage):
 
             if os.path.exists(filename):
                 assert os.path.isfile(filename)
-                self._fhandle = open(filename, 'r+')
+                self._fhandle = open(filename, self._mode('r+'))
             else:
-                self._fhandle = open(filename, 'w+')
+                self._fhandle = open(filename, self._mode('w+'))
 
         else: # assuming file type
             self._fhandle = filename
 
         self.lock()
 
+    def _mode(self, mode):
+        return mode + 'b' if self.binary else mode
+
     def lock(self):
         if not self._fhandle:
             return
@@ -101,13 +173,28 @@ class FileStorage(Storage):
     def read(self, model_class):
         """
         helper function that just reads a file
+
+        see :func:`read_blocks` to not hold the whole file in memory
         """
-        # THINK should this yield blocks of data?
-        # https://github.com/kashifrazzaqui/json-streamer
-        # https://pypi.org/project/ijson/
         self._fhandle.seek(0)
         return self._fhandle.read()
 
+    def read_blocks(self):
+        """
+        helper function that reads a file ``block_size`` characters at a time
+
+        :rtype: ``generator`` of ``str``, ``bytes`` if :attr:`binary`
+        """
+        self._fhandle.seek(0)
+
+        while True:
+            block = self._fhandle.read(self.block_size)
+
+            if not block:
+                return
+
+            yield block
+
     def _write(self, iterator):
         """
         helper function that just writes a file if data is not None
@@ -115,14 +202,157 @@ class FileStorage(Storage):
         if iterator is None:
             return False
 
-        self._fhandle.seek(0)
+        with self._open_write() as f:
+            for data in iterator:
+                f.write(str(data))
+
+        return True
+
+    @contextmanager
+    def _open_write(self):
+        """
+        context manager that returns the file object to replace our
+        contents with. when :attr:`atomic` that's a temp file in the same
+        directory that's renamed over ours when the block finishes without
+        an exception, else it's our file rewound to the start.
+        """
+        if not self.atomic or not self._is_real_file():
+            f = self._fhandle
+            f.seek(0)
+
+            yield f
+
+            # since the file may shrink (we've deleted records) then
+            # we must truncate the file at our current position to avoid
+            # stale data being present on the next load
+            f.truncate()
+            f.flush()
+            self._fsync(f)
+            return
+
+        filename = os.path.abspath(self.filename)
+        dirname, basename = os.path.split(filename)
+        fd, tmpname = tempfile.mkstemp(prefix='.' + basename + '.', suffix='.tmp', dir=dirname)
+
+        try:
+            os.chmod(tmpname, stat.S_IMODE(os.stat(filename).st_mode))
+
+            with os.fdopen(fd, self._mode('w')) as f:
+                yield f
+
+                # always, else a crash could leave an empty file after the rename
+                f.flush()
+                os.fsync(f.fileno())
 
-        for data in iterator:
-            self._fhandle.write(str(data))
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+        # our handle is the old file now, open and lock the new one
+        self.unlock()
+        self._fhandle = open(filename, self._mode('r+'))
+        self.lock()
+
+        self._fsync(None)
+
+    def _is_real_file(self):
+        """
+        can we rename a temp file over ours
+        """
+        filename = self.filename
+        return isinstance(filename, str) and os.path.isfile(filename)
+
+    def _fsync(self, fhandle):
+        """
+        fsync what we just wrote according to :attr:`fsync`
+
+        :param fhandle: the file to sync or ``None`` if it's been fsynced
+            already and only the directory entry needs syncing
+        """
+        if self.fsync == 'none':
+            return
+
+        if self.fsync == 'batched':
+            delay = self._last_fsync + self.fsync_interval - time.monotonic()
+
+            if delay > 0:
+                with self._sync_lock:
+                    self._unsynced = True
+
+                self._schedule_sync(delay)
+                return
+
+        if fhandle is not None:
+            os.fsync(fhandle.fileno())
+
+        self._fsync_dir()
+
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def _fsync_dir(self):
+        if not self._is_real_file():
+            return
+
+        fd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+
+        try:
+            os.fsync(fd)
+        except OSError: # pragma: nocover
+            pass # not every platform/filesystem can fsync a directory
+        finally:
+            os.close(fd)
+
+    def _schedule_sync(self, delay):
+        """
+        :func:`sync` in ``delay`` seconds on a timer thread, unless a timer
+        is already waiting. the timer doesn't keep us alive.
+        """
+        if self._sync_timer is not None:
+            return
+
+        ref = weakref.ref(self)
+
+        def timed_sync():
+            storage = ref()
+
+            if storage is None:
+                return
+
+            storage._sync_timer = None
+
+            try:
+                # our writes have been flushed, the file object isn't
+                # thread safe so leave it alone
+                storage._sync_unsynced()
+            except (OSError, ValueError) as e: # eg. file closed meanwhile
+                logger.warning( "%s: deferred fsync failed: %s", storage._name, e )
+
+        self._sync_timer = threading.Timer(delay, timed_sync)
+        self._sync_timer.daemon = True
+        self._sync_timer.start()
+
+    def sync(self):
+        """
+        fsync any writes that the ``batched`` :attr:`fsync` policy put off
+        """
+        if not self._unsynced or not self._fhandle:
+            return
 
-        self._fhandle.truncate()
         self._fhandle.flush()
-        return True
+        self._sync_unsynced()
+
+    def _sync_unsynced(self):
+        with self._sync_lock:
+            if not self._unsynced or not self._fhandle:
+                return
+
+            os.fsync(self._fhandle.fileno())
+            self._fsync_dir()
+
+            self._last_fsync = time.monotonic()
+            self._unsynced = False
 
     def write(self, model_class, iterator):
         return self._write(iterator)
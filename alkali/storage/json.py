@@ -1,8 +1,126 @@
+import re
 import json
 
 from alkali.peekorator import Peekorator
 from .file import FileStorage
 
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+_number = set('0123456789.eE+-')
+
+
+class _Buffer:
+    """
+    the unparsed part of a document being read a block at a time
+    """
+
+    def __init__(self, blocks):
+        self.blocks = iter(blocks)
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        drop what's been parsed and append the next block
+
+        :rtype: ``bool``, False if there are no more blocks
+        """
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+
+        try:
+            self.buf += next(self.blocks)
+        except StopIteration:
+            self.eof = True
+            return False
+
+        return True
+
+    def peek(self):
+        """
+        skip whitespace and return the next character, ``''`` at the end
+        """
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self.fill():
+                return ''
+
+    def error(self, msg):
+        return json.JSONDecodeError(msg, self.buf, self.pos)
+
+    def value(self):
+        """
+        parse and return the next json value
+        """
+        while True:
+            self.peek()
+
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+
+                # a value is only complete if something follows it, a number
+                # cut off at the end of a block may look complete, eg. 1.5e|10
+                following = _whitespace.match(self.buf, end).end()
+                if self.eof or (following < len(self.buf) and self.buf[end] not in _number):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            # incomplete, at least double what we have so a value
+            # much bigger than a block isn't parsed over and over
+            want = 2 * (len(self.buf) - self.pos)
+
+            while len(self.buf) - self.pos < want and self.fill():
+                pass
+
+
+def iter_array(blocks):
+    """
+    yield the elements of a json array one at a time
+
+    the array is parsed incrementally from ``blocks`` so only the
+    element being parsed, and what's left of the current block, is held
+    in memory. an empty document yields nothing.
+
+    :param blocks: iterable of ``str``, the document in pieces
+    :raises json.JSONDecodeError: if the document isn't a json array
+    :rtype: ``generator``
+    """
+    buf = _Buffer(blocks)
+    char = buf.peek()
+
+    if not char:
+        return
+
+    if char != '[':
+        raise buf.error("Expecting '['")
+
+    buf.pos += 1
+
+    if buf.peek() == ']':
+        return
+
+    while True:
+        yield buf.value()
+
+        char = buf.peek()
+
+        if char == ']':
+            return
+
+        if char != ',':
+            raise buf.error("Expecting ',' delimiter")
+
+        buf.pos += 1
+
+
 class JSONStorage(FileStorage):
     """
     save models in json format
@@ -10,12 +128,11 @@ class JSONStorage(FileStorage):
     extension = 'json'
 
     def read(self, model_class):
-        data = super().read(model_class)
-
-        if not data:
-            return
-
-        for elem in json.loads(data):
+        """
+        yield one record ``dict`` at a time, the file is parsed as it's
+        read so the whole thing is never in memory
+        """
+        for elem in iter_array(self.read_blocks()):
             yield elem
 
     def write(self, model_class, iterator):
@@ -23,25 +140,17 @@ class JSONStorage(FileStorage):
         if iterator is None:
             return False
 
-        f = self._fhandle
-        f.seek(0)
-
-        f.write('[\n')
-
-        _peek = Peekorator(iter(iterator))
-        for e in _peek:
-            data = json.dumps(e.dict, indent='  ')
-            f.write(data)
+        with self._open_write() as f:
+            f.write('[\n')
 
-            if not _peek.is_last():
-                f.write(',\n')
+            _peek = Peekorator(iter(iterator))
+            for e in _peek:
+                data = json.dumps(e.dict, indent='  ')
+                f.write(data)
 
-        f.write('\n]')
+                if not _peek.is_last():
+                    f.write(',\n')
 
-        # since the file may shrink (we've deleted records) then
-        # we must truncate the file at our current position to avoid
-        # stale data being present on the next load
-        f.truncate()
-        f.flush()
+            f.write('\n]')
 
         return True
@@ -0,0 +1,221 @@
+import os
+import json
+
+from .file import FileStorage
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class JSONLinesStorage(FileStorage):
+    """
+    save models in json lines format, one record per line
+
+    the file is append-only: :func:`write` only appends the records that
+    changed since the file was last read or written, and a tombstone for
+    each deleted record. when a record appears more than once the last
+    line wins. :func:`write_changes` does the same without having to look
+    at every record.
+
+    appends are never :attr:`alkali.storage.FileStorage.atomic`, a crash
+    can only leave a partial last line and that's ignored on read.
+
+    superseded lines and tombstones are garbage, once there's more than
+    ``compact_ratio`` garbage lines per live record (and at least
+    ``compact_min``) the next write rewrites the whole file.
+
+    ::
+
+        {"id": 1, "title": "first"}
+        {"id": 2, "title": "second"}
+        {"id": 1, "title": "first, edited"}
+        {"__deleted__": {"id": 2}}
+    """
+    extension = 'jsonl'
+
+    # key of a tombstone line
+    tombstone = '__deleted__'
+
+    compact_ratio = 1.0
+    compact_min = 1000
+
+    @FileStorage.filename.setter
+    def filename(self, filename):
+        FileStorage.filename.fset(self, filename)
+
+        # what we know about what's on disk, see _reset()
+        self._reset(None)
+
+    def _reset(self, known):
+        """
+        :param dict known: pk: hash of the line holding that record in the
+            file, ``None`` if we don't know what's in the file
+        """
+        self._known = known
+        self._garbage = 0
+
+    @staticmethod
+    def _dumps(record):
+        return json.dumps(record, separators=(',', ':'))
+
+    @staticmethod
+    def _key(model_class, record):
+        """
+        return the primary key of a record ``dict``, as written
+        """
+        return tuple( record[name] for name in model_class.Meta.pk_fields.keys() )
+
+    def read(self, model_class):
+        """
+        yield the live record ``dict`` for each primary key
+
+        the whole file has to be read before any record is known to be
+        current, so the records are held until the end
+        """
+        self._fhandle.seek(0)
+
+        records = {}
+        known = {}
+        lines = 0
+        torn = False
+
+        for line in self._fhandle:
+            if not line.strip():
+                continue
+
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # only the last line can be half written
+                if line.endswith('\n'):
+                    raise
+
+                logger.warning( "%s: ignoring partial last line: %s", self.filename, line )
+                torn = True
+                break
+
+            lines += 1
+
+            if self.tombstone in record:
+                key = self._key(model_class, record[self.tombstone])
+                records.pop(key, None)
+                known.pop(key, None)
+                continue
+
+            key = self._key(model_class, record)
+            records[key] = record
+            known[key] = hash(line.rstrip('\n'))
+
+        # a partial line would corrupt the next append, rewrite instead
+        self._reset(None if torn else known)
+        self._garbage = lines - len(records)
+
+        for record in records.values():
+            yield record
+
+    def write(self, model_class, iterator):
+        """
+        append the records that changed, and tombstones for the ones that
+        are gone, or rewrite the whole file if it needs compacting or we
+        don't know what's in it
+
+        :param iterator: all the model instances
+        """
+        if iterator is None:
+            return False
+
+        if self._known is None or self._needs_compacting():
+            return self._rewrite(model_class, iterator)
+
+        f = self._fhandle
+        f.seek(0, os.SEEK_END)
+
+        current = {}
+
+        for e in iterator:
+            record = e.dict
+            line = self._dumps(record)
+            key = self._key(model_class, record)
+
+            current[key] = hashed = hash(line)
+            old = self._known.get(key)
+
+            if old != hashed:
+                f.write(line + '\n')
+
+                if old is not None:
+                    self._garbage += 1
+
+        for key in self._known.keys() - current.keys():
+            self._write_tombstone(model_class, key)
+
+        f.flush()
+        self._fsync(f)
+
+        self._known = current
+        return True
+
+    def write_changes(self, model_class, inserted, updated, deleted):
+        """
+        append the given changes, without looking at the other records
+
+        :rtype: ``bool``, False if we need a full write, ie. we don't know
+            what's in the file or it needs compacting
+        """
+        if self._known is None or self._needs_compacting():
+            return False
+
+        f = self._fhandle
+        f.seek(0, os.SEEK_END)
+
+        for e in list(inserted) + list(updated):
+            record = e.dict
+            line = self._dumps(record)
+            key = self._key(model_class, record)
+            hashed = hash(line)
+            old = self._known.get(key)
+
+            if old == hashed:
+                continue
+
+            if old is not None:
+                self._garbage += 1
+
+            f.write(line + '\n')
+            self._known[key] = hashed
+
+        for e in deleted:
+            key = self._key(model_class, e.dict)
+
+            if self._known.pop(key, None) is not None:
+                self._write_tombstone(model_class, key)
+
+        f.flush()
+        self._fsync(f)
+        return True
+
+    def _write_tombstone(self, model_class, key):
+        pk = dict( zip(model_class.Meta.pk_fields.keys(), key) )
+        self._fhandle.write(self._dumps({self.tombstone: pk}) + '\n')
+
+        self._garbage += 2 # the record and its tombstone
+
+    def _needs_compacting(self):
+        return self._garbage >= max(self.compact_min, self.compact_ratio * len(self._known))
+
+    def _rewrite(self, model_class, iterator):
+        """
+        write only the live records
+        """
+        known = {}
+
+        with self._open_write() as f:
+            for e in iterator:
+                record = e.dict
+                line = self._dumps(record)
+
+                f.write(line + '\n')
+                known[self._key(model_class, record)] = hash(line)
+
+        self._reset(known)
+        return True
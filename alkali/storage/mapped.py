@@ -0,0 +1,246 @@
+"""
+:class:`MappedStorage` writes the :mod:`alkali.storage.binary` format
+plus a primary key index next to it, ``<filename>.idx``::
+
+    b'ALKI' version:u8
+    data file size:varint, data file mtime in ns:varint
+    pk field kinds:str
+    record count:varint
+    per record: pk values, offset from the previous record:varint
+
+the index only saves scanning the data file, it's rebuilt if it's
+missing or doesn't describe the data file.
+"""
+
+import os
+import mmap
+import tempfile
+
+from .binary import BinaryStorage, VERSION, field_kind, decoder, write_varint, read_varint, \
+    _Buffer, _readers, _writers, _write_str, _read_str
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+INDEX_MAGIC = b'ALKI'
+
+
+class MappedRows:
+    """
+    a read-only mapping of primary key to record ``dict``, the records
+    are decoded from a memory-mapped data file when looked up
+    """
+
+    def __init__(self, mm, offsets, decode):
+        """
+        :param mmap.mmap mm: the data file
+        :param dict offsets: pk: offset of its record
+        :param decode: see :func:`alkali.storage.binary.decoder`
+        """
+        self._mm = mm
+        self._offsets = offsets
+        self._decode = decode
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __contains__(self, pk):
+        return pk in self._offsets
+
+    def keys(self):
+        return self._offsets.keys()
+
+    def __getitem__(self, pk):
+        length, pos = read_varint(self._mm, self._offsets[pk])
+        return self._decode(self._mm[pos:pos + length])
+
+
+class MappedStorage(BinaryStorage):
+    """
+    :class:`alkali.storage.BinaryStorage` that a
+    :class:`alkali.manager.Manager` can load lazily: the data file is
+    memory-mapped and a model instance is only created when its row is
+    looked up, see :func:`read_lazy`
+
+    writes are always :attr:`alkali.storage.FileStorage.atomic`, a loaded
+    manager is still reading rows from the old file
+    """
+    atomic = True
+
+    def __init__(self, filename=None, *args, **kw):
+        super().__init__(filename, *args, **kw)
+        assert self.atomic, "{} must write atomically".format(self._name)
+
+    @property
+    def index_filename(self):
+        """
+        **property**: the name of our primary key index file
+        """
+        return self.filename + '.idx'
+
+    @staticmethod
+    def _key(model_class, values):
+        """
+        return the primary key of a record ``dict`` or an instance's ``__dict__``
+        """
+        names = model_class.Meta.pk_fields.keys()
+
+        if len(names) == 1:
+            return values[names[0]]
+
+        return tuple( values[name] for name in names )
+
+    @staticmethod
+    def _pk_kinds(model_class):
+        """
+        :rtype: ``str`` the binary kind of each primary key field
+        """
+        return ''.join( field_kind(field) for field in model_class.Meta.pk_fields.values() )
+
+    def write(self, model_class, iterator):
+        if iterator is None:
+            return False
+
+        offsets = []
+
+        # keep the pks, not the instances, a lazily loaded manager
+        # creates its instances just for this write
+        def on_record(values, offset):
+            offsets.append( (self._key(model_class, values), offset) )
+
+        with self._open_write() as f:
+            self._write_records(f, model_class, iterator, on_record)
+
+        self._write_index(model_class, offsets)
+
+        return True
+
+    def _write_index(self, model_class, offsets):
+        """
+        :param offsets: ``list`` of ``(pk, offset)`` in file order
+        """
+        kinds = self._pk_kinds(model_class)
+
+        if 'j' in kinds:
+            return # no way to encode these pks, read_lazy() will scan instead
+
+        st = os.fstat(self._fhandle.fileno())
+
+        out = bytearray(INDEX_MAGIC)
+        out.append(VERSION)
+        write_varint(out, st.st_size)
+        write_varint(out, st.st_mtime_ns)
+        _write_str(out, kinds)
+        write_varint(out, len(offsets))
+
+        writers = [ _writers[kind] for kind in kinds ]
+        last = 0
+
+        for pk, offset in offsets:
+            values = (pk,) if len(writers) == 1 else pk
+
+            for write, value in zip(writers, values):
+                write(out, value)
+
+            write_varint(out, offset - last)
+            last = offset
+
+        # the index is a cache, it's written atomically but never fsynced
+        fd, tmpname = tempfile.mkstemp(prefix='.', suffix='.tmp',
+                dir=os.path.dirname(os.path.abspath(self.filename)))
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(out)
+
+            os.replace(tmpname, self.index_filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def _read_index(self, model_class):
+        """
+        :rtype: ``dict`` of pk: offset, ``None`` if there's no index that
+            describes our data file
+        """
+        try:
+            with open(self.index_filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        st = os.fstat(self._fhandle.fileno())
+
+        try:
+            if data[:len(INDEX_MAGIC)] != INDEX_MAGIC or data[len(INDEX_MAGIC)] != VERSION:
+                return None
+
+            size, pos = read_varint(data, len(INDEX_MAGIC) + 1)
+            mtime, pos = read_varint(data, pos)
+            kinds, pos = _read_str(data, pos)
+
+            if (size, mtime) != (st.st_size, st.st_mtime_ns) or kinds != self._pk_kinds(model_class):
+                return None
+
+            count, pos = read_varint(data, pos)
+            readers = [ _readers[kind] for kind in kinds ]
+
+            offsets = {}
+            offset = 0
+
+            for _ in range(count):
+                values = []
+
+                for read in readers:
+                    value, pos = read(data, pos)
+                    values.append(value)
+
+                delta, pos = read_varint(data, pos)
+                offset += delta
+
+                offsets[values[0] if len(values) == 1 else tuple(values)] = offset
+        except (IndexError, ValueError):
+            logger.warning( "%s: ignoring corrupt index", self.index_filename )
+            return None
+
+        return offsets
+
+    def read_lazy(self, model_class):
+        """
+        memory-map our data file and return a
+        :class:`alkali.storage.mapped.MappedRows` that decodes a row when
+        it's looked up, an index that doesn't match the data file is
+        rebuilt
+
+        :rtype: :class:`alkali.storage.mapped.MappedRows` or ``None`` if
+            our file is empty or not a real file
+        """
+        if not self._is_real_file():
+            return None
+
+        self._fhandle.flush()
+
+        if os.fstat(self._fhandle.fileno()).st_size == 0:
+            return None
+
+        mm = mmap.mmap(self._fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        schema = self._read_header(_Buffer(self.read_blocks()))
+
+        offsets = self._read_index(model_class)
+
+        if offsets is None:
+            logger.debug( "%s: rebuilding index", self.filename )
+
+            offsets = {
+                self._key(model_class, record): offset
+                for offset, record in self._read_records(model_class, self.read_blocks())
+            }
+
+            self._write_index(model_class, sorted(offsets.items(), key=lambda item: item[1]))
+
+        return MappedRows(mm, offsets, decoder(model_class, schema))
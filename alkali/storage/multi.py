@@ -1,4 +1,6 @@
+import os
 import json
+from contextlib import contextmanager
 
 from alkali.storage import FileStorage
 
@@ -9,21 +11,49 @@ class MultiStorage(FileStorage):
     """
     like a regular JSONStorage but this file can hold multiple
     different tables/models
+
+    the parsed file is kept and only parsed again if the file's size or
+    mtime changes, so reading every model, or writing them, parses it
+    once. writes inside :func:`batch` are combined into a single rewrite.
     """
 
-    def __init__(self, models, filename):
+    def __init__(self, models, filename, **kw):
         self.models = models
-        super().__init__(filename)
+        self._batching = 0
+        self._pending = None # the document to write at the end of batch()
+        super().__init__(filename, **kw)
+
+    @FileStorage.filename.setter
+    def filename(self, filename):
+        FileStorage.filename.fset(self, filename)
+
+        # (size, mtime) of the file: its parsed contents
+        self._cache = None
 
     def _model_name(self, model_class):
         return model_class.__name__.lower()
 
-    def read(self, model_class):
+    def _stat(self):
+        """
+        :rtype: ``(size, mtime)`` of our file or ``None`` if it's not a real file
         """
-        read the entire file but only emit objects for the given model_class
+        if not self._is_real_file():
+            return None
+
+        st = os.fstat(self._fhandle.fileno())
+        return st.st_size, st.st_mtime_ns
 
-        not the most effecient but by far the simplest
+    def _document(self):
         """
+        return our parsed file, from the cache if the file hasn't changed
+
+        :rtype: ``dict`` of model name: list of records
+        """
+        key = self._stat()
+
+        if key is not None and self._cache is not None and self._cache[0] == key:
+            return self._cache[1]
+
         self._fhandle.seek(0)
 
         try:
@@ -34,6 +64,15 @@ class MultiStorage(FileStorage):
             logger.exception(e)
             data = {}
 
+        self._cache = (key, data) if key is not None else None
+        return data
+
+    def read(self, model_class):
+        """
+        emit the objects for the given model_class from our parsed file
+        """
+        data = self._document()
+
         if not data:
             return None
 
@@ -48,33 +87,61 @@ class MultiStorage(FileStorage):
 
     def write(self, model_class, iterator):
         """
-        probably not the best way to do this but we load the file
-        and then write it back out with the one updated key/value pair
+        replace the model's key/value pair in our parsed file and write it
+        back out, or at the end of :func:`batch`
         """
         if iterator is None:
             return False
 
-        self._fhandle.seek(0)
-
-        try:
-            data = json.load(self._fhandle)
-        except json.decoder.JSONDecodeError:
-            data = {} # first time
-        except Exception as e: # pragma: nocover
-            logger.exception(e)
-            data = {}
+        data = self._pending if self._pending is not None else self._document()
 
         data[self._model_name(model_class)] = [
             value.dict for value in iterator
         ]
 
-        # import pprint
-        # pprint.pprint(data)
-
-        # TODO needs to do this safely, do we loose data on an encode error?
-        self._fhandle.seek(0)
-        json.dump(data, self._fhandle, indent='  ')
-        self._fhandle.truncate()
-        self._fhandle.flush()
+        if self._batching:
+            self._pending = data
+        else:
+            self._flush(data)
 
         return True
+
+    @contextmanager
+    def batch(self):
+        """
+        the writes made inside are written to the file once, at the end
+        """
+        self._batching += 1
+
+        try:
+            yield
+        except BaseException:
+            self._batching -= 1
+
+            # the cache holds writes that never made it to the file
+            if not self._batching and self._pending is not None:
+                self._pending = None
+                self._cache = None
+
+            raise
+
+        self._batching -= 1
+
+        if not self._batching and self._pending is not None:
+            data, self._pending = self._pending, None
+            self._flush(data)
+
+    def _flush(self, data):
+        """
+        write ``data`` to our file and cache it
+        """
+        try:
+            # use atomic=True to not lose data on an encode error
+            with self._open_write() as f:
+                json.dump(data, f, indent='  ')
+        except BaseException:
+            self._cache = None
+            raise
+
+        key = self._stat()
+        self._cache = (key, data) if key is not None else None
@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+
+
 class Storage:
     """
     helper base class for the Storage object hierarchy
@@ -13,5 +16,41 @@ class Storage:
     def read(self, model_class):
         raise NotImplementedError()
 
+    def read_lazy(self, model_class):
+        """
+        return a mapping of primary key to record ``dict`` that only decodes
+        a record when it's looked up, storage that can't do that returns
+        ``None`` and gets a full :func:`read`
+
+        :rtype: :class:`alkali.storage.mapped.MappedRows` or ``None``
+        """
+        return None
+
     def write(self, model_class, iterator):
         raise NotImplementedError()
+
+    @contextmanager
+    def batch(self):
+        """
+        context manager around the writes of several models, storage that
+        holds several models can combine their writes into one at the end
+
+        ::
+
+            with storage.batch():
+                storage.write(Model1, ...)
+                storage.write(Model2, ...)
+        """
+        yield
+
+    def write_changes(self, model_class, inserted, updated, deleted):
+        """
+        write only what changed since the last read or write, storage that
+        can't do that returns ``False`` and gets a full :func:`write`
+
+        :param inserted: new model instances
+        :param updated: changed model instances
+        :param deleted: removed model instances
+        :rtype: ``bool``
+        """
+        return False
@@ -50,3 +50,24 @@ class AutoModel2(Model):
     modified = fields.DateTimeField(auto_now=True)
     f1       = fields.StringField()
     f2       = fields.StringField()
+
+
+class IndexModel(Model):
+    id      = fields.IntField(primary_key=True)
+    name    = fields.StringField(indexed=True)
+    foreign = fields.ForeignKey(MyModel, indexed=True)
+
+class SortedModel(Model):
+    id  = fields.IntField(primary_key=True)
+    num = fields.IntField(indexed='sorted')
+    ts  = fields.DateTimeField(indexed='sorted')
+
+class ColumnModel(Model):
+    class Meta:
+        columnar = True
+
+    id    = fields.IntField(primary_key=True)
+    value = fields.FloatField()
+    valid = fields.BoolField()
+    ts    = fields.DateTimeField()
+    name  = fields.StringField()
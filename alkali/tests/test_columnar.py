@@ -0,0 +1,187 @@
+import unittest
+import datetime as dt
+
+from alkali.query import Q, Count, Sum, Max, Min, Avg, Variance, StdDev, \
+    CountDistinct, Percentile, Median
+from alkali import columnar
+from alkali import fromts
+
+from . import ColumnModel, MyModel
+
+@unittest.skipUnless( columnar.available(), "numpy not installed" )
+class TestColumnar( unittest.TestCase ):
+
+    def setUp(self):
+        for i in range(20):
+            ColumnModel(id=i, value=i * 1.5, valid=i % 3 == 0,
+                    ts=fromts(i * 60), name='name %d' % (i % 4)).save()
+
+    def tearDown(self):
+        ColumnModel.objects.clear()
+
+    def assertSameAsScan(self, *args, **kw):
+        "compare the columnar results with the per instance ones"
+        q = ColumnModel.objects.filter(*args, **kw)
+        ids = [m.id for m in q]
+
+        # a query whose manager changed can't use the columns
+        q = ColumnModel.objects.filter(*args, **kw)
+        ColumnModel(id=1000).save()
+        self.assertEqual( ids, [m.id for m in q] )
+        ColumnModel.objects.delete( ColumnModel(id=1000) )
+
+        return ids
+
+    def test_1(self):
+        "verify class/instance implementation"
+        self.assertEqual( False, MyModel.Meta.columnar )
+        self.assertIsNone( MyModel.objects.columns )
+
+        columns = ColumnModel.objects.columns
+        self.assertTrue( repr(columns) )
+        self.assertEqual( 20, len(columns) )
+        self.assertEqual( ['id', 'value', 'valid', 'ts'], list(columns.kinds.keys()) )
+
+    def test_2(self):
+        "test that columns follow save and delete"
+        columns = ColumnModel.objects.columns
+        self.assertFalse( columns.stale )
+
+        for i in range(20, 40):
+            ColumnModel(id=i, value=1.0).save()
+
+        self.assertEqual( 40, len(columns) )
+
+        m = ColumnModel.objects.get(5)
+        m.value = 100.0
+        m.save()
+
+        ColumnModel.objects.delete( ColumnModel.objects.get(3) )
+        ColumnModel.objects.delete( ColumnModel.objects.get(39) )
+        self.assertEqual( 38, len(columns) )
+
+        self.assertEqual( [5], [m.id for m in ColumnModel.objects.filter(value__gt=50)] )
+        self.assertEqual( 19, ColumnModel.objects.filter(value=1.0).count )
+
+        ColumnModel.objects.clear()
+        self.assertTrue( columns.stale )
+        self.assertEqual( 0, ColumnModel.objects.filter(value=1.0).count )
+
+    def test_3(self):
+        "test vectorized filters"
+        self.assertEqual( [0, 1, 2], self.assertSameAsScan(value__lt=4) )
+        self.assertEqual( [0, 3, 6], self.assertSameAsScan(valid=True, id__le=8) )
+        self.assertEqual( [2, 3], self.assertSameAsScan(ts__ge=fromts(120), ts__lt=fromts(240)) )
+        self.assertEqual( [1, 19], self.assertSameAsScan(id__in=[1, 19, 100]) )
+        self.assertEqual( [0, 19], self.assertSameAsScan( Q(id=0) | Q(value__gt=27) ) )
+        self.assertEqual( 17, len(self.assertSameAsScan( ~Q(value__le=3) )) )
+        self.assertEqual( 19, len(self.assertSameAsScan(id__ne=4)) )
+
+        q = ColumnModel.objects.filter(value__lt=4)
+        self.assertEqual( ([0, 1, 2], True), q._column_lookup(q._pending()) )
+
+        # a field without a column is checked per instance
+        q = ColumnModel.objects.filter(value__lt=9, name='name 1')
+        pks, exact = q._column_lookup(q._pending())
+        self.assertFalse( exact )
+        self.assertEqual( [1, 5], [m.id for m in q] )
+
+        q = ColumnModel.objects.filter( Q(value__lt=9) | Q(name='name 1') )
+        self.assertEqual( (None, False), q._column_lookup(q._pending()) )
+        self.assertEqual( [0, 1, 2, 3, 4, 5, 9, 13, 17], [m.id for m in q] )
+
+    def test_4(self):
+        "test None values"
+        ColumnModel(id=100, valid=True).save()
+
+        self.assertEqual( [100], self.assertSameAsScan(value=None) )
+        self.assertEqual( 20, len(self.assertSameAsScan(value__ne=None)) )
+        self.assertEqual( [100], self.assertSameAsScan(value__in=[None, 1000.0]) )
+
+        # ordering against None is left to the instances, which raise
+        with self.assertRaises(TypeError):
+            len(ColumnModel.objects.filter(value__gt=5))
+
+        q = ColumnModel.objects.filter(value__gt=5)
+        self.assertEqual( (None, False), q._column_lookup(q._pending()) )
+
+    def test_5(self):
+        "test vectorized aggregates"
+        aggs = [Count('id'), Sum('value'), Max('ts'), Min('value'), Avg('id'),
+            Variance('value'), StdDev('value', sample=True), CountDistinct('valid'),
+            Percentile('value', 0.95), Median('id'), Sum('valid')]
+
+        q = ColumnModel.objects.filter(id__ge=5)
+        fast = q.aggregate(*aggs)
+
+        q = ColumnModel.objects.filter(id__ge=5)
+        self.assertIsNone( q._columns().aggregate(q._pending(), [Max('ts')]) )
+        self.assertEqual( [15, 18.0], q._columns().aggregate(q._pending(), [Count('id'), Median('value')]) )
+
+        ColumnModel.objects.get(5).save() # manager changed, use the instances
+        slow = q.aggregate(*aggs)
+
+        self.assertEqual( slow.keys(), fast.keys() )
+
+        for key in slow:
+            self.assertAlmostEqual( slow[key], fast[key], msg=key )
+            self.assertEqual( type(slow[key]), type(fast[key]), msg=key )
+
+        self.assertEqual( 285.0, ColumnModel.objects.aggregate(Sum('value'))['value__sum'] )
+
+        q = ColumnModel.objects.filter(id__gt=100)
+        self.assertEqual( {'value__sum': 0, 'value__avg': None}, q.aggregate(Sum('value'), Avg('value')) )
+
+        with self.assertRaises(ValueError):
+            q.aggregate(Max('value'))
+
+    def test_6(self):
+        "test vectorized values_list"
+        q = ColumnModel.objects.filter(id__in=[7, 2, 5])
+        self.assertEqual( [[2, 3.0], [5, 7.5], [7, 10.5]], q.values_list('id', 'value') )
+        self.assertEqual( [2, 5, 7, 3.0, 7.5, 10.5], q.values_list('id', 'value', flat=True) )
+        self.assertEqual( [3, 3, 3], [len(r) for r in q.values_list('id', 'value', 'name')] )
+
+        ColumnModel.objects.delete( ColumnModel.objects.get(0) )
+        ColumnModel(id=-1, value=1.0).save()
+        self.assertEqual( [-1, 1, 2], ColumnModel.objects.all().values_list('id', flat=True)[:3] )
+        self.assertEqual( [19, 18], ColumnModel.objects.order_by('-id').values_list('id', flat=True)[:2] )
+
+    def test_7(self):
+        "test values that don't fit in a column"
+        ColumnModel(id=2 ** 70).save()
+
+        self.assertNotIn( 'id', ColumnModel.objects.columns.kinds )
+        self.assertEqual( [2 ** 70], [m.id for m in ColumnModel.objects.filter(id__gt=100)] )
+        self.assertEqual( [1], [m.id for m in ColumnModel.objects.filter(value=1.5)] )
+
+        ColumnModel.objects.clear()
+        self.assertIn( 'id', ColumnModel.objects.columns.kinds )
+
+    def test_8(self):
+        "test int sums that don't fit in an int64"
+        ColumnModel.objects.clear()
+
+        for i in range(4):
+            ColumnModel(id=2 ** 62 + i).save()
+
+        self.assertIn( 'id', ColumnModel.objects.columns.kinds )
+
+        q = ColumnModel.objects.filter(id__gt=0)
+        self.assertEqual( [4 * 2 ** 62 + 6], q._columns().aggregate(q._pending(), [Sum('id')]) )
+        self.assertEqual( 4 * 2 ** 62 + 6, ColumnModel.objects.aggregate(Sum('id'))['id__sum'] )
+
+        q = ColumnModel.objects.filter(id__lt=2 ** 62 + 2)
+        self.assertEqual( [2 ** 63 + 1], q._columns().aggregate(q._pending(), [Sum('id')]) )
+
+    def test_9(self):
+        "test that vectorized queries give the manager's snapshot back"
+        man = ColumnModel.objects
+        instances = man._instances
+
+        self.assertEqual( [2, 5], ColumnModel.objects.filter(id__in=[5, 2]).values_list('id', flat=True) )
+        self.assertEqual( {'id__count': 20}, ColumnModel.objects.aggregate(Count('id')) )
+        self.assertEqual( 0, man._shared )
+
+        ColumnModel(id=100).save()
+        self.assertIs( instances, man._instances )
@@ -2,14 +2,19 @@ import os
 import unittest
 import tempfile
 import inspect
+import pickle
+import mock
+import threading
+from concurrent import futures
 
 from alkali.database import Database
 from alkali.model import Model
-from alkali.storage import JSONStorage, Storage, MultiStorage
+from alkali.storage import JSONStorage, Storage, MultiStorage, MappedStorage
 from alkali import fields
 from alkali import tznow
 
-from . import MyModel, AutoModel1, AutoModel2
+from . import MyModel, MyDepModel, AutoModel1, AutoModel2
+from alkali.wal import WriteAheadLog
 
 curr_dir = os.path.dirname( os.path.abspath( __file__ ) )
 
@@ -253,3 +258,238 @@ class TestDatabase( unittest.TestCase ):
 
         self.assertEqual("some text 1", AutoModel1.objects.get(f1="some text 1").f1)
         self.assertEqual("some text 1", AutoModel2.objects.get(f1="some text 1").f1)
+
+    def test_wal(self):
+        "test the write-ahead log"
+        MyModel.objects.clear()
+        tdir = tempfile.TemporaryDirectory()
+
+        db = Database( models=[MyModel], root_dir=tdir.name, wal=True )
+        self.assertIsInstance( db.wal, WriteAheadLog )
+        self.assertEqual( os.path.join(tdir.name, 'alkali.wal'), db.wal.filename )
+        self.assertIsNone( Database( models=[MyModel], root_dir=curr_dir ).wal )
+
+        db.load()
+
+        MyModel(int_type=1, str_type='one').save()
+        MyModel(int_type=2).save()
+        MyModel(int_type=1, str_type='uno').save()
+        MyModel.objects.delete( MyModel(int_type=2) )
+
+        self.assertEqual( [('s', 1), ('s', 2), ('s', 1), ('d', 2)],
+            [(op, record['int_type']) for op, _, record in db.wal.read()] )
+
+        # "crash" before a store, the log has it all
+        MyModel.objects.clear()
+        db.load()
+        self.assertEqual( [1], MyModel.objects.pks )
+        self.assertEqual( 'uno', MyModel.objects.get(1).str_type )
+        self.assertTrue( MyModel.objects.dirty )
+
+        # replaying isn't logged again and neither is loading
+        self.assertEqual( 4, len(list(db.wal.read())) )
+
+        db.store()
+        self.assertEqual( [], list(db.wal.read()) )
+        self.assertEqual( 0, os.path.getsize(db.wal.filename) )
+
+        MyModel.objects.clear()
+        db.load()
+        self.assertEqual( [1], MyModel.objects.pks )
+        self.assertEqual( [], list(db.wal.read()) )
+
+        MyModel.objects.clear()
+        del db
+
+    def test_wal_partial(self):
+        "test a half written log entry"
+        MyModel.objects.clear()
+        tdir = tempfile.TemporaryDirectory()
+        filename = os.path.join(tdir.name, 'my.wal')
+
+        with open(filename, 'w') as f:
+            f.write('["s","mymodel",{"int_type":1}]\n["s","other",{}]\n["s","mymo')
+
+        db = Database( models=[MyModel], root_dir=tdir.name, wal='my.wal' )
+        db.load()
+        self.assertEqual( [1], MyModel.objects.pks )
+
+        MyModel(int_type=2).save()
+        self.assertEqual( [1, 2], [record['int_type'] for _, _, record in db.wal.read()] )
+
+        with open(filename) as f:
+            self.assertEqual( 3, len(f.readlines()) )
+
+        MyModel.objects.clear()
+        del db
+
+    def test_wal_truncate_crash(self):
+        "test that a crash while truncating the log leaves the old log"
+        MyModel.objects.clear()
+        tdir = tempfile.TemporaryDirectory()
+
+        with self.assertRaises(AssertionError):
+            WriteAheadLog( os.path.join(tdir.name, 'x.wal'), [MyModel], atomic=False )
+
+        db = Database( models=[MyModel], root_dir=tdir.name, wal=True )
+
+        for i in range(4):
+            MyModel(int_type=i, str_type='old').save()
+
+        mark = db.wal.mark()
+        MyModel(int_type=1, str_type='new').save()
+
+        with open(db.wal.filename) as f:
+            before = f.read()
+
+        def crash(*args):
+            raise KeyboardInterrupt()
+
+        with mock.patch('os.replace', crash):
+            with self.assertRaises(KeyboardInterrupt):
+                db.wal.truncate(mark)
+
+        with open(db.wal.filename) as f:
+            self.assertEqual( before, f.read() )
+
+        self.assertEqual( [], [name for name in os.listdir(tdir.name) if name.endswith('.tmp')] )
+
+        MyModel.objects.clear()
+        self.assertEqual( 5, db.wal.replay() )
+        self.assertEqual( 'new', MyModel.objects.get(1).str_type )
+
+        db.wal.truncate(mark)
+        self.assertEqual( [('s', 1)], [(op, r['int_type']) for op, _, r in db.wal.read()] )
+
+        MyModel.objects.clear()
+        del db
+
+    def test_load_parallel(self):
+        "test loading models in parallel"
+        tdir = tempfile.TemporaryDirectory()
+
+        for model in [MyModel, MyDepModel, AutoModel1, AutoModel2]:
+            model.objects.clear()
+
+        with self.assertRaises(AssertionError):
+            Database( models=[MyModel] ).load(parallel='fibers')
+
+        # dependent model first, its ForeignKeys only validate once MyModel is loaded
+        db = Database( models=[MyDepModel, MyModel, AutoModel1, AutoModel2], root_dir=tdir.name )
+        db.set_storage( AutoModel1, MultiStorage([AutoModel1, AutoModel2], os.path.join(tdir.name, 'auto.json')) )
+        db.set_storage( AutoModel2, db.get_storage(AutoModel1) )
+
+        for i in range(5):
+            MyModel(int_type=i, str_type='str %d' % i, dt_type=tznow()).save()
+            MyDepModel(pk1=i, foreign=MyModel.objects.get(i)).save()
+            AutoModel1(f1='one %d' % i).save()
+            AutoModel2(f1='two %d' % i).save()
+
+        db.store()
+        expected = { model: [m.dict for m in model.objects.all()] for model in db.models }
+
+        for parallel in ['thread', 'process']:
+            for model in db.models:
+                model.objects.clear()
+
+            db.load(parallel=parallel, workers=2)
+
+            for model in db.models:
+                self.assertEqual( expected[model], [m.dict for m in model.objects.all()], parallel )
+                self.assertFalse( model.objects.dirty )
+
+        self.assertEqual( 0, MyDepModel.objects.get(0).foreign.int_type )
+
+        # a pickled storage reads the same file without locking it
+        storage = db.get_storage(MyModel)
+        copied = pickle.loads( pickle.dumps(storage) )
+        self.assertEqual( list(storage.read(MyModel)), list(copied.read(MyModel)) )
+
+        with self.assertRaises(TypeError):
+            pickle.dumps( JSONStorage( tempfile.TemporaryFile(mode='w+') ) )
+
+        for model in [MyModel, MyDepModel, AutoModel1, AutoModel2]:
+            model.objects.clear()
+
+    def test_load_parallel_lazy(self):
+        "test parallel loading of storage that loads lazily"
+        tdir = tempfile.TemporaryDirectory()
+        MyModel.objects.clear()
+
+        db = Database( models=[MyModel], storage=MappedStorage, root_dir=tdir.name )
+
+        MyModel(int_type=1).save()
+        MyModel(int_type=2).save()
+        db.store()
+
+        MyModel.objects.clear()
+        db.load(parallel='thread')
+        self.assertEqual( [1, 2], MyModel.objects.pks )
+        self.assertEqual( 0, MyModel.objects._instances.loaded )
+
+        MyModel.objects.clear()
+
+    def test_store_background(self):
+        "test storing in the background"
+        tdir = tempfile.TemporaryDirectory()
+        MyModel.objects.clear()
+
+        class SlowStorage(JSONStorage):
+            release = threading.Event()
+            fail = False
+
+            def write(self, model_class, iterator):
+                self.release.wait()
+
+                if self.fail:
+                    raise IOError("disk full")
+
+                return super().write(model_class, iterator)
+
+        db = Database( models=[MyModel], root_dir=tdir.name, wal=True )
+        storage = db.set_storage( MyModel, SlowStorage(os.path.join(tdir.name, 'slow.json')) )
+
+        MyModel(int_type=1).save()
+        stored = db.store(background=True)
+        self.assertIsInstance( stored, futures.Future )
+        self.assertFalse( MyModel.objects.dirty )
+
+        # not in the snapshot, stays in the log
+        MyModel(int_type=2).save()
+        self.assertTrue( MyModel.objects.dirty )
+
+        threading.Timer(0.1, SlowStorage.release.set).start()
+        self.assertTrue( db.store(background=False) ) # waits for the running store
+        self.assertTrue( stored.done() )
+        self.assertTrue( stored.result() )
+
+        self.assertEqual( [1, 2], [r['int_type'] for r in storage.read(MyModel)] )
+        self.assertEqual( [], list(db.wal.read()) )
+
+        # a change during a background store is only truncated from the log once stored
+        SlowStorage.release.clear()
+        MyModel(int_type=3).save()
+        stored = db.store(background=True)
+        MyModel(int_type=4).save()
+        SlowStorage.release.set()
+        stored.result()
+
+        self.assertEqual( [1, 2, 3], [r['int_type'] for r in storage.read(MyModel)] )
+        self.assertEqual( [('s', 4)], [(op, r['int_type']) for op, _, r in db.wal.read()] )
+
+        # a failed store leaves the log alone and the next one writes everything
+        SlowStorage.fail = True
+        stored = db.store(background=True)
+
+        with self.assertRaises(IOError):
+            stored.result()
+
+        self.assertTrue( MyModel.objects.dirty )
+        self.assertEqual( [('s', 4)], [(op, r['int_type']) for op, _, r in db.wal.read()] )
+
+        SlowStorage.fail = False
+        db.store(background=True).result()
+        self.assertEqual( [1, 2, 3, 4], [r['int_type'] for r in storage.read(MyModel)] )
+        self.assertEqual( [], list(db.wal.read()) )
+
+        MyModel.objects.clear()
@@ -13,6 +13,7 @@ from alkali.fields import DateTimeField, FloatField, SetField
 from alkali.fields import UUIDField
 from alkali.fields import ForeignKey, OneToOneField
 from alkali.model import Model
+from alkali import fromts
 
 from . import MyModel, MyMulti, MyDepModel, AutoModel1
 
@@ -76,6 +77,32 @@ class TestField( unittest.TestCase ):
 
         self.assertRaises( TypeError, f.cast, 1 )
 
+    def test_5a(self):
+        "test date dumps/loads"
+        f = DateTimeField()
+        v = f.cast('2017-01-02T03:04:05.678+02:00')
+
+        self.assertEqual( 2 * 3600, v.utcoffset().total_seconds() )
+        self.assertEqual( '2017-01-02T03:04:05.678000+02:00', f.dumps(v) )
+        self.assertEqual( v, f.loads(f.dumps(v)) )
+        self.assertIsNotNone( f.loads('2017-01-02T03:04:05').tzinfo )
+
+        # not isoformat, dateutil's turn
+        self.assertEqual( v, f.loads('Jan 2 2017 03:04:05.678 +0200') )
+
+        # digits aren't epochs unless asked for
+        self.assertEqual( 2017, f.loads('2017').year )
+
+        f = DateTimeField(epoch=True)
+        self.assertEqual( fromts(1), f.cast(1000000) )
+        self.assertEqual( v, f.loads(v.isoformat()) )
+        self.assertEqual( 1483319045678000, f.dumps(v) )
+        self.assertEqual( v, f.loads(f.dumps(v)) )
+        self.assertEqual( v, f.loads(str(f.dumps(v))) )
+        self.assertIsNotNone( f.loads(f.dumps(v)).tzinfo )
+        self.assertEqual( -1, f.dumps(fromts(0) - dt.timedelta(microseconds=1)) )
+        self.assertEqual( 'null', f.dumps(None) )
+
     def test_6(self):
         "test SetField"
         s = set([1, 2, 3])
@@ -228,6 +255,33 @@ class TestField( unittest.TestCase ):
         m = AutoModel2().save()
         self.assertEqual( 3, m.auto )
 
+    def test_auto_increment_load(self):
+        "test that loaded instances move the auto increment counter"
+        from alkali.storage import JSONStorage
+
+        class AutoModel3( Model ):
+            auto = IntField(primary_key=True, auto_increment=True)
+            other = IntField()
+
+        for i in range(3):
+            AutoModel3(other=i).save()
+
+        tfile = tempfile.NamedTemporaryFile()
+        AutoModel3.objects.store( JSONStorage(tfile.name) )
+
+        # a new process starts counting from scratch
+        del AutoModel3.Meta._auto_inc__auto
+        AutoModel3.objects.load( JSONStorage(tfile.name) )
+
+        m = AutoModel3().save()
+        self.assertEqual( 4, m.auto )
+        self.assertEqual( [0, 1, 2, None], [e.other for e in AutoModel3.objects.order_by('auto')] )
+
+        self.assertEqual( 10, AutoModel3(auto='10').auto )
+        self.assertEqual( 11, AutoModel3().auto )
+        self.assertEqual( 5, AutoModel3(auto=5).auto ) # lower doesn't go back
+        self.assertEqual( 12, AutoModel3().auto )
+
     def test_auto_now(self):
         class AutoModel1( Model ):
             auto = IntField(primary_key=True, auto_increment=True)
@@ -238,8 +292,33 @@ class TestField( unittest.TestCase ):
         curr = m.modified
         self.assertNotEqual(None, curr)
 
+        # stamped when a changed instance is saved, not per field change
         m.other = 2
+        self.assertEqual(curr, m.modified)
+
+        m.save()
         self.assertNotEqual(curr, m.modified)
+        self.assertEqual(m.modified, AutoModel1.objects.get(m.pk).modified)
+
+        curr = m.modified
+        m.save()
+        self.assertEqual(curr, m.modified)
+
+        # nor when a fetched instance is saved unchanged
+        m.other = 4
+        m.save()
+        curr = m.modified
+
+        fetched = AutoModel1.objects.get(m.pk)
+        self.assertFalse(fetched.dirty)
+        fetched.save()
+        self.assertEqual(curr, AutoModel1.objects.get(m.pk).modified)
+
+        fetched.other = 3
+        fetched.save()
+        self.assertNotEqual(curr, AutoModel1.objects.get(m.pk).modified)
+
+        self.assertEqual(['modified'], AutoModel1.Meta.auto_now_fields)
 
     def test_auto_now_add(self):
         class AutoModel1( Model ):
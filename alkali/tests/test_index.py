@@ -0,0 +1,313 @@
+import unittest
+import tempfile
+import datetime as dt
+
+from alkali.query import Q
+from alkali.index import Index, HashIndex, SortedIndex, make_index
+from alkali.storage import JSONStorage
+from alkali import fromts
+
+from . import MyModel, IndexModel, SortedModel
+
+class TestIndex( unittest.TestCase ):
+
+    def tearDown(self):
+        IndexModel.objects.clear()
+        SortedModel.objects.clear()
+        MyModel.objects.clear()
+
+    def test_1(self):
+        "verify class/instance implementation"
+        index = HashIndex('name')
+        self.assertTrue( repr(index) )
+        self.assertEqual( 0, len(index) )
+
+        with self.assertRaises(NotImplementedError):
+            Index('name')
+
+    def test_2(self):
+        "test adding and removing from a hash index"
+        index = HashIndex('name')
+
+        m1 = IndexModel(id=1, name='a')
+        m2 = IndexModel(id=2, name='a')
+        m3 = IndexModel(id=3, name='b')
+
+        for m in [m1, m2, m3]:
+            index.add(m)
+
+        self.assertEqual( {1, 2}, index.lookup('a') )
+        self.assertEqual( {3}, index.lookup('b') )
+        self.assertEqual( set(), index.lookup('c') )
+        self.assertEqual( {1, 2, 3}, index.lookup_in(['a', 'b', 'c']) )
+
+        index.remove(m1)
+        self.assertEqual( {2}, index.lookup('a') )
+
+        index.remove(m2)
+        index.remove(m2) # no-op
+        self.assertEqual( set(), index.lookup('a') )
+        self.assertEqual( 1, len(index) )
+
+    def test_3(self):
+        "test that manager keeps indexes current"
+        man = IndexModel.objects
+        self.assertEqual( ['foreign', 'name'], sorted(man.indexes.keys()) )
+        self.assertEqual( {}, MyModel.objects.indexes )
+
+        IndexModel(id=1, name='a').save()
+        IndexModel(id=2, name='a').save()
+        self.assertEqual( {1, 2}, man.indexes['name'].lookup('a') )
+
+        # changing a value moves it in the index
+        m = IndexModel.objects.get(2)
+        m.name = 'b'
+        m.save()
+        self.assertEqual( {1}, man.indexes['name'].lookup('a') )
+        self.assertEqual( {2}, man.indexes['name'].lookup('b') )
+
+        man.delete(m)
+        self.assertEqual( set(), man.indexes['name'].lookup('b') )
+
+        man.clear()
+        self.assertEqual( 0, len(man.indexes['name']) )
+
+    def test_4(self):
+        "test that loading builds indexes"
+        f = MyModel(int_type=1).save()
+
+        for i in range(3):
+            IndexModel(id=i, name='name %d' % i, foreign=f).save()
+
+        tfile = tempfile.NamedTemporaryFile()
+        storage = JSONStorage(tfile.name)
+        IndexModel.objects.store(storage)
+        IndexModel.objects.clear()
+
+        IndexModel.objects.load(storage)
+        self.assertEqual( {1}, IndexModel.objects.indexes['name'].lookup('name 1') )
+
+    def test_5(self):
+        "test that queries use indexes"
+        f1 = MyModel(int_type=1).save()
+        f2 = MyModel(int_type=2).save()
+
+        for i in range(10):
+            IndexModel(id=i, name='name %d' % (i % 3), foreign=[f1, f2][i % 2]).save()
+
+        q = IndexModel.objects.filter(name='name 1')
+        self.assertEqual( [1, 4, 7], [m.id for m in q] )
+
+        q = IndexModel.objects.filter(name__in=['name 1', 'name 2'])
+        self.assertEqual( [1, 2, 4, 5, 7, 8], [m.id for m in q] )
+
+        q = IndexModel.objects.filter(name='name 1', foreign=f2)
+        self.assertEqual( [1, 7], [m.id for m in q] )
+
+        q = IndexModel.objects.filter(name='name 1', id__gt=3)
+        self.assertEqual( [4, 7], [m.id for m in q] )
+
+        q = IndexModel.objects.filter(pk__in=[3, 1, 100])
+        self.assertEqual( [1, 3], [m.id for m in q] )
+
+        self.assertEqual( 4, IndexModel.objects.get(name='name 1', id__gt=3, id__lt=5).id )
+
+        with self.assertRaises(IndexModel.DoesNotExist):
+            IndexModel.objects.get(name='no such name')
+
+        # substring 'in' isn't answered by the index
+        q = IndexModel.objects.filter(name__in='xx name 1 xx')
+        self.assertEqual( [1, 4, 7], [m.id for m in q] )
+
+    def test_6(self):
+        "test that a query doesn't use indexes once the manager changes"
+        IndexModel(id=1, name='a').save()
+
+        q = IndexModel.objects.all()
+        IndexModel(id=2, name='a').save()
+
+        self.assertEqual( [1], [m.id for m in q.filter(name='a')] )
+        self.assertEqual( 2, len(IndexModel.objects.filter(name='a')) )
+
+    def test_7(self):
+        "test adding and removing from a sorted index"
+        self.assertEqual( SortedIndex, type(make_index('num', 'sorted')) )
+        self.assertEqual( HashIndex, type(make_index('num', True)) )
+
+        with self.assertRaises(AssertionError):
+            make_index('num', 'btree')
+
+        index = SortedIndex('num')
+        models = [SortedModel(id=i, num=i % 5) for i in range(10)]
+
+        for m in reversed(models):
+            index.add(m)
+
+        self.assertEqual( 10, len(index) )
+        self.assertEqual( {3, 8}, index.lookup(3) )
+        self.assertEqual( {3, 8, 4, 9}, index.lookup_in([3, 4]) )
+        self.assertEqual( {3, 8, 4, 9}, index.range(3) )
+        self.assertEqual( {4, 9}, index.range(3, low_inclusive=False) )
+        self.assertEqual( {0, 5}, index.range(high=1, high_inclusive=False) )
+        self.assertEqual( {1, 6, 2, 7}, index.range(1, 2) )
+        self.assertEqual( set(), index.range(3, 1) )
+
+        index.remove(models[3])
+        index.add(SortedModel(id=20, num=3))
+        self.assertEqual( {8, 20}, index.lookup(3) )
+
+        # remove and re-add before a lookup
+        index.remove(models[8])
+        index.add(models[8])
+        self.assertEqual( {8, 20}, index.lookup(3) )
+
+        # added and removed before a lookup
+        m = SortedModel(id=30, num=3)
+        index.add(m)
+        index.remove(m)
+        self.assertEqual( {8, 20}, index.lookup(3) )
+
+        index.add(SortedModel(id=40))
+        self.assertEqual( {40}, index.lookup(None) )
+        self.assertEqual( 11, len(index) )
+
+    def test_8(self):
+        "test that queries use sorted indexes"
+        for i in range(10):
+            SortedModel(id=i, num=i % 5, ts=fromts(i * 60)).save()
+
+        SortedModel(id=10).save()
+
+        q = SortedModel.objects.filter(num__ge=2, num__lt=4)
+        self.assertEqual( [2, 3, 7, 8], [m.id for m in q] )
+
+        q = SortedModel.objects.filter(num__gt=1, num__ge=3, num__le=4, num__lt=9)
+        self.assertEqual( [3, 4, 8, 9], [m.id for m in q] )
+
+        q = SortedModel.objects.filter(num=2)
+        self.assertEqual( [2, 7], [m.id for m in q] )
+
+        q = SortedModel.objects.filter(num=None)
+        self.assertEqual( [10], [m.id for m in q] )
+
+        q = SortedModel.objects.filter(ts__ge=fromts(120), ts__lt=fromts(300))
+        self.assertEqual( [2, 3, 4], [m.id for m in q] )
+
+        q = SortedModel.objects.filter(ts__gt=fromts(120), num__in=[1, 4])
+        self.assertEqual( [4, 6, 9], [m.id for m in q] )
+
+        m = SortedModel.objects.get(5)
+        m.num = 100
+        m.save()
+
+        q = SortedModel.objects.filter(num__ge=5)
+        self.assertEqual( [5], [m.id for m in q] )
+
+    def test_9(self):
+        "test that or queries use indexes"
+        for i in range(10):
+            SortedModel(id=i, num=i % 5).save()
+
+        q = SortedModel.objects.filter( Q(num=1) | Q(num__ge=4) )
+        self.assertEqual( {1, 4, 6, 9}, q._index_lookup(q._filters[0]) )
+        self.assertEqual( [1, 4, 6, 9], [m.id for m in q] )
+
+        q = SortedModel.objects.filter( Q(num=1) | Q(id=9) )
+        self.assertEqual( {1, 6, 9}, q._index_lookup(q._filters[0]) )
+
+        q = SortedModel.objects.filter( Q(num=1) | Q(id__gt=8) ) # no index on id
+        self.assertIsNone( q._index_lookup(q._filters[0]) )
+
+        q = SortedModel.objects.filter( Q(num=1) | ~Q(num=2) )
+        self.assertIsNone( q._index_lookup(q._filters[0]) )
+        self.assertEqual( 8, len(q) )
+
+    def test_10(self):
+        "test that limit() uses sorted indexes"
+        for i in range(20):
+            SortedModel(id=i, num=i % 7, ts=fromts(i)).save()
+
+        index = SortedModel.objects.indexes['num']
+        self.assertEqual( {0, 7, 14}, index.first(1) )
+        self.assertEqual( {0, 7, 14, 1, 8, 15}, index.first(4) )
+        self.assertEqual( {6, 13}, index.first(2, reverse=True) )
+        self.assertEqual( 20, len(index.first(100)) )
+
+        q = SortedModel.objects.order_by('-num')
+        self.assertEqual( [6, 13, 5, 12], [m.id for m in q.limit(4)] )
+        self.assertEqual( [7, 14], [m.id for m in q.limit(-2)] )
+
+        q = SortedModel.objects.order_by('ts')
+        self.assertEqual( [0, 1, 2], [m.id for m in q.limit(3)] )
+
+        SortedModel(id=100).save()
+        self.assertIsNone( index.first(1) )
+
+        # None sorts last so can't be selected from the index
+        self.assertEqual( [0, 7, 14], [m.id for m in SortedModel.objects.order_by('num').limit(3)] )
+        self.assertEqual( [100, 6], [m.id for m in SortedModel.objects.order_by('-num').limit(2)] )
+
+    def test_11(self):
+        "test merging a few and many additions into a sorted index"
+        index = SortedIndex('num')
+        index.insort_max = 4
+
+        for i in range(20):
+            index.add(SortedModel(id=i, num=i % 5))
+
+        self.assertEqual( {1, 6, 11, 16}, index.lookup(1) ) # sorted
+
+        for i in range(20, 23):
+            index.add(SortedModel(id=i, num=i % 5))
+
+        self.assertEqual( {1, 6, 11, 16, 21}, index.lookup(1) ) # inserted
+        self.assertEqual( sorted(index._values), index._values )
+        self.assertEqual( {21, 22}, index.range(1, 2) - set(range(20)) )
+
+        for i in range(23, 30):
+            index.add(SortedModel(id=i, num=-i))
+
+        self.assertEqual( {27, 28, 29}, index.range(high=-27) ) # sorted again
+        self.assertEqual( sorted(index._values), index._values )
+        self.assertEqual( 30, len(index) )
+
+    def test_12(self):
+        "test that a query's results don't keep the manager copy-on-write"
+        for i in range(5):
+            IndexModel(id=i, name='n %d' % i).save()
+
+        man = IndexModel.objects
+        instances = man._instances
+
+        # get() has its results, saving doesn't copy every instance
+        m = IndexModel.objects.get(name='n 1')
+        m.name = 'changed'
+        m.save()
+        self.assertIs( instances, man._instances )
+
+        # a query that hasn't run still sees the instances it was created with
+        q = IndexModel.objects.filter(name='n 2')
+        IndexModel(id=2, name='other').save()
+        self.assertIsNot( instances, man._instances )
+        self.assertEqual( [2], [e.id for e in q] )
+        self.assertEqual( [], list(IndexModel.objects.filter(name='n 2')) )
+
+    def test_13(self):
+        "test limit() from a sorted index"
+        for i in range(5):
+            SortedModel(id=i, num=i % 3).save()
+
+        # no fields doesn't change the order
+        self.assertEqual( [0, 1], [m.id for m in SortedModel.objects.order_by().limit(2)] )
+        self.assertEqual( 0, SortedModel.objects.order_by().first().id )
+        self.assertEqual( [2, 1], [m.id for m in SortedModel.objects.order_by().order_by('-num').limit(2)] )
+
+        # answered from the index, the query gives the manager's snapshot back
+        man = SortedModel.objects
+        instances = man._instances
+
+        self.assertEqual( [2, 1], [m.id for m in SortedModel.objects.order_by('-num').limit(2)] )
+        self.assertEqual( 0, man._shared )
+
+        SortedModel(id=10, num=1).save()
+        self.assertIs( instances, man._instances )
@@ -1,13 +1,14 @@
 import os
 import unittest
 import tempfile
+import threading
 from zope.interface.verify import verifyObject, verifyClass
 import datetime as dt
 import json
 
 from alkali.model import Model
-from alkali.manager import Manager
-from alkali.storage import JSONStorage
+from alkali.manager import Manager, LazyInstances
+from alkali.storage import JSONStorage, JSONLinesStorage, MappedStorage, Storage
 from alkali.query import Query
 from alkali import fields
 from alkali import tznow
@@ -276,3 +277,191 @@ class TestManager( unittest.TestCase ):
         self.assertEqual(1, MyModel.objects.get(int_type=1).int_type)
 
         self.assertEqual(1, MyModel.objects.count)
+
+    def test_changes(self):
+        "test tracking inserted, updated and deleted instances"
+        man = MyModel.objects
+        self.assertEqual( (set(), set(), set()), man.changes )
+
+        for i in range(4):
+            MyModel(int_type=i).save()
+
+        self.assertEqual( ({0, 1, 2, 3}, set(), set()), man.changes )
+
+        tfile = tempfile.NamedTemporaryFile()
+        storage = JSONStorage( tfile.name )
+        man.store(storage)
+        self.assertEqual( (set(), set(), set()), man.changes )
+
+        MyModel(int_type=1, str_type='changed').save()
+        MyModel(int_type=10).save()
+        man.delete( MyModel(int_type=2) )
+        man.delete( MyModel(int_type=10) ) # never stored
+        man.delete( MyModel(int_type=3) )
+        MyModel(int_type=3).save() # deleted and back again
+        self.assertEqual( (set(), {1, 3}, {2}), man.changes )
+
+        # storage that can't write changes gets everything
+        man.store(storage)
+        self.assertEqual( [0, 1, 3], [d['int_type'] for d in storage.read(MyModel)] )
+
+        man.clear()
+        self.assertEqual( (set(), set(), set()), man.changes )
+
+    def test_write_changes(self):
+        "test that store() hands changes to storage"
+        class ChangeStorage(Storage):
+            def __init__(self):
+                self.writes = []
+
+            def write(self, model_class, iterator):
+                self.writes.append( ('all', [e.pk for e in iterator]) )
+                return True
+
+            def write_changes(self, model_class, inserted, updated, deleted):
+                self.writes.append( ('changes',
+                    [e.pk for e in inserted], [e.pk for e in updated], [e.pk for e in deleted]) )
+                return True
+
+        man = MyModel.objects
+        storage = ChangeStorage()
+
+        MyModel(int_type=1).save()
+        MyModel(int_type=2).save()
+        man.store(storage)
+
+        MyModel(int_type=3).save()
+        MyModel(int_type=1, str_type='changed').save()
+        man.delete( MyModel(int_type=2) )
+        man.store(storage)
+        man.store(storage) # not dirty
+
+        MyModel(int_type=4).save()
+        man.store(storage, force=True)
+
+        # different storage, not what we're synced with
+        other = ChangeStorage()
+        MyModel(int_type=5).save()
+        man.store(other)
+
+        self.assertEqual( [
+            ('all', [1, 2]),
+            ('changes', [3], [1], [2]),
+            ('all', [1, 3, 4]),
+            ], storage.writes )
+
+        self.assertEqual( [('all', [1, 3, 4, 5])], other.writes )
+
+    def test_changes_created_foreign(self):
+        "instances created by a OneToOneField are changes too"
+        class Parent(Model):
+            id = fields.IntField(primary_key=True)
+
+        class Child(Model):
+            parent = fields.OneToOneField(Parent, primary_key=True)
+
+        tdir = tempfile.TemporaryDirectory()
+        pstorage = JSONLinesStorage( os.path.join(tdir.name, 'parent.jsonl') )
+        cstorage = JSONLinesStorage( os.path.join(tdir.name, 'child.jsonl') )
+
+        Parent(id=1).save()
+        Parent.objects.store(pstorage)
+        Child.objects.store(cstorage, force=True)
+
+        Parent(id=2).save()
+        self.assertEqual( ({2}, set(), set()), Child.objects.changes )
+
+        Parent.objects.store(pstorage)
+        Child.objects.store(cstorage)
+
+        Parent.objects.load(pstorage)
+        Child.objects.load(cstorage)
+        self.assertEqual( 2, len(Child.objects) )
+
+        # loading isn't a change
+        self.assertEqual( (set(), set(), set()), Child.objects.changes )
+        self.assertFalse( Child.objects.dirty )
+
+    def test_store_releases(self):
+        "test that storing doesn't leave the instances copy-on-write"
+        man = MyModel.objects
+
+        for i in range(3):
+            MyModel(int_type=i).save()
+
+        tfile = tempfile.NamedTemporaryFile()
+        storage = JSONStorage( tfile.name )
+        instances = man._instances
+
+        man.store(storage)
+        self.assertEqual( 0, man._shared )
+
+        MyModel(int_type=1, str_type='changed').save()
+        self.assertIs( instances, man._instances )
+
+        # a job run on another thread leaves the snapshot to the next save
+        job = man.store_job(storage)
+        thread = threading.Thread(target=job)
+        thread.start()
+        thread.join()
+        self.assertEqual( 1, man._shared )
+
+        MyModel(int_type=5).save()
+        self.assertIsNot( instances, man._instances )
+
+    def test_lazy_load(self):
+        "test loading from storage that supports read_lazy()"
+        tdir = tempfile.TemporaryDirectory()
+        filename = os.path.join(tdir.name, 'MyModel.bin')
+        storage = MappedStorage( filename )
+
+        man = MyModel.objects
+        now = tznow()
+
+        for i in range(10):
+            MyModel(int_type=i, str_type='str %d' % i, dt_type=now).save()
+
+        man.store(storage)
+        self.assertTrue( os.path.exists(storage.index_filename) )
+
+        man.load(storage)
+        self.assertIsInstance( man._instances, LazyInstances )
+        self.assertEqual( 10, len(man) )
+        self.assertEqual( list(range(10)), man.pks )
+        self.assertEqual( 0, man._instances.loaded )
+
+        self.assertEqual( 'str 3', man.get(3).str_type )
+        self.assertEqual( now, man.get(3).dt_type )
+        self.assertEqual( 1, man._instances.loaded )
+
+        with self.assertRaises(KeyError):
+            man.get(10)
+
+        MyModel(int_type=10).save()
+        MyModel(int_type=4, str_type='changed').save()
+        man.delete( MyModel(int_type=5) )
+        self.assertEqual( 10, len(man) )
+        self.assertNotIn( 5, man.pks )
+        self.assertEqual( 3, man._instances.loaded )
+
+        # a query looks at every instance
+        self.assertEqual( [4], [m.int_type for m in man.filter(str_type='changed')] )
+        self.assertEqual( 10, man._instances.loaded )
+
+        # writing out doesn't keep what it creates
+        man.load(storage)
+        MyModel(int_type=11).save()
+        man.store(storage)
+        self.assertEqual( 1, man._instances.loaded )
+
+        man.load(storage)
+        self.assertEqual( list(range(10)) + [11], man.pks )
+
+        # a stale or missing index is rebuilt
+        os.unlink(storage.index_filename)
+        man.load(storage)
+        self.assertEqual( 11, len(man) )
+        self.assertTrue( os.path.exists(storage.index_filename) )
+
+        # other storage loads everything
+        self.assertIsNone( JSONStorage( os.path.join(tdir.name, 'MyModel.json') ).read_lazy(MyModel) )
@@ -1,10 +1,15 @@
 import os
+import sys
+import copy
+import pickle
+import tempfile
 import unittest
 from zope.interface.verify import verifyObject, verifyClass
 
 from alkali.model import Model
 from alkali import fields
 from alkali import tznow
+from alkali import signals
 from . import EmptyModel, MyModel, MyMulti
 
 class TestModel( unittest.TestCase ):
@@ -225,3 +230,188 @@ class TestModel( unittest.TestCase ):
     def test_doesnotexist(self):
         self.assertEqual( MyModel.ObjectDoesNotExist, MyMulti.ObjectDoesNotExist )
         self.assertNotEqual( MyModel.DoesNotExist, MyMulti.DoesNotExist )
+
+    def test_view(self):
+        "test copy-on-write views"
+        m1 = MyModel(int_type=1, str_type='string')
+        v = m1.view()
+
+        self.assertEqual( MyModel, type(v) )
+        self.assertEqual( m1, v )
+        self.assertIs( m1.__dict__, v.__dict__ )
+
+        # writing to the view gives it its own values
+        v.str_type = 'new string'
+        self.assertIsNot( m1.__dict__, v.__dict__ )
+        self.assertEqual( 'string', m1.str_type )
+        self.assertEqual( 'new string', v.str_type )
+        self.assertTrue( v.dirty )
+        self.assertFalse( m1.dirty )
+
+        # and so do non-field attributes
+        v = m1.view()
+        v.foo = 'foo'
+        self.assertFalse( hasattr(m1, 'foo') )
+
+        v = m1.view()
+        v.set_field(MyModel.Meta.fields['str_type'], 'other')
+        self.assertEqual( 'string', m1.str_type )
+
+    def test_view_copy(self):
+        "test that copies don't go through model creation"
+        created = []
+        m1 = MyModel(int_type=1).save()
+
+        with signals.creation.connected_to(lambda sender, instance: created.append(instance)):
+            for m in MyModel.objects.all():
+                self.assertEqual( m1, m )
+
+            m2 = copy.copy(m1)
+
+        self.assertEqual( [], created )
+        self.assertIsNot( m1.__dict__, m2.__dict__ )
+        self.assertEqual( m1.dict, m2.dict )
+
+    def test_pickle(self):
+        "test pickle and deepcopy of instances and views"
+        m = MyModel(int_type=1, str_type='foo', dt_type=tznow()).save()
+
+        for e in [m, MyModel.objects.get(1)]:
+            for c in [pickle.loads(pickle.dumps(e)), copy.deepcopy(e)]:
+                self.assertEqual( e.dict, c.dict )
+                self.assertFalse( c._shared )
+
+                c.str_type = 'bar'
+                self.assertEqual( 'foo', e.str_type )
+
+    def test_constructor(self):
+        "test the generated constructor"
+        from . import AutoModel1
+
+        class Every(Model):
+            i   = fields.IntField(primary_key=True)
+            f   = fields.FloatField()
+            b   = fields.BoolField()
+            s   = fields.StringField()
+            d   = fields.DateTimeField()
+            st  = fields.SetField()
+            u   = fields.UUIDField()
+
+        self.assertEqual( 'Every.__create__', Every._create.__qualname__ )
+
+        m = Every(i='1', f=2, b='no', s=3, d='2017-01-02T03:04:05+00:00', st=[1, 1])
+        self.assertEqual( (1, 2.0, False, '3'), (m.i, m.f, m.b, m.s) )
+        self.assertEqual( (int, float), (type(m.i), type(m.f)) )
+        self.assertEqual( 0, m.d.utcoffset().total_seconds() )
+        self.assertEqual( {1}, m.st )
+        self.assertEqual( 36, len(m.u) )
+        self.assertFalse( m.dirty )
+
+        m = Every(pk=2)
+        self.assertEqual( 2, m.pk )
+        self.assertEqual( [None] * 5, [m.f, m.b, m.s, m.d, m.st] )
+        self.assertIsNotNone( Every(d=tznow().replace(tzinfo=None)).d.tzinfo )
+
+        with self.assertRaises(AssertionError):
+            Every(pk=1, i=1)
+
+        # auto fields get their defaults when not given
+        a1 = AutoModel1()
+        a2 = AutoModel1()
+        self.assertEqual( a1.auto + 1, a2.auto )
+        self.assertIsNotNone( a1.creation.tzinfo )
+        self.assertIsNotNone( a1.modified.tzinfo )
+
+        # other keywords are set and creation is sent
+        created = []
+        def on_create(sender, instance):
+            created.append(instance)
+
+        signals.creation.connect(on_create, sender=Every)
+        m = Every(i=3, other='x')
+        signals.creation.disconnect(on_create, sender=Every)
+
+        self.assertEqual( 'x', m.other )
+        self.assertEqual( [m], created )
+
+        # a model's own __init__ is still called
+        class Inits(Model):
+            i = fields.IntField(primary_key=True)
+
+            def __init__(self, *args, **kw):
+                self.args = args
+                Model.__init__(self, **kw)
+
+        m = Inits(i=1, other='y')
+        self.assertEqual( (1, 'y', ()), (m.i, m.other, m.args) )
+
+    def test_slots(self):
+        "test Meta.slots models"
+        from alkali.model import SlotDict
+        from alkali.storage import JSONStorage
+
+        class Slot(Model):
+            class Meta:
+                slots = True
+
+            i = fields.IntField(primary_key=True)
+            s = fields.StringField()
+            d = fields.DateTimeField(auto_now=True)
+
+        class Plain(Model):
+            i = fields.IntField(primary_key=True)
+            s = fields.StringField()
+            d = fields.DateTimeField(auto_now=True)
+
+        self.assertTrue( Slot.Meta.slots )
+        self.assertFalse( Plain.Meta.slots )
+
+        m = Slot(i='1', s='foo')
+        self.assertEqual( (1, 'foo'), (m.i, m.s) )
+        self.assertIsNotNone( m.d )
+        self.assertIsInstance( m.__dict__, SlotDict )
+        self.assertEqual( 1, m.__dict__['i'] )
+        self.assertEqual( {'i', 's', 'd', '_dirty'}, set(m.__dict__) )
+        self.assertEqual( 1, m.pk )
+        self.assertIn( '_memo_pk', m.__dict__ )
+        self.assertEqual( m.dict, Plain(i=1, s='foo', d=m.d).dict )
+
+        with self.assertRaises(AttributeError):
+            m.other = 1
+
+        with self.assertRaises(AttributeError):
+            Slot(i=2, other=1)
+
+        with self.assertRaises(TypeError):
+            Slot.objects.all().annotate(foo='foo')
+
+        # copies (and pickles) through its slots
+        c = copy.deepcopy(m)
+        self.assertEqual( m.dict, c.dict )
+        self.assertIsInstance( c.__dict__, SlotDict )
+
+        # values are slots, not a dict per instance
+        self.assertLess( sys.getsizeof(m), sys.getsizeof(Plain(i=1)) + sys.getsizeof(Plain(i=1).__dict__) )
+
+        m.s = 'bar'
+        self.assertTrue( m.dirty )
+
+        # views are copies
+        v = m.view()
+        v.s = 'baz'
+        self.assertEqual( ('bar', 'baz'), (m.s, v.s) )
+        self.assertEqual( m, copy.copy(m) )
+
+        # works with the manager and storage
+        Slot.objects.save(m)
+        Slot.objects.save( Slot(i=2, s='two') )
+        self.assertEqual( 'bar', Slot.objects.get(i=1).s )
+        self.assertEqual( [2], [e.i for e in Slot.objects.filter(s='two')] )
+
+        tfile = tempfile.NamedTemporaryFile()
+        Slot.objects.store( JSONStorage(tfile.name) )
+
+        Slot.objects.clear()
+        Slot.objects.load( JSONStorage(tfile.name) )
+        self.assertEqual( ['bar', 'two'], [e.s for e in Slot.objects.order_by('i')] )
+        self.assertEqual( m.d, Slot.objects.get(1).d )
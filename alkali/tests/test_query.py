@@ -1,6 +1,6 @@
 import unittest
 
-from alkali.query import Query
+from alkali.query import Query, Q
 from alkali import tznow, fromts
 
 from . import MyModel, MyMulti
@@ -83,6 +83,13 @@ class TestQuery( unittest.TestCase ):
         self.assertNotEqual( id(man._instances[1]), id(q[0]) )
         self.assertNotEqual( id(man._instances[1]), id(list(q)[0]) )
 
+        # slices are lists of copies too
+        MyModel(int_type=2).save()
+        q = Query(man).order_by('int_type')
+        self.assertEqual( [1], [e.pk for e in q[0:1]] )
+        self.assertEqual( [1, 2], [e.pk for e in q[:]] )
+        self.assertNotEqual( id(man._instances[1]), id(q[0:1][0]) )
+
     def test_15(self):
         "make sure query objects are not 'updated' when manager objects changes"
 
@@ -354,6 +361,31 @@ class TestQuery( unittest.TestCase ):
         d = {'int_type__max': 3}
         self.assertDictEqual( d, q.aggregate(Max('int_type')) )
 
+    def test_agg_called(self):
+        "an aggregate with only __call__ and no accumulator"
+        for i in range(1,4):
+            MyModel(int_type=i, str_type='s{}'.format(i % 2)).save()
+
+        from alkali.query import Aggregate, Sum
+
+        class First(Aggregate):
+            def __call__(self, query):
+                return query.order_by(self.field).values_list(self.field, flat=True)[0]
+
+        q = MyModel.objects.all()
+
+        d = {'int_type__first': 1}
+        self.assertDictEqual( d, q.aggregate(First('int_type')) )
+
+        d = {'int_type__sum': 6, 'int_type__first': 1, 'foo': 1}
+        self.assertDictEqual( d, q.aggregate(Sum('int_type'), First('int_type'), foo=First('int_type')) )
+
+        d = {
+            's0': {'int_type__first': 2, 'int_type__sum': 2},
+            's1': {'int_type__first': 1, 'int_type__sum': 4},
+        }
+        self.assertDictEqual( d, q.group_by('str_type').aggregate(First('int_type'), Sum('int_type')) )
+
     def test_annotate_1(self):
         "test hard-coded annotation"
         m = MyModel(int_type=0, str_type='string').save()
@@ -439,3 +471,217 @@ class TestQuery( unittest.TestCase ):
 
         g2 = groups['string 2'].all().order_by('int_type').values_list('int_type', flat=True)
         self.assertEqual(set(expected['string 2']), set(g2))
+
+    def test_lazy_1(self):
+        "queries only run when their results are needed"
+        for i in range(10):
+            MyModel(int_type=i, str_type='string %d' % (i % 2)).save()
+
+        q = MyModel.objects.filter(int_type__gt=0).filter(int_type__lt=5).order_by('-int_type')
+        self.assertIsNone( q._elems )
+
+        self.assertEqual( 4, len(q) )
+        self.assertEqual( [4, 3, 2, 1], q.values_list('int_type', flat=True) )
+
+        # keep filtering a query that has already run
+        q.filter(str_type='string 1').order_by('int_type')
+        self.assertEqual( [1, 3], [m.int_type for m in q] )
+
+    def test_lazy_2(self):
+        "lazy queries still see the manager as it was when created"
+        for i in range(3):
+            MyModel(int_type=i).save()
+
+        q = MyModel.objects.filter(int_type__ge=1)
+        MyModel(int_type=3).save()
+        MyModel.objects.delete(MyModel.objects.get(1))
+
+        self.assertEqual( [1, 2], [m.int_type for m in q] )
+        self.assertEqual( [2, 3], [m.int_type for m in MyModel.objects.filter(int_type__ge=1)] )
+
+    def test_q_1(self):
+        "test or/not queries"
+        for i in range(6):
+            MyModel(int_type=i, str_type='string %d' % (i % 3)).save()
+
+        q = MyModel.objects.filter( Q(int_type=1) | Q(int_type__gt=3) )
+        self.assertEqual( [1, 4, 5], q.values_list('int_type', flat=True) )
+
+        q = MyModel.objects.filter( ~Q(str_type='string 0') )
+        self.assertEqual( [1, 2, 4, 5], q.values_list('int_type', flat=True) )
+
+        q = MyModel.objects.filter( ~Q(str_type='string 0'), int_type__lt=4 )
+        self.assertEqual( [1, 2], q.values_list('int_type', flat=True) )
+
+        q = MyModel.objects.filter( Q(str_type__rei='^STRING 1') | (Q(int_type__ge=4) & ~Q(int_type=5)) )
+        self.assertEqual( [1, 4], q.values_list('int_type', flat=True) )
+
+        q = MyModel.objects.filter( Q() )
+        self.assertEqual( 6, len(q) )
+
+        q = MyModel.objects.filter( Q() | Q(int_type=1) )
+        self.assertEqual( 6, len(q) )
+
+        self.assertTrue( repr( ~Q(int_type=1) | Q(str_type='a') ) )
+
+    def test_q_2(self):
+        "test compiled expressions"
+        q1 = Q(int_type=1) | ~Q(str_type__in=['a', 'b'])
+        q2 = Q(int_type=2) | ~Q(str_type__in=['c'])
+        q3 = Q(int_type=2) & ~Q(str_type__in=['c'])
+
+        self.assertEqual( q1.signature, q2.signature )
+        self.assertNotEqual( q1.signature, q3.signature )
+
+        q1.compile()
+        from alkali.query import _factories
+        self.assertIn( q2.signature, _factories )
+
+        p = q2.compile()
+        self.assertTrue( p(MyModel(int_type=2, str_type='c')) )
+        self.assertTrue( p(MyModel(int_type=1, str_type='a')) )
+        self.assertFalse( p(MyModel(int_type=1, str_type='c')) )
+
+    def test_q_3(self):
+        "test in/rin with different value types"
+        for i in range(3):
+            MyModel(int_type=i, str_type='string %d' % i).save()
+
+        q = MyModel.objects.filter( int_type__in=(i for i in [0, 2]) )
+        self.assertEqual( [0, 2], q.values_list('int_type', flat=True) )
+
+        q = MyModel.objects.filter( str_type__in=[['x'], 'string 2'] ) # unhashable
+        self.assertEqual( [2], q.values_list('int_type', flat=True) )
+
+        q = MyModel.objects.filter( iter_type__rin=[0, 1] )
+        self.assertEqual( [0, 1], q.values_list('int_type', flat=True) )
+
+        with self.assertRaises( AttributeError ):
+            MyModel.objects.filter( int_type__nosuchop=1 )
+
+    def test_limit_top(self):
+        "test that limit() on an ordered query gives the same results as sorting everything"
+        import random
+        rand = random.Random(42)
+
+        for i in range(50):
+            MyModel(int_type=i, str_type='string %d' % rand.randint(0, 5)).save()
+
+        def expected(q, n):
+            elems = list(q)
+            return elems[:n] if n > 0 else elems[n:]
+
+        for ordering in [('str_type',), ('-str_type',), ('-int_type', 'str_type'), ('pk',)]:
+            for n in [1, 3, 10, -1, -7, 49, 50, 100]:
+                q1 = MyModel.objects.filter(int_type__gt=2).order_by(*ordering)
+                q2 = MyModel.objects.filter(int_type__gt=2).order_by(*ordering)
+                self.assertEqual( expected(q1, n), q2.limit(n) )
+
+        q = MyModel.objects.order_by('-str_type')
+        self.assertEqual( q.limit(5), list(q)[:5] )
+
+        self.assertEqual( 49, MyModel.objects.order_by('-int_type').first().int_type )
+
+    def test_order_by_multi(self):
+        "test sorting by several fields in different directions"
+        MyModel(int_type=1, str_type='b').save()
+        MyModel(int_type=2, str_type='a').save()
+        MyModel(int_type=3, str_type='b').save()
+        MyModel(int_type=4).save()
+
+        def ids(q):
+            return [m.int_type for m in q]
+
+        self.assertEqual( [2, 1, 3, 4], ids(MyModel.objects.order_by('str_type', 'int_type')) )
+        self.assertEqual( [2, 3, 1, 4], ids(MyModel.objects.order_by('str_type', '-int_type')) )
+        self.assertEqual( [4, 3, 1, 2], ids(MyModel.objects.order_by('-str_type', '-int_type')) )
+        self.assertEqual( [4, 1, 3, 2], ids(MyModel.objects.order_by('-str_type', 'int_type')) )
+
+        # newest order_by takes precedence
+        self.assertEqual( [2, 3, 1, 4], ids(MyModel.objects.order_by('-int_type').order_by('str_type')) )
+
+        # order an already sorted query
+        q = MyModel.objects.order_by('-int_type')
+        self.assertEqual( [4, 3, 2, 1], ids(q) )
+        self.assertEqual( [2, 3, 1, 4], ids(q.order_by('str_type')) )
+
+        self.assertEqual( [4, 3], ids(MyModel.objects.order_by('-str_type', '-int_type').limit(2)) )
+        self.assertEqual( [1, 4], ids(MyModel.objects.order_by('str_type', '-int_type').limit(-2)) )
+
+    def test_agg_more(self):
+        "test the statistical aggregates"
+        from alkali.query import Count, Sum, Max, Min, Avg, Variance, StdDev, \
+            CountDistinct, Percentile, Median
+
+        for i, s in enumerate(['a', 'b', 'a', 'c', 'a'], 1):
+            MyModel(int_type=i * 2, str_type=s).save()
+
+        q = MyModel.objects.all()
+
+        expected = {
+            'int_type__count': 5,
+            'int_type__sum': 30,
+            'int_type__max': 10,
+            'int_type__min': 2,
+            'int_type__avg': 6,
+            'int_type__variance': 8,
+            'int_type__stddev': 8 ** 0.5,
+            'str_type__countdistinct': 3,
+            'int_type__percentile_25': 4,
+            'int_type__percentile_90': 9.2,
+            'int_type__median': 6,
+        }
+
+        results = q.aggregate(Count('int_type'), Sum('int_type'), Max('int_type'),
+                Min('int_type'), Avg('int_type'), Variance('int_type'), StdDev('int_type'),
+                CountDistinct('str_type'), Percentile('int_type', 0.25),
+                Percentile('int_type', 0.9), Median('int_type'))
+
+        self.assertEqual( expected.keys(), results.keys() )
+        for key, value in expected.items():
+            self.assertAlmostEqual( value, results[key] )
+
+        self.assertAlmostEqual( 10, q.aggregate(v=Variance('int_type', sample=True))['v'] )
+        self.assertEqual( 10, Max('int_type')(q) )
+
+        q = MyModel.objects.filter(int_type__gt=100)
+        self.assertEqual( {'c': 0, 's': 0, 'a': None, 'v': None, 'p': None},
+            q.aggregate(c=Count('int_type'), s=Sum('int_type'), a=Avg('int_type'),
+                v=StdDev('int_type'), p=Median('int_type')) )
+
+        with self.assertRaises( ValueError ):
+            q.aggregate(Max('int_type'))
+
+        with self.assertRaises( AssertionError ):
+            Percentile('int_type', 95)
+
+    def test_groupby_2(self):
+        "test grouping a filtered query"
+        for i in range(10):
+            MyModel(int_type=i, str_type='string %d' % (i % 3)).save()
+
+        groups = MyModel.objects.filter(int_type__ge=5).group_by('str_type')
+        self.assertEqual( 3, len(groups) )
+        self.assertTrue( repr(groups) )
+
+        self.assertEqual( [6, 9], groups['string 0'].values_list('int_type', flat=True) )
+        self.assertEqual( [5, 8], groups['string 2'].values_list('int_type', flat=True) )
+        self.assertEqual( [8], groups['string 2'].filter(int_type__gt=5).values_list('int_type', flat=True) )
+
+    def test_groupby_aggregate(self):
+        "test aggregating each group"
+        from alkali.query import Count, Sum, Max
+
+        for i in range(10):
+            MyModel(int_type=i, str_type='string %d' % (i % 3)).save()
+
+        groups = MyModel.objects.filter(int_type__ge=3).group_by('str_type')
+        results = groups.aggregate(Sum('int_type'), Max('int_type'), n=Count('int_type'))
+
+        self.assertIsNone( groups._groups ) # didn't need the actual groups
+
+        self.assertEqual( {
+            'string 0': {'int_type__sum': 18, 'int_type__max': 9, 'n': 3},
+            'string 1': {'int_type__sum': 11, 'int_type__max': 7, 'n': 2},
+            'string 2': {'int_type__sum': 13, 'int_type__max': 8, 'n': 2},
+            }, results )
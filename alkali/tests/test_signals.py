@@ -50,3 +50,36 @@ class TestSignals( unittest.TestCase ):
                 MyModel(int_type=2).save()
                 pre.cb.assert_called_once()
                 post.cb.assert_called_once()
+
+    def test_has_receivers(self):
+        "the has-receivers cache follows connect/disconnect"
+        sig = signals.field_update
+
+        self.assertIsInstance( sig, signals.Signal )
+        self.assertFalse( sig.has_receivers_for(MyModel) )
+
+        cb = mock.Mock()
+        sig.connect(cb.cb, sender=MyModel)
+        self.assertTrue( sig.has_receivers_for(MyModel) )
+        self.assertFalse( sig.has_receivers_for(object) )
+
+        m = MyModel(int_type=1)
+        m.str_type = 'foo'
+        cb.cb.assert_called_once()
+
+        sig.disconnect(cb.cb, sender=MyModel)
+        self.assertFalse( sig.has_receivers_for(MyModel) )
+
+        m.str_type = 'bar'
+        cb.cb.assert_called_once()
+
+        # weak receivers that go away are disconnected
+        def receiver(sender, **kw):
+            pass
+
+        sig.connect(receiver)
+        self.assertTrue( sig.has_receivers_for(MyModel) )
+
+        del receiver
+        self.assertFalse( sig.has_receivers_for(MyModel) )
+        self.assertEqual( [], sig.send(MyModel, field='str_type') )
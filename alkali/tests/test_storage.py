@@ -3,12 +3,18 @@ import unittest
 import tempfile
 import csv
 import json
+import mock
+import weakref
+import datetime as dt
 
 from alkali import Model, fields
-from alkali.storage import FileStorage, JSONStorage, CSVStorage, MultiStorage
+from alkali.storage import FileStorage, JSONStorage, CSVStorage, MultiStorage, JSONLinesStorage
 from alkali.storage import FileAlreadyLocked, Storage
+from alkali.storage.json import iter_array
+from alkali.storage.binary import BinaryStorage, BinaryFormatError
+from alkali.storage.mapped import MappedStorage
 from alkali import tznow
-from . import MyModel, MyDepModel, AutoModel1, AutoModel2
+from . import MyModel, MyDepModel, MyMulti, AutoModel1, AutoModel2
 
 
 class TestStorage( unittest.TestCase ):
@@ -39,7 +45,7 @@ class TestStorage( unittest.TestCase ):
         "write should handle empty dicts vs None"
         tfile = tempfile.NamedTemporaryFile()
 
-        for storage in [FileStorage, JSONStorage, CSVStorage]:
+        for storage in [FileStorage, JSONStorage, CSVStorage, JSONLinesStorage]:
             self.assertTrue( storage(tfile.name).write(MyModel, iter([])) )
             self.assertFalse( storage(tfile.name).write(MyModel, None) )
 
@@ -90,6 +96,40 @@ class TestStorage( unittest.TestCase ):
         loaded = [e for e in storage.read(MyModel)]
         self.assertEqual( 0, len(loaded) )
 
+    def test_3c(self):
+        "test incremental json parsing"
+        data = [{'a': 1, 'b': 'x , ] [ y'}, 12345, -1.5e10, "str", [1, [2]], {}, None, True]
+        doc = json.dumps(data, indent='  ')
+
+        # split into every block size
+        for size in range(1, len(doc) + 1):
+            blocks = [doc[i:i + size] for i in range(0, len(doc), size)]
+            self.assertEqual( data, list(iter_array(blocks)) )
+
+        self.assertEqual( [], list(iter_array([])) )
+        self.assertEqual( [], list(iter_array([' [', ' ] '])) )
+
+        for bad in ['{}', '[1 2]', '[1,]', '[1', '[{"a": 1]', '[', 'x']:
+            with self.assertRaises(json.JSONDecodeError):
+                list(iter_array([bad]))
+
+    def test_3d(self):
+        "test that json is read a block at a time"
+        tfile = tempfile.NamedTemporaryFile()
+        storage = JSONStorage( tfile.name )
+        storage.block_size = 16
+
+        entries = [MyModel(int_type=i, str_type='x' * i) for i in range(50)]
+        self.assertTrue( storage.write(MyModel, entries) )
+
+        blocks = list(storage.read_blocks())
+        self.assertTrue( all(len(b) <= 16 for b in blocks) )
+        self.assertEqual( open(tfile.name).read(), ''.join(blocks) )
+
+        loaded = storage.read(MyModel)
+        self.assertDictEqual( entries[0].dict, next(loaded) )
+        self.assertEqual( [e.dict for e in entries[1:]], list(loaded) )
+
     def test_4(self):
         "make sure we're setting extension"
         self.assertEqual( 'json', JSONStorage.extension )
@@ -297,3 +337,417 @@ class TestStorage( unittest.TestCase ):
         self.assertEqual(2, len(data.keys()))
         self.assertEqual(2, len(data['automodel1']))
         self.assertEqual(3, len(data['automodel2']))
+
+    def test_jsonl_1(self):
+        "test json lines reading and writing"
+        tfile = tempfile.NamedTemporaryFile()
+        storage = JSONLinesStorage( tfile.name )
+        self.assertEqual( 'jsonl', JSONLinesStorage.extension )
+
+        for i in range(5):
+            MyModel(int_type=i, str_type='str %d' % i, dt_type=tznow()).save()
+
+        MyModel.objects.store(storage)
+        self.assertEqual( 5, len(open(tfile.name).readlines()) )
+
+        loaded = [json.loads(line) for line in open(tfile.name)]
+        self.assertEqual( [m.dict for m in MyModel.objects.all()], loaded )
+
+        # only the changes are appended
+        size = os.path.getsize(tfile.name)
+
+        m = MyModel.objects.get(1)
+        m.str_type = 'changed'
+        m.save()
+        MyModel.objects.delete( MyModel.objects.get(3) )
+        MyModel(int_type=10).save()
+        MyModel.objects.store(storage)
+
+        with open(tfile.name) as f:
+            f.seek(size)
+            appended = [json.loads(line) for line in f]
+
+        self.assertEqual( [
+            MyModel.objects.get(10).dict,
+            MyModel.objects.get(1).dict,
+            {'__deleted__': {'int_type': 3}} ],
+            appended )
+
+        expected = [m.dict for m in MyModel.objects.all()]
+        self.assertEqual( expected, sorted(storage.read(MyModel), key=lambda d: d['int_type']) )
+
+        # a newly opened file isn't known so it's rewritten
+        storage.filename = tfile.name
+        MyModel.objects.store(storage, force=True)
+        self.assertEqual( 5, len(open(tfile.name).readlines()) )
+        self.assertEqual( expected, list(storage.read(MyModel)) )
+
+    def test_jsonl_2(self):
+        "test json lines compaction"
+        tfile = tempfile.NamedTemporaryFile()
+        storage = JSONLinesStorage( tfile.name )
+        storage.compact_min = 4
+        MyMulti.objects.clear()
+
+        for i in range(4):
+            MyMulti(pk1=i, pk2=i, other='o').save()
+
+        MyMulti.objects.store(storage)
+
+        for other in ['a', 'b']:
+            for m in MyMulti.objects.filter(pk1__lt=2):
+                m.other = other
+                m.save()
+
+            MyMulti.objects.store(storage)
+
+        self.assertEqual( 8, len(open(tfile.name).readlines()) )
+
+        # too much garbage, next write compacts
+        MyMulti.objects.delete( MyMulti.objects.filter(pk1=3)[0] )
+        MyMulti.objects.store(storage)
+
+        lines = [json.loads(line) for line in open(tfile.name)]
+        self.assertEqual( 3, len(lines) )
+        self.assertEqual( ['b', 'b', 'o'], [d['other'] for d in lines] )
+
+        MyMulti.objects.delete( MyMulti.objects.filter(pk1=2)[0] )
+        MyMulti.objects.store(storage)
+        self.assertEqual( {'__deleted__': {'pk1': 2, 'pk2': 2}}, json.loads(open(tfile.name).readlines()[-1]) )
+
+        MyMulti.objects.clear()
+        MyMulti.objects.load(storage)
+        self.assertEqual( [(0, 0), (1, 1)], MyMulti.objects.pks )
+        MyMulti.objects.clear()
+
+    def test_jsonl_3(self):
+        "test a partially written last line"
+        tfile = tempfile.NamedTemporaryFile(mode='w')
+        tfile.write('{"int_type": 1}\n{"int_type": 2}\n{"int_ty')
+        tfile.flush()
+
+        storage = JSONLinesStorage( tfile.name )
+        MyModel.objects.load(storage)
+        self.assertEqual( [1, 2], MyModel.objects.pks )
+
+        MyModel.objects.store(storage, force=True)
+        self.assertEqual( 2, len(open(tfile.name).readlines()) )
+
+        with open(tfile.name, 'w') as f:
+            f.write('{"int_ty\n{"int_type": 2}\n')
+
+        with self.assertRaises(ValueError):
+            list(storage.read(MyModel))
+
+    def test_jsonl_4(self):
+        "test that json lines writes only the manager's changes"
+        tfile = tempfile.NamedTemporaryFile()
+        storage = JSONLinesStorage( tfile.name )
+
+        for i in range(5):
+            MyModel(int_type=i).save()
+
+        MyModel.objects.store(storage)
+        self.assertFalse( storage.write_changes(MyModel, [], [], []) is False )
+
+        MyModel(int_type=1, str_type='changed').save()
+        MyModel(int_type=2).save() # same as before, nothing to write
+        MyModel.objects.delete( MyModel(int_type=4) )
+
+        # storage only sees the changes
+        MyModel.objects.store(storage)
+
+        lines = [json.loads(line) for line in open(tfile.name)]
+        self.assertEqual( 7, len(lines) )
+        self.assertEqual( {'int_type': 1, 'str_type': 'changed', 'dt_type': 'null'}, lines[5] )
+        self.assertEqual( {'__deleted__': {'int_type': 4}}, lines[6] )
+
+        MyModel.objects.load(storage)
+        self.assertEqual( [0, 1, 2, 3], MyModel.objects.pks )
+        self.assertEqual( 'changed', MyModel.objects.get(1).str_type )
+
+        # 3 garbage lines for 4 records
+        storage.compact_min = 0
+        storage.compact_ratio = 0.5
+        self.assertFalse( storage.write_changes(MyModel, [], [], []) )
+
+    def test_atomic(self):
+        "test atomic writes"
+        tdir = tempfile.TemporaryDirectory()
+        filename = os.path.join(tdir.name, 'MyModel.json')
+
+        with open(filename, 'w') as f:
+            f.write('[]')
+        os.chmod(filename, 0o640)
+
+        storage = JSONStorage( filename, atomic=True )
+        inode = os.stat(filename).st_ino
+
+        entries = [MyModel(int_type=1), MyModel(int_type=2)]
+        self.assertTrue( storage.write(MyModel, entries) )
+
+        self.assertNotEqual( inode, os.stat(filename).st_ino )
+        self.assertEqual( 0o640, os.stat(filename).st_mode & 0o777 )
+        self.assertEqual( ['MyModel.json'], os.listdir(tdir.name) )
+        self.assertEqual( 2, len(list(storage.read(MyModel))) )
+
+        # we hold the lock on the new file
+        with self.assertRaises(FileAlreadyLocked):
+            JSONStorage( filename )
+
+        # a failed write leaves the old file
+        class Boom(Exception):
+            pass
+
+        def entries():
+            yield MyModel(int_type=3)
+            raise Boom()
+
+        with self.assertRaises(Boom):
+            storage.write(MyModel, entries())
+
+        self.assertEqual( ['MyModel.json'], os.listdir(tdir.name) )
+        self.assertEqual( [1, 2], [d['int_type'] for d in storage.read(MyModel)] )
+
+        for storage in [CSVStorage, MultiStorage]:
+            filename = os.path.join(tdir.name, 'data.' + storage.extension)
+            open(filename, 'w').close()
+
+            if storage is MultiStorage:
+                storage = storage([MyModel], filename, atomic=True)
+            else:
+                storage = storage(filename, atomic=True)
+
+            self.assertTrue( storage.write(MyModel, [MyModel(int_type=1)]) )
+            self.assertEqual( 1, len(list(storage.read(MyModel))) )
+            storage.filename = None
+
+    def test_fsync(self):
+        "test fsync policies"
+        tfile = tempfile.NamedTemporaryFile()
+        entries = [MyModel(int_type=1)]
+
+        with self.assertRaises(AssertionError):
+            JSONStorage( tfile.name, fsync='sometimes' )
+
+        with mock.patch('os.fsync') as fsync:
+            storage = JSONStorage( tfile.name )
+            storage.write(MyModel, entries)
+            self.assertEqual( 0, fsync.call_count )
+
+            del storage
+            storage = JSONStorage( tfile.name, fsync='on_store' )
+            storage.write(MyModel, entries)
+            storage.write(MyModel, entries)
+            self.assertEqual( 4, fsync.call_count ) # file and directory
+
+            del storage
+            fsync.reset_mock()
+            storage = JSONStorage( tfile.name, fsync='batched', fsync_interval=60 )
+            storage.write(MyModel, entries)
+            storage.write(MyModel, entries)
+            self.assertEqual( 2, fsync.call_count )
+
+            storage.sync()
+            self.assertEqual( 4, fsync.call_count )
+            storage.sync() # nothing to do
+            self.assertEqual( 4, fsync.call_count )
+
+            # deferred fsync happens before the file is closed
+            storage.write(MyModel, entries)
+            storage.filename = None
+            self.assertEqual( 6, fsync.call_count )
+
+            # or at the end of the interval, without another write
+            fsync.reset_mock()
+            storage = JSONStorage( tfile.name, fsync='batched', fsync_interval=0.2 )
+            storage.write(MyModel, entries)
+            storage.write(MyModel, entries)
+            self.assertEqual( 2, fsync.call_count )
+
+            timer = storage._sync_timer
+            self.assertIsNotNone( timer )
+            timer.join(5)
+
+            self.assertEqual( 4, fsync.call_count )
+            self.assertFalse( storage._unsynced )
+            self.assertIsNone( storage._sync_timer )
+
+    def test_binary(self):
+        "test binary reading and writing"
+        tfile = tempfile.NamedTemporaryFile()
+        storage = BinaryStorage( tfile.name )
+        self.assertEqual( 'bin', BinaryStorage.extension )
+
+        now = tznow()
+        eastern = dt.datetime(2017, 3, 4, 5, 6, 7, 89, tzinfo=dt.timezone(dt.timedelta(hours=-5)))
+        entries = [
+            MyModel(int_type=-2**70, str_type='ünïcode', dt_type=now),
+            MyModel(int_type=1, str_type='', dt_type=eastern),
+            MyModel(int_type=2),
+        ]
+        self.assertTrue( storage.write(MyModel, entries) )
+
+        records = list(storage.read(MyModel))
+        expected = [ {name: getattr(e, name) for name in MyModel.Meta.fields} for e in entries ]
+        self.assertEqual( expected, records )
+        self.assertEqual( eastern.utcoffset(), records[1]['dt_type'].utcoffset() )
+        self.assertIsNone( records[2]['str_type'] )
+
+        # smaller than json
+        json_file = tempfile.NamedTemporaryFile()
+        JSONStorage( json_file.name ).write(MyModel, entries)
+        self.assertLess( os.path.getsize(tfile.name), os.path.getsize(json_file.name) )
+
+        # records span blocks
+        storage.block_size = 3
+        self.assertEqual( records, list(storage.read(MyModel)) )
+
+        # foreign keys are stored as the foreign pk
+        del storage
+        storage = BinaryStorage( tfile.name )
+        MyModel(int_type=1).save()
+        storage.write(MyDepModel, [MyDepModel(pk1=1, foreign=MyModel.objects.get(1))])
+        self.assertEqual( [{'pk1': 1, 'foreign': 1}], list(storage.read(MyDepModel)) )
+
+        MyDepModel.objects.load(storage)
+        self.assertEqual( MyModel.objects.get(1), MyDepModel.objects.get(1).foreign )
+
+    def test_binary_schema(self):
+        "test binary schema header"
+        tfile = tempfile.NamedTemporaryFile()
+        storage = BinaryStorage( tfile.name )
+
+        # empty file
+        self.assertEqual( [], list(storage.read(MyModel)) )
+
+        storage.write(MyModel, [MyModel(int_type=1, str_type='one')])
+
+        # fields the model doesn't have are skipped
+        class Slim(Model):
+            int_type = fields.IntField(primary_key=True)
+
+        self.assertEqual( [{'int_type': 1}], list(storage.read(Slim)) )
+
+        # fields the file doesn't have get their defaults
+        storage.write(Slim, [Slim(int_type=2)])
+        MyModel.objects.load(storage)
+        self.assertEqual( [2], MyModel.objects.pks )
+        self.assertIsNone( MyModel.objects.get(2).str_type )
+
+        # not ours
+        del storage
+        with open(tfile.name, 'w') as f:
+            f.write('[]')
+
+        storage = BinaryStorage( tfile.name )
+        with self.assertRaises(BinaryFormatError):
+            list(storage.read(MyModel))
+
+        # truncated
+        with open(tfile.name, 'wb') as f:
+            f.write(b'ALKB\x01\x05\x03int')
+
+        with self.assertRaises(BinaryFormatError):
+            list(storage.read(MyModel))
+
+    def test_mapped(self):
+        "test memory-mapped reading and the pk index"
+        tdir = tempfile.TemporaryDirectory()
+        filename = os.path.join(tdir.name, 'MyMulti.bin')
+
+        with self.assertRaises(AssertionError):
+            MappedStorage( filename, atomic=False )
+
+        storage = MappedStorage( filename )
+        self.assertIsNone( storage.read_lazy(MyMulti) ) # empty file
+
+        entries = [MyMulti(pk1=i, pk2=-i, other='f %d' % i) for i in range(3)]
+        storage.write(MyMulti, entries)
+
+        rows = storage.read_lazy(MyMulti)
+        self.assertEqual( 3, len(rows) )
+        self.assertEqual( [(0, 0), (1, -1), (2, -2)], list(rows) )
+        self.assertIn( (1, -1), rows )
+        self.assertEqual( {'pk1': 1, 'pk2': -1, 'other': 'f 1'}, rows[(1, -1)] )
+
+        # plain binary storage can read it
+        self.assertEqual( [rows[pk] for pk in rows], list(storage.read(MyMulti)) )
+
+        # the old rows still work after a rewrite, the index describes the new file
+        storage.write(MyMulti, entries[:1])
+        self.assertEqual( 'f 2', rows[(2, -2)]['other'] )
+        self.assertEqual( [(0, 0)], list(storage.read_lazy(MyMulti)) )
+
+        # a corrupt index is ignored
+        with open(storage.index_filename, 'wb') as f:
+            f.write(b'ALKI\x01\xff')
+
+        self.assertEqual( [(0, 0)], list(storage.read_lazy(MyMulti)) )
+
+    def test_mapped_write_frees(self):
+        "instances aren't kept while a MappedStorage writes them"
+        tdir = tempfile.TemporaryDirectory()
+        storage = MappedStorage( os.path.join(tdir.name, 'MyMulti.bin') )
+        refs = []
+
+        def entries():
+            for i in range(4):
+                # the writer still holds the previous instance
+                self.assertEqual( [], [r for r in refs[:-1] if r() is not None] )
+
+                e = MyMulti(pk1=i, pk2=-i, other='f %d' % i)
+                refs.append( weakref.ref(e) )
+                yield e
+                del e
+
+        storage.write(MyMulti, entries())
+
+        self.assertEqual( [(i, -i) for i in range(4)], sorted(storage.read_lazy(MyMulti)) )
+
+    def test_multi_cache(self):
+        "test MultiStorage parses its file once and batches writes"
+        tfile = tempfile.NamedTemporaryFile()
+        storage = MultiStorage([AutoModel1, AutoModel2], tfile.name)
+
+        AutoModel1(f1="one").save()
+        AutoModel2(f1="two").save()
+
+        with mock.patch('alkali.storage.multi.json.dump', wraps=json.dump) as dump:
+            with storage.batch():
+                AutoModel1.objects.store(storage)
+                AutoModel2.objects.store(storage)
+                self.assertEqual( 0, dump.call_count )
+
+            self.assertEqual( 1, dump.call_count )
+
+        with open(tfile.name) as f:
+            self.assertEqual( ['automodel1', 'automodel2'], sorted(json.load(f).keys()) )
+
+        with mock.patch('alkali.storage.multi.json.load', wraps=json.load) as load:
+            AutoModel1.objects.load(storage)
+            AutoModel2.objects.load(storage)
+            self.assertEqual( 0, load.call_count ) # what we wrote
+
+            # changed behind our back
+            os.utime(tfile.name, ns=(0, 0))
+            AutoModel1.objects.load(storage)
+            AutoModel2.objects.load(storage)
+            self.assertEqual( 1, load.call_count )
+
+        self.assertEqual( ['one'], [m.f1 for m in AutoModel1.objects.all()] )
+        self.assertEqual( ['two'], [m.f1 for m in AutoModel2.objects.all()] )
+
+        # a failed batch writes nothing and forgets what it cached
+        class Boom(Exception):
+            pass
+
+        size = os.path.getsize(tfile.name)
+
+        with self.assertRaises(Boom):
+            with storage.batch():
+                storage.write(AutoModel1, [])
+                raise Boom()
+
+        self.assertEqual( size, os.path.getsize(tfile.name) )
+        self.assertEqual( 1, len(list(storage.read(AutoModel1))) )
@@ -1,9 +1,15 @@
 import datetime as dt
 from dateutil.tz import tzlocal
 
+# tzlocal() is looked up once, not per timestamp
+_local = tzlocal()
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+MICROSECOND = dt.timedelta(microseconds=1)
+
 def tznow( tzinfo = None ):
     if tzinfo is None:
-        tzinfo = tzlocal()
+        tzinfo = _local
     return dt.datetime.now( tzinfo )
 
 def tzadd( dtstamp, tzinfo=None ):
@@ -12,7 +18,7 @@ def tzadd( dtstamp, tzinfo=None ):
         return dtstamp
 
     if tzinfo is None:
-        tzinfo = tzlocal()
+        tzinfo = _local
 
     return dtstamp.replace( tzinfo=tzinfo )
 
@@ -0,0 +1,211 @@
+"""
+::
+
+    from alkali import Database
+
+    db = Database( models=[MyModel], root_dir='/tmp', wal=True )
+    db.load()
+
+    MyModel(id=1, title='title').save()   # appended to /tmp/alkali.wal
+    MyModel.objects.delete(m)             # so is this
+
+    # after a crash, load() reads the model files and then replays
+    # the saves and deletes that never made it into them
+    db.load()
+
+    db.store()                            # model files are current, log is emptied
+"""
+
+import os
+import json
+import threading
+
+from .storage.file import FileStorage
+from . import signals
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class WriteAheadLog(FileStorage):
+    """
+    a log of every :func:`alkali.manager.Manager.save` and
+    :func:`alkali.manager.Manager.delete` made to a database's models
+    since they were last stored, one line per change
+
+    each change is appended, and by default fsynced, as it happens so a
+    save is durable long before the next full store. owned by
+    :class:`alkali.database.Database`, see its ``wal`` argument.
+
+    ::
+
+        ["s", "mymodel", {"id": 1, "title": "title"}]
+        ["d", "mymodel", {"id": 1}]
+    """
+    extension = 'wal'
+
+    # every append is fsynced, see FileStorage.fsync
+    fsync = 'on_store'
+
+    # truncate() and _repair() rewrite the log, a crash part way through
+    # must leave the old log and not a mix of old and new lines
+    atomic = True
+
+    def __init__(self, filename, models, **kw):
+        """
+        :param filename: the log file
+        :param models: the :class:`alkali.model.Model` classes to log
+        :param kw: see :class:`alkali.storage.FileStorage`
+        """
+        self._models = { model.__name__.lower(): model for model in models }
+        self._paused = set() # models being loaded or replayed
+        self._checked = False # is the last line whole
+        self._lock = threading.Lock() # a background store truncates us
+
+        super().__init__(filename, **kw)
+        assert self.atomic, "{} must write atomically".format(self._name)
+
+        for model in models:
+            signals.post_save.connect(self._on_save, sender=model)
+            signals.post_delete.connect(self._on_delete, sender=model)
+            signals.pre_load.connect(self._on_pre_load, sender=model)
+            signals.post_load.connect(self._on_post_load, sender=model)
+
+    def _on_pre_load(self, sender):
+        self._paused.add(sender)
+
+    def _on_post_load(self, sender):
+        self._paused.discard(sender)
+
+    def _on_save(self, sender, instance):
+        if sender not in self._paused:
+            self._append('s', sender, instance.dict)
+
+    def _on_delete(self, sender, instance):
+        if sender not in self._paused:
+            record = instance.dict
+            pk = { name: record[name] for name in sender.Meta.pk_fields.keys() }
+            self._append('d', sender, pk)
+
+    def _append(self, op, model, record):
+        line = json.dumps([op, model.__name__.lower(), record], separators=(',', ':'))
+
+        with self._lock:
+            if not self._checked:
+                self._repair()
+                self._checked = True
+
+            f = self._fhandle
+            f.seek(0, os.SEEK_END)
+            f.write(line + '\n')
+
+            f.flush()
+            self._fsync(f)
+
+    def read(self, model_class=None):
+        """
+        yield the ``(op, model_class, record)`` changes in the log
+
+        a half written last line is ignored, it's a change whose save
+        never returned
+        """
+        self._fhandle.seek(0)
+
+        for line in self._fhandle:
+            if not line.strip():
+                continue
+
+            try:
+                op, name, record = json.loads(line)
+            except ValueError:
+                if line.endswith('\n'):
+                    raise
+
+                logger.warning( "%s: ignoring partial last line: %s", self.filename, line )
+                return
+
+            model = self._models.get(name)
+
+            if model is None:
+                logger.warning( "%s: ignoring change to unknown model: %s", self.filename, name )
+                continue
+
+            if model_class is None or model is model_class:
+                yield op, model, record
+
+    def _repair(self):
+        """
+        drop a half written last line, we'd append to it otherwise
+        """
+        if not self._is_real_file():
+            return
+
+        with open(self.filename, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+
+            if f.tell() == 0:
+                return
+
+            f.seek(-1, os.SEEK_END)
+
+            if f.read(1) == b'\n':
+                return
+
+        logger.warning( "%s: dropping partial last line", self.filename )
+
+        self._fhandle.seek(0)
+        lines = [line for line in self._fhandle if line.endswith('\n')]
+
+        with self._open_write() as f:
+            f.writelines(lines)
+
+    def write(self, model_class, iterator):
+        raise NotImplementedError("the log is only appended to")
+
+    def replay(self):
+        """
+        apply the changes in the log to the models, they're not logged
+        again
+
+        :rtype: ``int`` number of changes
+        """
+        count = 0
+        paused, self._paused = self._paused, set(self._models.values())
+
+        try:
+            for op, model, record in self.read():
+                if op == 's':
+                    model(**record).save()
+                else:
+                    model.objects.delete( model(**record) )
+
+                count += 1
+        finally:
+            self._paused = paused
+
+        logger.debug( "%s: replayed %d changes", self.filename, count )
+        return count
+
+    def mark(self):
+        """
+        :rtype: ``int`` the end of the log, see :func:`truncate`
+        """
+        with self._lock:
+            return self._fhandle.seek(0, os.SEEK_END)
+
+    def truncate(self, mark=None):
+        """
+        empty the log, its changes have been stored
+
+        :param int mark: only drop the changes before this :func:`mark`,
+            the ones after it were made while storing
+        """
+        with self._lock:
+            rest = ''
+
+            if mark is not None:
+                self._fhandle.seek(mark)
+                rest = self._fhandle.read()
+
+            with self._open_write() as f:
+                f.write(rest)